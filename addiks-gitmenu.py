@@ -11,15 +11,11 @@
 """
 
 from gi.repository import GLib, Gtk, GObject, Gedit, PeasGtk, Gio
-from compare_revision_window import CompareRevisionWindow
-from compare_branch_window import CompareBranchWindow
-from helpers import group, file_get_contents
-import subprocess
-from subprocess import Popen, PIPE
-from _thread import start_new_thread
 import os
 import re
-import time
+
+# The other modules of the plugin are imported on first use (in the handlers), not when gedit loads the plugin
+# or opens a window: most windows never touch git, and the services pull in sqlite, threads and subprocesses.
 
 ACTIONS = [
     ['OpenGitGuiAction',       "Open git GUI",          "", "_on_open_git_gui"],
@@ -27,11 +23,16 @@ ACTIONS = [
     ['OpenGitDirectoryAction', "Open git directory",    "", "_on_open_git_directory"],
     ['AddToIndexAction',       "Stage to index",        "", "_on_add_to_index"],
     ['RemoveFromIndexAction',  "Unstage from index",    "", "_on_remove_from_index"],
+    ['StageOpenDocumentsAction', "Stage all open documents", "", "_on_stage_open_documents"],
+    ['StageHunkAction',        "Stage selection/hunk",  "", "_on_stage_hunk"],
+    ['UnstageHunkAction',      "Unstage hunk",          "", "_on_unstage_hunk"],
     ['PullAction',             "Pull the checkout",     "", "_on_pull"],
     ['CheckoutAction',         "Checkout this file",    "", "_on_checkout"],
     ['CompareRevisionAction',  "Open file history",     "", "_on_compare_revision"],
+    ['BlameAction',            "Blame",                 "", "_on_blame"],
     ['CompareFileAction',      "Compare with file",     "", "_on_compare_file"],
     ['CompareBranchAction',    "Compare with branch",   "", "_on_compare_branch"],
+    ['DebugAction',            "Show git activity",     "", "_on_debug"],
 ]
 
 class AddiksGitMenuApp(GObject.Object, Gedit.AppActivatable):
@@ -41,7 +42,7 @@ class AddiksGitMenuApp(GObject.Object, Gedit.AppActivatable):
         GObject.Object.__init__(self)
 
     def do_activate(self):
-        if "extend_menu" in dir(self): # build menu for gedit 3.12 (one menu per application)
+        if hasattr(self, "extend_menu"): # build menu for gedit 3.12 (one menu per application)
             submenu = Gio.Menu()
             item = Gio.MenuItem.new_submenu(_("Git"), submenu)
 
@@ -55,6 +56,21 @@ class AddiksGitMenuApp(GObject.Object, Gedit.AppActivatable):
                     self.app.set_accels_for_action("win.%s" % actionName, [shortcut])
                 submenu.append_item(item)
 
+    def do_deactivate(self):
+        """ Will be called by gedit, indicates that the plugin should be deactivated. """
+
+        from repository_service import RepositoryService
+        from fetch_scheduler import FetchScheduler
+        from spool import Spool
+
+        FetchScheduler.shutdown_shared()
+
+        # stop monitors and git-processes of repositories still held open (e.g. by history-windows).
+        RepositoryService.shutdown_all()
+
+        # remove temporary files that are still in use by running diff-viewers.
+        Spool.shutdown_shared()
+
 class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
     """
     This class represents the plugin's extension points to a gedit window.
@@ -62,130 +78,287 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
 
     window = GObject.property(type=Gedit.Window)
 
+    __menubarXml = None
+
     def __init__(self):
         GObject.Object.__init__(self)
         self._gitAction = None
-        self.__cachedGitDirByPath = {}
-        self.__cacheTimestamp = 0.0
+        self._updateStateSourceId = None
+        self.__services = {}
+        self.__serviceListeners = {}
+        self.__diffGutters = {}
+        self.__blameGutters = {}
+        self.__fileBrowserDecorator = None
+        self.__fetchScheduler = None
+        self.__keyPressHandler = None
+        self.__discoveryMonitor = None
 
     def do_activate(self):
         """ Will be called by gedit, indicates that the plugin should be activated. """
         self._init_gitmenu()
+        self._tabRemovedHandler = self.window.connect("tab-removed", self._on_tab_removed)
+
+    def do_deactivate(self):
+        """ Will be called by gedit, indicates that the plugin should be deactivated. """
+
+        self.window.disconnect(self._tabRemovedHandler)
+
+        if self._updateStateSourceId != None:
+            GLib.source_remove(self._updateStateSourceId)
+            self._updateStateSourceId = None
+
+        if self.__fileBrowserDecorator != None:
+            self.__fileBrowserDecorator.detach()
+            self.__fileBrowserDecorator = None
+
+        if self.__keyPressHandler != None:
+            self.window.disconnect(self.__keyPressHandler)
+            self.__keyPressHandler = None
+        self.__fetchScheduler = None
+
+        for view, (gitpath, diffGutter) in self.__diffGutters.items():
+            diffGutter.detach()
+        self.__diffGutters = {}
+
+        for view, (gitpath, blameGutter) in self.__blameGutters.items():
+            blameGutter.detach()
+        self.__blameGutters = {}
+
+        for gitpath, service in self.__services.items():
+            service.remove_listener(self.__serviceListeners[gitpath])
+            service.release(gitpath)
+        self.__services = {}
+        self.__serviceListeners = {}
+
+        if self.__discoveryMonitor != None:
+            from repository_monitor import DiscoveryMonitor
+            DiscoveryMonitor.release()
+            self.__discoveryMonitor = None
 
     def _init_gitmenu(self):
         """ Will build the git-menu in the gedit-menu. """
 
-        plugin_path = os.path.dirname(__file__)
-
-        self._actions = Gtk.ActionGroup("AddiksGitMenuActions")
         for actionName, title, shortcut, callbackName in ACTIONS:
             action = Gio.SimpleAction(name=actionName)
-            callback = None
-            if callbackName != None:
-                callback = getattr(self, callbackName)
-                action.connect('activate', callback)
+            action.connect('activate', getattr(self, callbackName))
             self.window.add_action(action)
-            self.window.lookup_action(actionName).set_enabled(True)
 
-            self._actions.add_actions([(actionName, Gtk.STOCK_INFO, title, shortcut, "", callback),])
+        if hasattr(self.window, "get_ui_manager"): # build menu for gedit 3.10 (global menu per window)
+            self._actions = Gtk.ActionGroup("AddiksGitMenuActions")
+            for actionName, title, shortcut, callbackName in ACTIONS:
+                self._actions.add_actions([(actionName, Gtk.STOCK_INFO, title, shortcut, "", getattr(self, callbackName)),])
 
-        if "get_ui_manager" in dir(self.window):# build menu for gedit 3.10 (global menu per window)
             manager = self.window.get_ui_manager()
 
             self._gitAction = self._actions.get_action("GitAction")
 
             manager.insert_action_group(self._actions)
-            self._ui_merge_id = manager.add_ui_from_string(file_get_contents(plugin_path + "/menubar.xml"))
+            self._ui_merge_id = manager.add_ui_from_string(self._get_menubar_xml())
             manager.ensure_update()
 
-    def do_update_state(self):
-        """ Called by gedit. Indicates that the state of the document changed. """
-
-        start_new_thread(self.__do_update_state, ())
+    @classmethod
+    def _get_menubar_xml(cls):
+        """ Returns the ui-definition of the menu; read from disk once for all windows. """
 
-    def __do_update_state(self):
-
-        if self._gitAction != None:
-            if self._check_in_git(False):
-                self._gitAction.set_visible(True)
-            else:
-                self._gitAction.set_visible(False)
+        if cls.__menubarXml == None:
+            from helpers import file_get_contents
+            cls.__menubarXml = file_get_contents(os.path.dirname(__file__) + "/menubar.xml")
+        return cls.__menubarXml
 
-        document = self.window.get_active_document()
-        path = self._get_git_directory()
-        if self._check_in_file(False) and self._check_in_git(False):
+    def do_update_state(self):
+        """
+        Called by gedit. Indicates that the state of the document changed.
+        The work-tree of the document is looked up once gedit is idle, so opening windows and switching tabs
+        does not wait for it (and a burst of updates is handled once).
+        """
 
-            filepath = document.get_location().get_path()
-            try:
-                # gets the current state of a file (untracked; modified; staged; modified & staged)
-                sp = subprocess.Popen(
-                    ['git', '--git-dir='+path+'/.git', '--work-tree='+path, 'status', '--porcelain', filepath],
-                    stdin=PIPE, stdout=PIPE, stderr=PIPE
-                )
-                sp.wait()
-                output, err = sp.communicate()
+        if self._updateStateSourceId == None:
+            self._updateStateSourceId = GLib.idle_add(self.__update_state)
 
-                # depatch file state
-                if output[:2] == b'??':
-                    afterTag = " [?]" # untracked
+    def __update_state(self):
+        self._updateStateSourceId = None
 
-                elif output[:2] == b'M ':
-                    afterTag = " [S]" # staged
+        self.__attach_file_browser_decorator()
+        self.__start_fetch_scheduler()
 
-                elif output[:2] == b' M':
-                    afterTag = " [M]" # modified
+        gitpath = None
+        if self._check_in_file(False):
+            gitpath = self._get_git_directory()
 
-                elif output[:2] == b'MM':
-                    afterTag = " [MS]" # modified & staged
+        if self._gitAction != None:
+            self._gitAction.set_visible(gitpath != None)
+
+        if gitpath != None:
+            filepath = self.window.get_active_document().get_location().get_path()
+            service = self._get_repository_service(gitpath)
+            service.monitor.watch_directory(os.path.dirname(filepath))
+            self._update_diff_gutter(gitpath, filepath)
+
+            from job_scheduler import JobScheduler, PRIORITY_HIGH
+
+            # only the latest state of the active document matters, older pending updates get dropped.
+            JobScheduler.get_shared().submit(
+                ("update-state", id(self), filepath),
+                self.__read_file_status,
+                (service.statusCache, filepath),
+                priority=PRIORITY_HIGH,
+                group=("update-state", id(self)),
+                onDone=self.__apply_file_status
+            )
+
+        return False
+
+    def __attach_file_browser_decorator(self):
+        """ Starts the git-emblems in the file-browser once it is there (it might get activated after this plugin). """
+
+        if self.__fileBrowserDecorator == None:
+            if not self.window.get_message_bus().is_registered("/plugins/filebrowser", "inserted"):
+                return
+            from file_browser_decorator import FileBrowserDecorator
+            self.__fileBrowserDecorator = FileBrowserDecorator(
+                self.window, self._get_repository_service, self._get_repository_index)
+        self.__fileBrowserDecorator.attach()
+
+    def __start_fetch_scheduler(self):
+        """ Fetches remotes in the background if a 'fetchrc' enables it; typing postpones the fetches. """
+
+        if self.__fetchScheduler == None:
+            interval = self._get_fetch_interval()
+            if interval == None:
+                return
+            from fetch_scheduler import FetchScheduler
+            self.__fetchScheduler = FetchScheduler.get_shared(interval)
+            self.__keyPressHandler = self.window.connect("key-press-event", self._on_key_pressed)
+        self.__fetchScheduler.note_activity()
+
+    def _on_key_pressed(self, window, event, data=None):
+        self.__fetchScheduler.note_activity()
+        return False
+
+    def __read_file_status(self, statusCache, filepath):
+        """ Gets the current state of a file (untracked; modified; staged; modified & staged). Runs in a worker. """
+
+        return (filepath, statusCache.get_status(filepath))
+
+    def __apply_file_status(self, result):
+        """ Puts the state of the active file as tag into the window-title (runs in the main-thread). """
+
+        filepath, status = result
+
+        # the active document might have changed while the state was read.
+        document = self.window.get_active_document()
+        if document == None or document.get_location() == None or document.get_location().get_path() != filepath:
+            return
 
-                else:
-                    afterTag = ""
+        # depatch file state
+        if status == '??':
+            afterTag = " [?]" # untracked
 
-                # get current window title
-                title = self.window.get_title()
+        elif status == 'M ':
+            afterTag = " [S]" # staged
 
-                if type(title) == str:
-                    newTitle = title
+        elif status == ' M':
+            afterTag = " [M]" # modified
 
-                    # remove old tag from current title
-                    tagPattern = " \[[SM\?]S?\]"
-                    if re.match(".*"+tagPattern, title):
-                        newTitle = re.sub(tagPattern, "", title)
-                    newTitle = afterTag + newTitle
+        elif status == 'MM':
+            afterTag = " [MS]" # modified & staged
 
-                    # set new title if changed
-                    if(title != newTitle):
-                        GLib.idle_add(self.window.set_title, newTitle)
-            except OSError as error:
-                print(error)
+        else:
+            afterTag = ""
+
+        # get current window title
+        title = self.window.get_title()
+
+        if type(title) == str:
+            newTitle = title
+
+            # remove old tag from current title
+            tagPattern = " \[[SM\?]S?\]"
+            if re.match(".*"+tagPattern, title):
+                newTitle = re.sub(tagPattern, "", title)
+            newTitle = afterTag + newTitle
+
+            # set new title if changed
+            if(title != newTitle):
+                self.window.set_title(newTitle)
+
+    def _get_repository_service(self, gitpath):
+        """ Returns the service of a work-dir shared by all windows, attaching this window to it on first use. """
+
+        service = self.__services.get(gitpath)
+        if service == None:
+            from repository_service import RepositoryService
+            service = RepositoryService.acquire(gitpath)
+            listener = lambda: self._on_repository_changed(gitpath)
+            service.add_listener(listener)
+            self.__services[gitpath] = service
+            self.__serviceListeners[gitpath] = listener
+        return service
+
+    def _on_repository_changed(self, gitpath):
+        """ Called (debounced) when index, HEAD or the work-tree of a repository changed. """
+
+        for view, (viewGitpath, diffGutter) in self.__diffGutters.items():
+            if viewGitpath == gitpath:
+                diffGutter.refresh_base()
+        for view, (viewGitpath, blameGutter) in self.__blameGutters.items():
+            if viewGitpath == gitpath:
+                blameGutter.reload()
+        if self.__fileBrowserDecorator != None:
+            self.__fileBrowserDecorator.refresh(gitpath)
+        self.do_update_state()
+
+    def _update_diff_gutter(self, gitpath, filepath):
+        """ Shows the change-marks (against HEAD) in the gutter of the active view. """
+
+        view = self.window.get_active_view()
+        if view != None and view not in self.__diffGutters:
+            from diff_gutter import DiffGutter
+            diffGutter = DiffGutter(view, self._get_repository_service(gitpath).blobServer, filepath[len(gitpath)+1:])
+            self.__diffGutters[view] = (gitpath, diffGutter)
+            diffGutter.refresh_base()
+
+    def _on_tab_removed(self, window, tab, data=None):
+        """ Will be called when a tab gets closed; its change-marks are not needed any more. """
+
+        view = tab.get_view()
+        if view in self.__diffGutters:
+            gitpath, diffGutter = self.__diffGutters.pop(view)
+            diffGutter.detach()
+        if view in self.__blameGutters:
+            gitpath, blameGutter = self.__blameGutters.pop(view)
+            blameGutter.detach()
+
+    def _invalidate_status(self, gitpath):
+        """ Drops the cached file-states of a work-dir after the plugin changed them itself. """
+
+        if gitpath in self.__services:
+            self.__services[gitpath].invalidate()
+        else:
+            self.do_update_state()
 
     def _get_git_directory(self):
         """ Gets the absolute path to the work-dir. """
 
         result = None
 
-        # clear cache at most every 15 seconds
-        if time.time() - 15 > self.__cacheTimestamp:
-            self.__cachedGitDirByPath = {}
-            self.__cacheTimestamp = time.time()
-
         document = self.window.get_active_document()
         if document != None and document.get_location() != None:
             filepath = document.get_location().get_path()
-            filepath = os.path.abspath(filepath)
-            if filepath in self.__cachedGitDirByPath:
-                result = self.__cachedGitDirByPath[filepath]
-            else:
-                currentPath = filepath
-                while currentPath != "/":
-                    currentPath = os.path.dirname(currentPath)
-                    if os.path.exists(currentPath + "/.git"):
-                        result = currentPath
-                        break
-                self.__cachedGitDirByPath[filepath] = result
+            result = self._get_repository_index().get_work_tree(filepath)
 
         return result
 
+    def _get_repository_index(self):
+        """ Returns the shared work-tree discovery-index, watched by the discovery-monitor all windows share. """
+
+        from repository_index import RepositoryIndex
+        repositoryIndex = RepositoryIndex.get_shared()
+        if self.__discoveryMonitor == None:
+            from repository_monitor import DiscoveryMonitor
+            self.__discoveryMonitor = DiscoveryMonitor.acquire(repositoryIndex)
+        return repositoryIndex
+
     def _check_in_file(self, doAlert=True):
         """
         Checks if the current document is in a file on disk.
@@ -220,16 +393,47 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
         else:
             return True
 
+    def _check_saved(self, doAlert=True):
+        """
+        Checks if the current document has no unsaved changes.
+        If it has (and doAlert is True), then an alert-dialog will be displayed.
+        """
+
+        document = self.window.get_active_document()
+        if document.get_modified():
+            if doAlert:
+                dialog = Gtk.MessageDialog(self.window, 0, Gtk.MessageType.ERROR, Gtk.ButtonsType.NONE, "Unsaved changes!")
+                dialog.format_secondary_text("Save the document before staging or unstaging parts of it.")
+                dialog.run()
+            return False
+        else:
+            return True
+
     def _get_diff_viewer(self):
         diff_viewer = 'meld %s %s'
 
         plugin_path = os.path.dirname(__file__)
         diffrc_path = plugin_path + "/diffrc"
         if os.path.exists(diffrc_path):
+            from helpers import file_get_contents
             diff_viewer = file_get_contents(diffrc_path)
 
         return diff_viewer
 
+    def _get_fetch_interval(self):
+        """ Returns the seconds between background-fetches (from the file 'fetchrc'), or None if disabled. """
+
+        fetchrc_path = os.path.dirname(__file__) + "/fetchrc"
+        if not os.path.exists(fetchrc_path):
+            return None
+        from helpers import file_get_contents
+        try:
+            interval = int(file_get_contents(fetchrc_path).strip())
+        except ValueError as error:
+            print(error)
+            return None
+        return interval if interval > 0 else None
+
     ### MENU EVENTS
 
     def _on_open_gitg(self, action, data=None):
@@ -239,6 +443,7 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
             gitpath = self._get_git_directory()
             try:
                 # adds the file to git-index ( = staging)
+                import subprocess
                 sp = subprocess.Popen(['gitg', gitpath])
                 #sp.wait()
             except OSError as error:
@@ -249,12 +454,25 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
 
         if self._check_in_file():
             gitpath = self._get_git_directory()
+            from git_runner import GitTrace
+            from helpers import git_command
+            argv = git_command(gitpath, ['gui'])
+            call = GitTrace.get_shared().start_call(argv)
             try:
-                # adds the file to git-index ( = staging)
-                sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'gui'])
-                #sp.wait()
-            except OSError as error:
+                pid, stdin, stdout, stderr = GLib.spawn_async(argv,
+                    flags=GLib.SpawnFlags.SEARCH_PATH | GLib.SpawnFlags.DO_NOT_REAP_CHILD)
+            except GLib.Error as error:
+                GitTrace.get_shared().finish_call(call, None)
                 print(error)
+                return
+
+            # the git-gui runs as long as the user keeps it open, its call is finished when it exits.
+            GLib.child_watch_add(GLib.PRIORITY_DEFAULT, pid, self._on_git_gui_exited, call)
+
+    def _on_git_gui_exited(self, pid, status, call):
+        from git_runner import GitTrace
+        GLib.spawn_close_pid(pid)
+        GitTrace.get_shared().finish_call(call, os.WEXITSTATUS(status) if os.WIFEXITED(status) else None)
 
     def _on_compare_file(self, action, data=None):
         """ Event called when menu-item 'Compare with file' gets triggered. """
@@ -276,10 +494,17 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
 
             if response == Gtk.ResponseType.OK:
                 compareFilepath = chooser.get_filename()
-                try:
-                    sp = subprocess.Popen(['meld', filepath, compareFilepath])
-                except OSError as error:
-                    print(error)
+                from helpers import BUILTIN_DIFF_VIEWER
+                if self._get_diff_viewer().strip() == BUILTIN_DIFF_VIEWER:
+                    from diff_window import DiffWindow, read_file
+                    DiffWindow(filepath, compareFilepath, filepath,
+                        lambda: (read_file(filepath), read_file(compareFilepath)))
+                else:
+                    try:
+                        import subprocess
+                        sp = subprocess.Popen(['meld', filepath, compareFilepath])
+                    except OSError as error:
+                        print(error)
 
             chooser.destroy()
 
@@ -290,6 +515,7 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
             document = self.window.get_active_document()
             gitpath = self._get_git_directory()
             filepath = document.get_location().get_path()
+            from compare_branch_window import CompareBranchWindow
             compare = CompareBranchWindow(gitpath, filepath)
             compare.set_diff_viewer(self._get_diff_viewer())
 
@@ -300,14 +526,36 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
             document = self.window.get_active_document()
             gitpath = self._get_git_directory()
             filepath = document.get_location().get_path()
+            from compare_revision_window import CompareRevisionWindow
             compare = CompareRevisionWindow(gitpath, filepath)
             compare.set_diff_viewer(self._get_diff_viewer())
 
+    def _on_blame(self, action, data=None):
+        """ Event called when menu-item 'Blame' gets triggered. Toggles the blame-annotations of the active view. """
+
+        if self._check_in_file() and self._check_in_git():
+            view = self.window.get_active_view()
+            if view in self.__blameGutters:
+                gitpath, blameGutter = self.__blameGutters.pop(view)
+                blameGutter.detach()
+            else:
+                gitpath = self._get_git_directory()
+                filepath = self.window.get_active_document().get_location().get_path()
+                from blame_gutter import BlameGutter
+                self.__blameGutters[view] = (gitpath, BlameGutter(view, self._get_repository_service(gitpath), filepath))
+
+    def _on_debug(self, action, data=None):
+        """ Event called when menu-item 'Show git activity' gets triggered. """
+
+        from debug_window import DebugWindow
+        DebugWindow()
+
     def _on_open_git_directory(self, action, data=None):
         """ Event called when menu-item 'Open git directory' gets triggered. """
 
         filepath = self._get_git_directory()
         try:
+            import subprocess
             subprocess.Popen(['xdg-open', filepath])
         except OSError as error:
             print(error)
@@ -319,13 +567,9 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
             document = self.window.get_active_document()
             gitpath = self._get_git_directory()
             filepath = document.get_location().get_path()
-            try:
-                # adds the file to git-index ( = staging)
-                sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'add', filepath])
-                sp.wait()
-            except OSError as error:
-                print(error)
-            self.do_update_state()
+            # adds the file to git-index ( = staging)
+            from staging import stage_paths
+            self._run_index_job(gitpath, stage_paths, (gitpath, [filepath]))
 
     def _on_remove_from_index(self, action, data=None):
         """ Event called when menu-item 'Remove from index / unstage' gets triggered. """
@@ -334,13 +578,73 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
             document = self.window.get_active_document()
             gitpath = self._get_git_directory()
             filepath = document.get_location().get_path()
-            try:
-                # remove the file from git-index ( = unstage )
-                sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'reset', 'HEAD', filepath])
-                sp.wait()
-            except OSError as error:
-                print(error)
-            self.do_update_state()
+            # remove the file from git-index ( = unstage )
+            from staging import unstage_paths
+            self._run_index_job(gitpath, unstage_paths, (gitpath, [filepath]))
+
+    def _on_stage_open_documents(self, action, data=None):
+        """ Event called when menu-item 'Stage all open documents' gets triggered. One git-call per work-dir. """
+
+        repositoryIndex = self._get_repository_index()
+        filepathsByGitpath = {}
+        for document in self.window.get_documents():
+            location = document.get_location()
+            if location != None and location.get_path() != None:
+                filepath = location.get_path()
+                gitpath = repositoryIndex.get_work_tree(filepath)
+                if gitpath != None:
+                    filepathsByGitpath.setdefault(gitpath, []).append(filepath)
+
+        from staging import stage_paths
+        for gitpath, filepaths in filepathsByGitpath.items():
+            self._run_index_job(gitpath, stage_paths, (gitpath, filepaths))
+
+    def _on_stage_hunk(self, action, data=None):
+        """ Event called when menu-item 'Stage selection/hunk' gets triggered. """
+
+        if self._check_in_file() and self._check_in_git() and self._check_saved():
+            gitpath = self._get_git_directory()
+            filepath = self.window.get_active_document().get_location().get_path()
+            startLine, endLine = self._get_selected_lines()
+            from staging import stage_hunks
+            self._run_index_job(gitpath, stage_hunks, (gitpath, filepath, startLine, endLine))
+
+    def _on_unstage_hunk(self, action, data=None):
+        """ Event called when menu-item 'Unstage hunk' gets triggered. """
+
+        if self._check_in_file() and self._check_in_git() and self._check_saved():
+            gitpath = self._get_git_directory()
+            filepath = self.window.get_active_document().get_location().get_path()
+            startLine, endLine = self._get_selected_lines()
+            from staging import unstage_hunks
+            self._run_index_job(gitpath, unstage_hunks, (gitpath, filepath, startLine, endLine))
+
+    def _run_index_job(self, gitpath, function, arguments):
+        """ Runs an operation on the index in a worker; the file-states get refreshed once it is done (or failed). """
+
+        from job_scheduler import JobScheduler, PRIORITY_HIGH
+        JobScheduler.get_shared().submit(
+            ("index", gitpath, function.__name__, repr(arguments)),
+            self._get_repository_service(gitpath).run_write,
+            (function, arguments),
+            priority=PRIORITY_HIGH,
+            onDone=lambda result: self._invalidate_status(gitpath),
+            onError=lambda error: self._invalidate_status(gitpath)
+        )
+
+    def _get_selected_lines(self):
+        """ Returns the (0-based, inclusive) range of selected lines, or the line of the cursor. """
+
+        document = self.window.get_active_document()
+        bounds = document.get_selection_bounds()
+        if len(bounds) > 0:
+            start, end = bounds
+            endLine = end.get_line()
+            if end.starts_line() and endLine > start.get_line():
+                endLine -= 1 # selection ends at the start of a line, that line is not part of it
+            return (start.get_line(), endLine)
+        line = document.get_iter_at_mark(document.get_insert()).get_line()
+        return (line, line)
 
     def _on_pull(self, action, data=None):
         """
@@ -350,32 +654,22 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
 
         if self._check_in_git():
             gitpath = self._get_git_directory()
-            try:
-                # pulls the work-dir from git remote.
-                sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'pull'],
-                    stdin=PIPE, stdout=PIPE, stderr=PIPE
-                )
-                sp.wait()
-                output, err = sp.communicate()
-                output = output.decode()
-
-                # reaload gedit document
-                encoding = Gedit.Encoding.get_utf8()
-                document = self.window.get_active_document()
-                document.load(document.get_location(), encoding, 1, 1, False)
+            from pull_window import PullWindow
+            PullWindow(gitpath, self._on_pull_finished)
 
-                messageWindow = Gtk.Window()
-                textView = Gtk.TextView()
-                textBuff = textView.get_buffer()
-                textBuff.set_text(output)
-                label = Gtk.Label()
-                label.set_text(output)
-                messageWindow.add(label)
-                messageWindow.show_all()
+    def _on_pull_finished(self, gitpath, changedPaths):
+        """ Reloads the open documents (in every window) whose files were changed by a pull. """
 
-            except OSError as error:
-                print(error)
-            self.do_update_state()
+        encoding = Gedit.Encoding.get_utf8()
+        for document in Gedit.App.get_default().get_documents():
+            location = document.get_location()
+            if location == None or location.get_path() not in changedPaths:
+                continue
+            if document.get_modified():
+                continue # do not throw away unsaved changes, gedit will tell the file changed on disk
+            document.load(location, encoding, 1, 1, False)
+
+        self._invalidate_status(gitpath)
 
     def _on_checkout(self, action, data=None):
         """
@@ -390,10 +684,10 @@ class AddiksGitMenuWindow(GObject.Object, Gedit.WindowActivatable):
             filepath = document.get_location().get_path()
             try:
                 # checkout the file into it's unchanged state
-                sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'checkout', filepath])
-                sp.wait()
+                from git_runner import run_git
+                self._get_repository_service(gitpath).run_write(run_git, (gitpath, ['checkout', filepath]))
                 encoding = Gedit.Encoding.get_utf8()
                 document.load(document.get_location(), encoding, 1, 1, False)
             except OSError as error:
                 print(error)
-            self.do_update_state()
+            self._invalidate_status(gitpath)
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+
+Offline benchmark of the GTK-independent core of the menu-actions on synthetic repositories.
+Run it without gedit:
+
+    python3 benchmark.py --commits 2000 --branches 100 --pack-layout many --output result.json
+
+and compare the JSON-results of two versions of the plugin.
+"""
+
+from threading import Event
+import subprocess
+from subprocess import PIPE
+import argparse
+import platform
+import tracemalloc
+import tempfile
+import shutil
+import random
+import json
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from status_cache import StatusCache
+from history_loader import HistoryLoader
+from history_cache import HistoryCache
+from history_store import HistoryStore, HistoryIndex
+from branch_matrix import read_refs, read_branch_matrix
+from blob_server import BlobServer
+from blob_cache import BlobCache
+from diff_engine import diff_side_by_side, split_text_lines
+from repository_index import RepositoryIndex
+
+PACK_LAYOUTS = ["single", "many", "loose"]
+
+class SyntheticRepository:
+    """
+    Generates a git repository with 'git fast-import': a history of commits that each change the target-file
+    (renamed 'renames' times along the way) and one other file, plus branches forking off at random commits.
+    """
+
+    def __init__(self, directory, commits=1000, branches=20, files=100, fileLines=1000,
+                 renames=3, packLayout="single", seed=1):
+        self.directory = directory
+        self.commits = commits
+        self.branches = branches
+        self.files = files
+        self.fileLines = fileLines
+        self.renames = renames
+        self.packLayout = packLayout
+        self.random = random.Random(seed)
+        self.targetPaths = [] # path of the target-file in every commit of the main history
+        self.commitIds = []
+
+    def create(self):
+        os.makedirs(self.directory)
+        self.__git(['init', '-q'])
+        self.__git(['config', 'user.name', 'Benchmark'])
+        self.__git(['config', 'user.email', 'benchmark@localhost'])
+
+        # 'many' keeps one pack per import-batch, the other layouts are rewritten afterwards.
+        batchCount = 8 if self.packLayout == "many" else 1
+        marksPath = os.path.join(self.directory, ".git", "benchmark-marks")
+        commitsPerBatch = max(1, self.commits // batchCount)
+        state = self.__initial_state()
+        for batchStart in range(0, self.commits, commitsPerBatch):
+            stream = self.__history_stream(state, batchStart, min(self.commits, batchStart + commitsPerBatch))
+            if batchStart + commitsPerBatch >= self.commits:
+                stream += self.__branches_stream(state)
+            self.__git(['fast-import', '--quiet', '--export-marks=' + marksPath,
+                        '--import-marks-if-exists=' + marksPath], stream)
+
+        with open(marksPath) as f:
+            marks = dict(line.split() for line in f)
+        self.commitIds = [marks[":%d" % (index + 1)] for index in range(self.commits)]
+
+        if self.packLayout == "single":
+            self.__git(['repack', '-a', '-d', '-q'])
+
+        elif self.packLayout == "loose":
+            packDirectory = os.path.join(self.directory, ".git", "objects", "pack")
+            for packName in os.listdir(packDirectory):
+                if packName.endswith(".pack"):
+                    packPath = os.path.join(self.directory, ".git", packName)
+                    os.rename(os.path.join(packDirectory, packName), packPath)
+                    os.remove(os.path.join(packDirectory, packName[:-5] + ".idx"))
+                    with open(packPath, "rb") as f:
+                        self.__git(['unpack-objects', '-q'], f.read())
+                    os.remove(packPath)
+
+        self.__git(['checkout', '-q', '-f', 'master'])
+
+        # a modified and an untracked file, so the status has something to report.
+        with open(self.get_target_path(), "a") as f:
+            f.write("modified in the work-tree\n")
+        with open(os.path.join(self.directory, "untracked.txt"), "w") as f:
+            f.write("untracked\n")
+
+    def get_target_path(self):
+        return os.path.join(self.directory, self.targetPaths[-1])
+
+    def __initial_state(self):
+        return {
+            'files': dict(
+                ("src/dir%d/file%d.txt" % (index % 10, index), self.__lines("file%d" % index))
+                for index in range(self.files)
+            ),
+            'target': "src/dir0/sub/deeper/target0.txt",
+            'targetLines': self.__lines("target"),
+            'time': 1000000000,
+        }
+
+    def __lines(self, prefix):
+        return ["%s line %d %08x\n" % (prefix, line, self.random.getrandbits(32)) for line in range(self.fileLines)]
+
+    def __history_stream(self, state, start, end):
+        stream = []
+        renameEvery = self.commits // (self.renames + 1) if self.renames > 0 else 0
+
+        for index in range(start, end):
+            commands = []
+            if index == 0:
+                for path, lines in state['files'].items():
+                    commands.append(self.__modify(path, lines))
+
+            else:
+                if renameEvery > 0 and index % renameEvery == 0 and index // renameEvery <= self.renames:
+                    newPath = "src/dir%d/sub/deeper/target%d.txt" % (index // renameEvery, index // renameEvery)
+                    commands.append(b"R " + state['target'].encode() + b" " + newPath.encode() + b"\n")
+                    state['target'] = newPath
+
+                path = self.random.choice(list(state['files'].keys()))
+                self.__change_lines(state['files'][path], 1)
+                commands.append(self.__modify(path, state['files'][path]))
+
+            self.__change_lines(state['targetLines'], 3)
+            commands.append(self.__modify(state['target'], state['targetLines']))
+            self.targetPaths.append(state['target'])
+
+            state['time'] += 3600
+            stream.append(self.__commit("refs/heads/master", index + 1, index if index > 0 else None,
+                state['time'], "commit %d" % index, commands))
+
+        return b"".join(stream)
+
+    def __branches_stream(self, state):
+        stream = []
+        for branch in range(self.branches):
+            base = self.random.randrange(self.commits)
+            lines = list(state['targetLines'])
+            self.__change_lines(lines, 2)
+            stream.append(self.__commit("refs/heads/branch-%d" % branch, self.commits + branch + 1, base + 1,
+                state['time'] + branch, "branch %d" % branch, [self.__modify(self.targetPaths[base], lines)]))
+        return b"".join(stream)
+
+    def __change_lines(self, lines, count):
+        for change in range(count):
+            line = self.random.randrange(len(lines))
+            lines[line] = "changed %08x\n" % self.random.getrandbits(32)
+
+    def __modify(self, path, lines):
+        data = "".join(lines).encode()
+        return b"M 100644 inline " + path.encode() + b"\ndata %d\n" % len(data) + data + b"\n"
+
+    def __commit(self, ref, mark, parentMark, timestamp, message, commands):
+        message = message.encode()
+        header = b"commit " + ref.encode() + b"\nmark :%d\n" % mark
+        header += b"committer Benchmark <benchmark@localhost> %d +0000\n" % timestamp
+        header += b"data %d\n" % len(message) + message + b"\n"
+        if parentMark != None:
+            header += b"from :%d\n" % parentMark
+        return header + b"".join(commands) + b"\n"
+
+    def __git(self, arguments, inputData=None):
+        sp = subprocess.Popen(['git'] + arguments, cwd=self.directory,
+            stdin=PIPE if inputData != None else subprocess.DEVNULL, stdout=PIPE, stderr=PIPE)
+        output, err = sp.communicate(inputData)
+        if sp.returncode != 0:
+            raise OSError("git %s failed: %s" % (arguments[0], err.decode(errors="replace")))
+        return output
+
+def percentiles(samples):
+    """ Returns count, mean and nearest-rank percentiles (in milliseconds) of a list of durations in seconds. """
+
+    ordered = sorted(samples)
+    def rank(percent):
+        return ordered[max(0, min(len(ordered) - 1, int(round(percent / 100.0 * len(ordered) + 0.5)) - 1))] * 1000.0
+    return {
+        'count': len(ordered),
+        'mean':  sum(ordered) / len(ordered) * 1000.0,
+        'min':   ordered[0] * 1000.0,
+        'p50':   rank(50),
+        'p90':   rank(90),
+        'p95':   rank(95),
+        'p99':   rank(99),
+        'max':   ordered[-1] * 1000.0,
+    }
+
+def measure(function, repeat):
+    samples = []
+    for iteration in range(repeat):
+        startedAt = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - startedAt)
+    return percentiles(samples)
+
+class Benchmark:
+    """ Times the core of every menu-action against one synthetic repository. """
+
+    def __init__(self, repository, repeat, cacheDirectory):
+        self._repository = repository
+        self._gitpath = repository.directory
+        self._filepath = repository.get_target_path()
+        self._repeat = repeat
+        self._cacheDirectory = cacheDirectory
+
+    def run(self):
+        results = {}
+        repeat = self._repeat
+        results['status'] = measure(self.status, repeat)
+        results['discovery'] = measure(self.discovery, repeat)
+
+        firstPageSamples = []
+        results['history'] = measure(lambda: self.history(None, firstPageSamples), repeat)
+        results['history-first-page'] = percentiles(firstPageSamples)
+
+        historyCache = HistoryCache(os.path.join(self._cacheDirectory, "history.sqlite"))
+        self.history(historyCache, []) # fills the cache
+        results['history-cached'] = measure(lambda: self.history(historyCache, []), repeat)
+
+        entries = self.load_history()
+        results['history-store-build'] = measure(lambda: HistoryStore().append(entries), repeat)
+        results['history-store-memory'] = self.history_store_memory(entries)
+        results['history-filter'] = self.history_filter(entries)
+
+        results['branches'] = measure(self.branches, repeat)
+
+        blobServer = BlobServer(self._gitpath)
+        revisions = list(zip(self._repository.commitIds, self._repository.targetPaths))
+        random.Random(2).shuffle(revisions)
+        results['blob-tree-walk'] = measure(lambda: self.blob_tree_walk(blobServer, revisions), repeat)
+        blobShas = [blobServer.get_blob_id(commitId, path) for commitId, path in revisions[:20]]
+        results['blob-fetch'] = measure(lambda: self.blob_fetch(blobServer, blobShas, True), repeat)
+        results['blob-fetch-cached'] = measure(lambda: self.blob_fetch(blobServer, blobShas, False), repeat)
+        results['diff-window'] = measure(lambda: self.diff_window(blobServer, revisions), repeat)
+        blobServer.close()
+
+        return results
+
+    def status(self):
+        """ Like the status-tag of the window-title: one 'git status' for a fresh cache. """
+
+        StatusCache(self._gitpath).get_status(self._filepath)
+
+    def discovery(self):
+        """ Finding the work-tree of a deeply nested file with a fresh index. """
+
+        RepositoryIndex(environ={}).get_work_tree(self._filepath)
+
+    def history(self, historyCache, firstPageSamples):
+        """ Loading the whole file-history (page by page, as if the user kept scrolling). """
+
+        startedAt = time.perf_counter()
+        finished = Event()
+        loader = None
+        def deliver(entries, isComplete):
+            if len(entries) > 0 and len(firstPageSamples) < self._repeat and not hasattr(deliver, "seen"):
+                deliver.seen = True
+                firstPageSamples.append(time.perf_counter() - startedAt)
+            if isComplete:
+                finished.set()
+            else:
+                loader.request_more()
+        loader = HistoryLoader(self._gitpath, self._filepath, deliver, historyCache=historyCache)
+        loader.start()
+        finished.wait()
+
+    def load_history(self):
+        """ Returns the whole file-history as list of HistoryEntry's. """
+
+        entries = []
+        finished = Event()
+        loader = None
+        def deliver(batch, isComplete):
+            entries.extend(batch)
+            if isComplete:
+                finished.set()
+            else:
+                loader.request_more()
+        loader = HistoryLoader(self._gitpath, self._filepath, deliver)
+        loader.start()
+        finished.wait()
+        return entries
+
+    def history_store_memory(self, entries):
+        """
+        Memory per row of the history-table: allocated by the compact store (as traced by tracemalloc and as
+        reported by the store itself) and, for comparison, by one list of strings per row (as in a ListStore).
+        """
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        store = HistoryStore()
+        store.append(entries)
+        storeBytes = tracemalloc.get_traced_memory()[0] - before
+
+        before = tracemalloc.get_traced_memory()[0]
+        rows = []
+        copy = lambda text: text.encode().decode() # the ListStore keeps copies of the strings, not the entries
+        for entry in entries:
+            commitId = copy(entry.commitId)
+            rows.append([commitId[-8:], copy(entry.author), copy(entry.date), copy(entry.message[:60]), commitId, None])
+        listBytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        rowCount = max(1, len(entries))
+        return {
+            'rows':                len(entries),
+            'bytesPerRow':         storeBytes / rowCount,
+            'reportedBytesPerRow': store.get_memory_size() / rowCount,
+            'listBytesPerRow':     listBytes / rowCount,
+        }
+
+    def history_filter(self, entries):
+        """ Filtering the history-table while typing a commit-message (one sample per keystroke). """
+
+        store = HistoryStore()
+        store.append(entries)
+        index = HistoryIndex(store)
+        index.search("-") # builds the index
+        query = "commit %d" % (len(entries) // 3)
+        samples = []
+        for iteration in range(self._repeat):
+            for length in range(1, len(query) + 1):
+                startedAt = time.perf_counter()
+                index.search(query[:length])
+                samples.append(time.perf_counter() - startedAt)
+            index.search("")
+        return percentiles(samples)
+
+    def branches(self):
+        """ The branch-matrix of 'Compare with branch'. """
+
+        blobServer = BlobServer(self._gitpath)
+        read_branch_matrix(self._gitpath, self._filepath, blobServer, read_refs(self._gitpath))
+        blobServer.close()
+
+    def blob_tree_walk(self, blobServer, revisions):
+        """ Finding the blobs of the file in 20 revisions (commit and trees), before any contents are read. """
+
+        for commitId, path in revisions[:20]:
+            blobServer.get_blob_id(commitId, path)
+
+    def blob_fetch(self, blobServer, blobShas, clearCache):
+        """ Reading the contents of 20 blobs of the file, as for 'Compare with above' in the history. """
+
+        if clearCache:
+            BlobCache.get_shared().clear()
+        for blobSha in blobShas:
+            blobServer.get_blob(blobSha)
+
+    def diff_window(self, blobServer, revisions):
+        """ What the built-in diff-window computes for 'Compare with above' before it shows anything. """
+
+        (commitA, pathA), (commitB, pathB) = revisions[:2]
+        diff_side_by_side(split_text_lines(blobServer.get_contents(commitA, pathA)),
+                          split_text_lines(blobServer.get_contents(commitB, pathB)))
+
+def get_plugin_revision():
+    sp = subprocess.Popen(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdin=subprocess.DEVNULL, stdout=PIPE, stderr=subprocess.DEVNULL)
+    output, err = sp.communicate()
+    return output.decode().strip() or None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the git-menu plugin on synthetic repositories.")
+    parser.add_argument("--commits",     type=int, default=1000, help="commits in the main history")
+    parser.add_argument("--branches",    type=int, default=20,   help="branches forking off the main history")
+    parser.add_argument("--files",       type=int, default=100,  help="files besides the benchmarked one")
+    parser.add_argument("--file-lines",  type=int, default=1000, help="lines per file")
+    parser.add_argument("--renames",     type=int, default=3,    help="renames of the benchmarked file")
+    parser.add_argument("--pack-layout", choices=PACK_LAYOUTS, default="single",
+                        help="one pack, many packs or only loose objects")
+    parser.add_argument("--repeat",      type=int, default=10,   help="measurements per action")
+    parser.add_argument("--output",      help="write the JSON-result to this file instead of stdout")
+    parser.add_argument("--keep",        action="store_true", help="keep the generated repository")
+    arguments = parser.parse_args()
+
+    workDirectory = tempfile.mkdtemp(prefix="addiks-gitmenu-benchmark-")
+    try:
+        repository = SyntheticRepository(os.path.join(workDirectory, "repository"),
+            commits=arguments.commits, branches=arguments.branches, files=arguments.files,
+            fileLines=arguments.file_lines, renames=arguments.renames, packLayout=arguments.pack_layout)
+
+        startedAt = time.perf_counter()
+        repository.create()
+        generationTime = time.perf_counter() - startedAt
+
+        cacheDirectory = os.path.join(workDirectory, "cache")
+        os.makedirs(cacheDirectory)
+        results = Benchmark(repository, arguments.repeat, cacheDirectory).run()
+
+        report = {
+            'plugin':     get_plugin_revision(),
+            'python':     platform.python_version(),
+            'git':        subprocess.check_output(['git', '--version']).decode().strip(),
+            'parameters': {
+                'commits':    arguments.commits,
+                'branches':   arguments.branches,
+                'files':      arguments.files,
+                'fileLines':  arguments.file_lines,
+                'renames':    arguments.renames,
+                'packLayout': arguments.pack_layout,
+                'repeat':     arguments.repeat,
+            },
+            'generationSeconds': generationTime,
+            'unit':       "ms",
+            'results':    results,
+        }
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if arguments.output != None:
+            with open(arguments.output, "w") as f:
+                f.write(output + "\n")
+        else:
+            print(output)
+
+        if arguments.keep:
+            print("repository kept in " + repository.directory, file=sys.stderr)
+    finally:
+        if not arguments.keep:
+            shutil.rmtree(workDirectory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
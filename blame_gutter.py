@@ -0,0 +1,165 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from gi.repository import GtkSource, Gtk, GLib
+from blame_loader import BlameLoader, NOT_COMMITTED
+import time
+
+class BlameRenderer(GtkSource.GutterRendererText):
+    """ Gutter-renderer showing the blame-annotation of every line. """
+
+    def __init__(self, blameGutter):
+        GtkSource.GutterRendererText.__init__(self)
+        self._blameGutter = blameGutter
+        self.set_alignment(0.0, 0.5)
+
+    def do_query_data(self, start, end, state):
+        self.set_text(self._blameGutter.get_annotation(start.get_line()), -1)
+
+    def do_query_tooltip(self, lineIter, area, x, y, tooltip):
+        summary = self._blameGutter.get_summary(lineIter.get_line())
+        if summary == None:
+            return False
+        tooltip.set_text(summary)
+        return True
+
+class BlameGutter:
+    """
+    Annotates every line of a document (in the left gutter of its view) with the commit that last changed it.
+    The blame is streamed in a background-thread and shown chunk by chunk as git finds them,
+    the lines visible in the view first.
+
+    Every line of the blamed snapshot is a cell that the chunks write their commit into. Edits of the buffer
+    only move, drop or insert cells (inserted and edited lines are 'not committed'), so annotations stay on
+    their lines without re-running blame.
+    """
+
+    def __init__(self, view, repositoryService, filepath):
+        self._view = view
+        self._buffer = view.get_buffer()
+        self._gitpath = repositoryService.gitpath
+        self._historyCache = repositoryService.historyCache
+        self._filepath = filepath
+        self._loader = None
+        self._cells = []
+        self._snapshotCells = []
+        self._commits = {}
+        self._generation = 0
+
+        self._renderer = BlameRenderer(self)
+        self._gutter = view.get_gutter(Gtk.TextWindowType.LEFT)
+        self._gutter.insert(self._renderer, -20)
+
+        self._handlers = [
+            self._buffer.connect("insert-text", self._on_insert_text),
+            self._buffer.connect("delete-range", self._on_delete_range),
+        ]
+
+        self.reload()
+
+    def reload(self):
+        """ (Re-)Blames the current contents of the buffer, e.g. after HEAD changed. """
+
+        if self._loader != None:
+            self._loader.cancel()
+
+        self._generation += 1
+        generation = self._generation
+        buffer = self._buffer
+        contents = buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), True).encode()
+
+        self._cells = [[None] for line in range(buffer.get_line_count())]
+        self._snapshotCells = list(self._cells)
+        self._commits = {}
+        self.__update_size()
+
+        self._loader = BlameLoader(self._gitpath, self._filepath, contents,
+            lambda chunks, commits, isComplete: GLib.idle_add(self.__apply_chunks, generation, chunks, commits),
+            historyCache=self._historyCache, visibleLines=self.__get_visible_lines())
+        self._loader.start()
+
+    def detach(self):
+        """ Stops blaming and removes the annotations from the view. """
+
+        self._generation += 1
+        if self._loader != None:
+            self._loader.cancel()
+            self._loader = None
+        for handlerId in self._handlers:
+            self._buffer.disconnect(handlerId)
+        self._handlers = []
+        self._gutter.remove(self._renderer)
+
+    def get_annotation(self, line):
+        """ Returns the text shown in the gutter for a buffer-line. """
+
+        commitId = self.__get_commit_id(line)
+        if commitId == None:
+            return ""
+        if commitId == NOT_COMMITTED:
+            return "not committed"
+        commit = self._commits.get(commitId)
+        author = commit.author if commit != None else ""
+        date = time.strftime("%Y-%m-%d", time.localtime(commit.authorTime)) if commit != None else ""
+        return "%s %s %s" % (commitId[:8], date, author)
+
+    def get_summary(self, line):
+        """ Returns the commit-message of the commit that last changed a buffer-line, or None. """
+
+        commit = self._commits.get(self.__get_commit_id(line))
+        if commit == None:
+            return None
+        return commit.summary
+
+    def __get_commit_id(self, line):
+        if 0 <= line < len(self._cells):
+            return self._cells[line][0]
+        return None
+
+    def __get_visible_lines(self):
+        """ Returns the (first, last) line (1-based, as git counts) shown in the view, or None if not known yet. """
+
+        visibleRect = self._view.get_visible_rect()
+        if visibleRect.height <= 0:
+            return None
+        firstIter, top = self._view.get_line_at_y(visibleRect.y)
+        lastIter, top = self._view.get_line_at_y(visibleRect.y + visibleRect.height)
+        return (firstIter.get_line() + 1, lastIter.get_line() + 1)
+
+    def __apply_chunks(self, generation, chunks, commits):
+        """ Writes a batch of blamed chunks into the snapshot-lines (in the GTK main-thread). """
+
+        if generation != self._generation:
+            return False # reloaded or detached meanwhile
+        self._commits.update(commits)
+        snapshotCells = self._snapshotCells
+        for commitId, finalLine, lineCount in chunks:
+            for index in range(finalLine - 1, min(finalLine - 1 + lineCount, len(snapshotCells))):
+                snapshotCells[index][0] = commitId
+        if len(commits) > 0:
+            self.__update_size()
+        self._renderer.queue_draw()
+        return False
+
+    def __update_size(self):
+        width, height = self._renderer.measure("00000000 0000-00-00 " + max(
+            [commit.author for commit in self._commits.values()] + ["not committed"], key=len))
+        self._renderer.set_size(width)
+
+    ### BUFFER EVENTS
+
+    def _on_insert_text(self, buffer, location, text, length):
+        line = location.get_line()
+        self._cells[line:line+1] = [[NOT_COMMITTED] for index in range(text.count("\n") + 1)]
+
+    def _on_delete_range(self, buffer, start, end):
+        self._cells[start.get_line():end.get_line()+1] = [[NOT_COMMITTED]]
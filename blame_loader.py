@@ -0,0 +1,248 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from subprocess import PIPE
+from threading import Thread
+from collections import namedtuple
+from helpers import get_blob_sha
+from git_runner import GitProcess, run_git
+import time
+import re
+
+NOT_COMMITTED = "0" * 40
+
+# finalLine is 1-based (as git counts), the chunk covers the lines [finalLine, finalLine+lineCount).
+BlameChunk = namedtuple("BlameChunk", ["commitId", "finalLine", "lineCount"])
+BlameCommit = namedtuple("BlameCommit", ["author", "authorTime", "summary"])
+
+CHUNK_HEADER = re.compile(r"^([0-9a-f]{40}) (\d+) (\d+) (\d+)$")
+
+class BlameParser:
+    """
+    Incrementally parses the output of 'git blame --incremental --porcelain'.
+    Every chunk starts with "<sha> <source-line> <final-line> <line-count>", followed by the commit-headers
+    (only the first time a commit appears) and ends with a "filename" line.
+    """
+
+    def __init__(self):
+        self._rest = b""
+        self._chunk = None
+        self._headers = None
+        self.commits = {}
+
+    def feed(self, data):
+        """ Returns the chunks that got complete with this data, and the commits that were new in them. """
+
+        lines = (self._rest + data).split(b"\n")
+        self._rest = lines.pop()
+
+        chunks = []
+        newCommits = {}
+        for line in lines:
+            line = line.decode(errors="replace")
+            match = CHUNK_HEADER.match(line)
+
+            if match != None:
+                commitId, sourceLine, finalLine, lineCount = match.groups()
+                self._chunk = BlameChunk(commitId, int(finalLine), int(lineCount))
+                self._headers = {}
+
+            elif self._chunk == None:
+                continue
+
+            elif line.startswith("filename "):
+                commitId = self._chunk.commitId
+                if commitId not in self.commits:
+                    commit = BlameCommit(
+                        self._headers.get("author", ""),
+                        int(self._headers.get("author-time", "0") or 0),
+                        self._headers.get("summary", "")
+                    )
+                    self.commits[commitId] = commit
+                    newCommits[commitId] = commit
+                chunks.append(self._chunk)
+                self._chunk = None
+
+            else:
+                key, _, value = line.partition(" ")
+                self._headers[key] = value
+
+        return (chunks, newCommits)
+
+class BlameLoader:
+    """
+    Streams the blame of a document from 'git blame --incremental' in a background-thread.
+    The document-contents are passed to git (--contents), so unsaved lines are blamed as not committed.
+    Chunks are handed to a callback as they arrive (in batches), so large files get annotated bit by bit.
+    If the lines visible first are known, they are blamed on their own ('-L') before the rest of the file,
+    so they do not wait for git to work through the lines above and below them.
+
+    If a history-cache is given, complete results are cached per (HEAD, blob-sha of the contents).
+    """
+
+    def __init__(self, gitpath, filepath, contents, deliver, flushInterval=0.05, historyCache=None, visibleLines=None):
+        """
+        'deliver' will be called from the reader-thread with a list of BlameChunk's, a dict of the
+        commits that were new in them (commitId => BlameCommit) and a flag telling if the blame is complete.
+        'visibleLines' is the range (first, last) of lines (1-based, inclusive) to blame first.
+        """
+
+        self._gitpath = gitpath
+        self._filepath = filepath
+        self._contents = contents
+        self._deliver = deliver
+        self._flushInterval = flushInterval
+        self._historyCache = historyCache
+        self._visibleLines = visibleLines
+        self._cancelled = False
+        self._process = None
+        self._thread = None
+
+    def start(self):
+        """ Starts the reader-thread. """
+
+        self._thread = Thread(target=self.__run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """ Stops loading; the git-process is terminated and no more batches will be delivered. """
+
+        self._cancelled = True
+        process = self._process
+        if process != None and process.poll() == None:
+            process.kill()
+
+    def __run(self):
+        gitpath = self._gitpath
+        filerelpath = self._filepath[len(gitpath)+1:]
+        historyCache = self._historyCache
+        blobSha = get_blob_sha(self._contents)
+
+        try:
+            head = self.__git_output(['rev-parse', '--verify', '-q', 'HEAD']).strip()
+            if len(head) <= 0:
+                historyCache = None # no commits yet
+
+            if historyCache != None:
+                cached = historyCache.load_blame(gitpath, head, filerelpath)
+                if cached != None and cached.get('blob') == blobSha:
+                    chunks = [BlameChunk._make(chunk) for chunk in cached['chunks']]
+                    commits = dict((commitId, BlameCommit._make(commit))
+                                   for commitId, commit in cached['commits'].items())
+                    if not self._cancelled:
+                        self._deliver(chunks, commits, True)
+                    return
+
+            chunks = []
+            commits = {}
+            for lineRanges in self.__get_line_ranges():
+                newChunks, newCommits = self.__read_blame(lineRanges)
+                chunks += newChunks
+                commits.update(newCommits)
+                if self._cancelled:
+                    return
+
+            self._deliver([], {}, True)
+
+            if historyCache != None:
+                historyCache.store_blame(gitpath, head, filerelpath, {
+                    'blob':    blobSha,
+                    'chunks':  [list(chunk) for chunk in chunks],
+                    'commits': dict((commitId, list(commit)) for commitId, commit in commits.items()),
+                })
+
+        except (OSError, ValueError) as error:
+            if not self._cancelled:
+                print(error)
+
+    def __get_line_ranges(self):
+        """
+        Returns the line-ranges to blame one after the other: the visible lines first, then the lines above
+        and below them. A single empty list of ranges means the whole file at once.
+        """
+
+        contents = self._contents
+        lineCount = contents.count(b"\n") + (1 if len(contents) > 0 and not contents.endswith(b"\n") else 0)
+        if self._visibleLines == None or lineCount <= 0:
+            return [[]]
+
+        first, last = self._visibleLines
+        first = max(1, first)
+        last = min(lineCount, last)
+        if first > last:
+            return [[]]
+
+        rest = []
+        if first > 1:
+            rest.append((1, first - 1))
+        if last < lineCount:
+            rest.append((last + 1, lineCount))
+        if len(rest) <= 0:
+            return [[(first, last)]]
+        return [[(first, last)], rest]
+
+    def __read_blame(self, lineRanges):
+        """ Streams 'git blame' of some line-ranges and delivers its chunks in batches; returns all chunks and commits. """
+
+        arguments = ['blame', '--incremental', '--porcelain']
+        for first, last in lineRanges:
+            arguments += ['-L', "%d,%d" % (first, last)]
+        self._process = GitProcess(self._gitpath, arguments + ['--contents', '-', '--', self._filepath], stdin=PIPE)
+        process = self._process
+
+        # git reads the contents while it already writes chunks, so feed them from another thread.
+        writer = Thread(target=self.__write_contents, args=(process, ), daemon=True)
+        writer.start()
+
+        parser = BlameParser()
+        chunks = []
+        batch = []
+        batchCommits = {}
+        lastFlush = time.time()
+        try:
+            while not self._cancelled:
+                data = process.stdout.read1(65536)
+                if len(data) <= 0:
+                    break
+                newChunks, newCommits = parser.feed(data)
+                chunks += newChunks
+                batch += newChunks
+                batchCommits.update(newCommits)
+                if len(batch) > 0 and time.time() - lastFlush >= self._flushInterval:
+                    self._deliver(batch, batchCommits, False)
+                    batch = []
+                    batchCommits = {}
+                    lastFlush = time.time()
+
+            if len(batch) > 0 and not self._cancelled:
+                self._deliver(batch, batchCommits, False)
+        finally:
+            process.stdout.close()
+            if process.wait() != 0 and not self._cancelled:
+                raise OSError("git blame failed for " + self._filepath)
+            writer.join()
+        return (chunks, parser.commits)
+
+    def __write_contents(self, process):
+        try:
+            process.stdin.write(self._contents)
+        except OSError:
+            pass # git exited early (or got cancelled)
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    def __git_output(self, arguments):
+        exitCode, output, err = run_git(self._gitpath, arguments)
+        return output.decode()
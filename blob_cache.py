@@ -0,0 +1,80 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+class BlobCache:
+    """
+    In-memory LRU-cache of blob-contents keyed by blob-sha, bounded by the total size of the cached contents.
+    Blobs are immutable, so entries never get outdated; they only get evicted.
+    Blobs bigger than a quarter of the limit are not cached at all.
+    """
+
+    __shared = None
+
+    @classmethod
+    def get_shared(cls):
+        """ Returns the cache shared by all windows. """
+
+        if cls.__shared == None:
+            cls.__shared = BlobCache()
+        return cls.__shared
+
+    def __init__(self, maxBytes=64*1024*1024):
+        self._maxBytes = maxBytes
+        self._lock = Lock()
+        self._blobs = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, blobSha):
+        """ Returns the cached contents of a blob, or None. """
+
+        with self._lock:
+            contents = self._blobs.get(blobSha)
+            if contents != None:
+                self._blobs.move_to_end(blobSha)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return contents
+
+    def put(self, blobSha, contents):
+        """ Stores the contents of a blob, evicting least recently used blobs if needed. """
+
+        if len(contents) > self.get_max_blob_size():
+            return
+
+        with self._lock:
+            if blobSha in self._blobs:
+                self._blobs.move_to_end(blobSha)
+                return
+            self._blobs[blobSha] = contents
+            self._size += len(contents)
+            while self._size > self._maxBytes:
+                evictedSha, evictedContents = self._blobs.popitem(last=False)
+                self._size -= len(evictedContents)
+
+    def get_max_blob_size(self):
+        """ Blobs larger than this are never cached (they would evict everything else). """
+
+        return self._maxBytes // 4
+
+    def get_size(self):
+        return self._size
+
+    def clear(self):
+        with self._lock:
+            self._blobs.clear()
+            self._size = 0
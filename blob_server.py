@@ -0,0 +1,238 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+import subprocess
+from subprocess import PIPE
+from threading import Lock
+from git_runner import GitProcess, run_git
+from object_reader import ObjectReader, ObjectReaderError
+from repository_index import RepositoryIndex
+from blob_cache import BlobCache
+import zlib
+
+class BlobServer:
+    """
+    Serves blob-contents of one repository.
+    Lookups are first tried with the in-process object-reader (no subprocess at all); anything it cannot
+    handle is asked from one long-living 'git cat-file --batch' process, which is only started when needed.
+    Every such lookup is one round-trip through the pipe of that process instead of a new git process.
+    Contents are kept in the shared blob-cache, so adjacent revisions sharing a blob only read it once.
+    Blobs too big for the cache are never read into memory as a whole, they can only be streamed into files.
+    """
+
+    def __init__(self, gitpath):
+        self._gitpath = gitpath
+        self._process = None
+        self._lock = Lock()
+        self._objectReader = None
+        self._blobCache = BlobCache.get_shared()
+        self._blobIds = {} # (commit-sha, path) => blob-sha, for lookups answered by git
+        try:
+            self._objectReader = ObjectReader(RepositoryIndex.get_shared().get_git_dir(gitpath))
+        except (ObjectReaderError, OSError) as error:
+            print(error)
+
+    def get_contents(self, revision, filerelpath):
+        """ Returns the contents (as bytes) of a file in a given revision, or None if it does not exist there. """
+
+        blobCache = self._blobCache
+
+        if self._objectReader != None:
+            try:
+                blobSha = self._objectReader.get_blob_id(revision, filerelpath)
+                if blobSha == None:
+                    return None
+                contents = blobCache.get(blobSha)
+                if contents == None:
+                    objectType, contents = self._objectReader.read_object(blobSha)
+                    blobCache.put(blobSha, contents)
+                return contents
+            except (ObjectReaderError, OSError, ValueError, zlib.error):
+                pass # let git handle whatever the object-reader does not understand
+
+        # only full commit-ids are immutable, other revisions (branches, ...) might move.
+        isCommitId = len(revision) == 40 and all(c in "0123456789abcdef" for c in revision)
+        if isCommitId and (revision, filerelpath) in self._blobIds:
+            contents = blobCache.get(self._blobIds[(revision, filerelpath)])
+            if contents != None:
+                return contents
+
+        result = self.get_object(revision + ":" + filerelpath)
+        if result != None:
+            blobSha, objectType, result = result
+            blobCache.put(blobSha, result)
+            if isCommitId:
+                if len(self._blobIds) > 10000:
+                    self._blobIds.clear()
+                self._blobIds[(revision, filerelpath)] = blobSha
+        return result
+
+    def get_blob(self, blobSha):
+        """ Returns the contents (as bytes) of a blob given by its sha, or None if it does not exist. """
+
+        contents = self._blobCache.get(blobSha)
+        if contents != None:
+            return contents
+
+        if self._objectReader != None:
+            try:
+                objectType, contents = self._objectReader.read_object(blobSha)
+            except (ObjectReaderError, OSError, ValueError, zlib.error):
+                contents = None
+
+        if contents == None:
+            result = self.get_object(blobSha)
+            if result == None:
+                return None
+            sha, objectType, contents = result
+
+        self._blobCache.put(blobSha, contents)
+        return contents
+
+    def get_blob_id(self, revision, filerelpath):
+        """ Returns the sha of a file's blob in a given revision, or None if it does not exist there. """
+
+        if self._objectReader != None:
+            try:
+                return self._objectReader.get_blob_id(revision, filerelpath)
+            except (ObjectReaderError, OSError, ValueError, zlib.error):
+                pass
+
+        isCommitId = len(revision) == 40 and all(c in "0123456789abcdef" for c in revision)
+        if isCommitId and (revision, filerelpath) in self._blobIds:
+            return self._blobIds[(revision, filerelpath)]
+
+        exitCode, output, err = run_git(self._gitpath, ['rev-parse', '--verify', '--quiet', revision + ":" + filerelpath])
+        if exitCode != 0:
+            return None
+        blobSha = output.decode().strip()
+        if isCommitId:
+            if len(self._blobIds) > 10000:
+                self._blobIds.clear()
+            self._blobIds[(revision, filerelpath)] = blobSha
+        return blobSha
+
+    def write_blob(self, blobSha, target):
+        """
+        Writes the contents of a blob into a binary file, byte for byte.
+        Blobs too big for the blob-cache are streamed from a 'git cat-file blob' process in chunks
+        (memory-use does not grow with the size of the blob); smaller ones are read like by get_blob.
+        """
+
+        contents = self._blobCache.get(blobSha)
+        if contents == None and not self.__is_large(blobSha):
+            contents = self.get_blob(blobSha)
+        if contents != None:
+            target.write(contents)
+            return
+
+        process = GitProcess(self._gitpath, ['cat-file', 'blob', blobSha])
+        try:
+            process.copy_stdout(target)
+        finally:
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            raise OSError("cannot read blob " + blobSha)
+
+    def prefetch(self, revisions):
+        """
+        Loads the given (revision, filerelpath) pairs into the blob-cache; meant to run in a worker.
+        Blobs too big for the cache are skipped, they would only be read to be thrown away.
+        """
+
+        for revision, filerelpath in revisions:
+            blobSha = self.get_blob_id(revision, filerelpath)
+            if blobSha != None and not self.__is_large(blobSha):
+                self.get_blob(blobSha)
+
+    def get_object(self, objectName):
+        """
+        Looks up any object-name understood by git (sha, 'rev:path', ...).
+        Returns a tuple (sha, type, contents) or None if the object could not be found.
+        """
+
+        if "\n" in objectName:
+            return None
+
+        with self._lock:
+            try:
+                return self.__query(objectName)
+            except (OSError, ValueError):
+                # the process died (or the pipe broke), restart it once and try again.
+                self.__stop()
+                return self.__query(objectName)
+
+    def close(self):
+        """ Shuts down the batch-process. """
+
+        with self._lock:
+            self.__stop()
+        if self._objectReader != None:
+            self._objectReader.close()
+
+    def __is_large(self, blobSha):
+        """ Tells if a blob is too big for the blob-cache; if its size cannot be found cheaply, it counts as large. """
+
+        if self._objectReader == None:
+            return True
+        try:
+            return self._objectReader.get_object_size(blobSha) > self._blobCache.get_max_blob_size()
+        except (ObjectReaderError, OSError, ValueError, IndexError, zlib.error):
+            return True
+
+    def __query(self, objectName):
+        process = self.__get_process()
+
+        process.stdin.write(objectName.encode() + b"\n")
+        process.stdin.flush()
+
+        header = process.stdout.readline()
+        if len(header) <= 0:
+            raise OSError("git cat-file --batch terminated unexpectedly")
+
+        header = header.decode().rstrip("\n").split(" ")
+        if len(header) != 3:
+            # "<object> missing" or "<object> ambiguous"
+            return None
+
+        sha, objectType, size = header
+        size = int(size)
+
+        contents = process.stdout.read(size)
+        process.stdout.read(1) # trailing newline
+        if len(contents) != size:
+            raise OSError("git cat-file --batch terminated unexpectedly")
+
+        return (sha, objectType, contents)
+
+    def __get_process(self):
+        if self._process == None or self._process.poll() != None:
+            self.__stop()
+            gitpath = self._gitpath
+            self._process = GitProcess(gitpath, ['cat-file', '--batch'], stdin=PIPE)
+        return self._process
+
+    def __stop(self):
+        process = self._process
+        self._process = None
+        if process != None:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            try:
+                process.wait(1)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            process.stdout.close()
@@ -0,0 +1,148 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from collections import namedtuple
+from helpers import get_blob_sha
+from git_runner import run_git
+from diff_engine import diff_hashes, hash_lines
+
+IDENTICAL = "identical"
+MODIFIED  = "modified"
+MISSING   = "missing"
+RENAMED   = "renamed"
+
+# path is the path of the file on that branch (differs from the own path if renamed),
+# added/removed count the lines the branch has more/less than the work-tree file (None if binary or missing).
+BranchState = namedtuple("BranchState", ["branch", "commitId", "state", "path", "blobSha", "added", "removed"])
+
+Ref = namedtuple("Ref", ["name", "commitId", "treeId", "isHead"])
+
+def read_refs(gitpath, refPatterns=("refs/heads",)):
+    """ Lists branches (with the ids of their commits and trees) with one 'git for-each-ref'. """
+
+    refs = []
+    for line in _git_output(gitpath, ['for-each-ref', '--format=%(HEAD) %(objectname) %(tree) %(refname:short)'] + list(refPatterns)).split("\n"):
+        if len(line) > 84:
+            refs.append(Ref(line[84:], line[2:42], line[43:83], line[0] == '*'))
+    return refs
+
+def read_branch_matrix(gitpath, filepath, blobServer, refs):
+    """
+    Compares a work-tree file with its version on every branch (refs as from read_refs, except the current one).
+    Uses one batched 'git cat-file --batch-check' for all branches; only if the file is missing on some
+    branches, one 'git diff-tree --stdin' looks for renames on all of them.
+    Returns a list of BranchState's. Meant to run in a worker.
+    """
+
+    filerelpath = filepath[len(gitpath)+1:]
+
+    branches = [(ref.name, ref.commitId, ref.treeId) for ref in refs if not ref.isHead]
+
+    # one lookup for all branches, plus the tree of HEAD in case renames need to be searched.
+    queries = ["HEAD^{tree}"] + [commitId + ":" + filerelpath for branch, commitId, treeId in branches]
+    answers = _git_output(gitpath, ['cat-file', '--batch-check'], "\n".join(queries) + "\n").split("\n")
+    headTree = _parse_batch_check(answers[0], "tree")
+    blobShas = [_parse_batch_check(answer, "blob") for answer in answers[1:len(queries)]]
+
+    renames = {}
+    missingTrees = [treeId for (branch, commitId, treeId), blobSha in zip(branches, blobShas) if blobSha == None]
+    if headTree != None and len(missingTrees) > 0:
+        renames = _find_renames(gitpath, filerelpath, headTree, missingTrees)
+
+    try:
+        with open(filepath, "rb") as f:
+            workTreeContents = f.read()
+    except OSError:
+        workTreeContents = b""
+    workTreeSha = get_blob_sha(workTreeContents)
+
+    result = []
+    lineCounts = {} # most branches share a handful of distinct blobs, every one of them gets diffed only once
+    for (branch, commitId, treeId), blobSha in zip(branches, blobShas):
+        path = filerelpath
+        state = MODIFIED
+        if blobSha == None:
+            if treeId in renames:
+                path, blobSha = renames[treeId]
+                state = RENAMED
+            else:
+                result.append(BranchState(branch, commitId, MISSING, None, None, None, None))
+                continue
+
+        if blobSha == workTreeSha:
+            added, removed = (0, 0)
+            if state != RENAMED:
+                state = IDENTICAL
+        else:
+            if blobSha not in lineCounts:
+                lineCounts[blobSha] = _count_lines(workTreeContents, blobServer.get_blob(blobSha))
+            added, removed = lineCounts[blobSha]
+
+        result.append(BranchState(branch, commitId, state, path, blobSha, added, removed))
+
+    return result
+
+def _count_lines(ownContents, otherContents):
+    """ Returns the number of lines (added, removed) from ownContents to otherContents, (None, None) for binaries. """
+
+    if otherContents == None or b"\0" in ownContents[:8000] or b"\0" in otherContents[:8000]:
+        return (None, None)
+
+    added = 0
+    removed = 0
+    for baseStart, baseLength, otherStart, otherLength in diff_hashes(
+            hash_lines(ownContents.split(b"\n")), hash_lines(otherContents.split(b"\n"))):
+        removed += baseLength
+        added += otherLength
+    return (added, removed)
+
+def _find_renames(gitpath, filerelpath, headTree, trees):
+    """ Returns a dict tree => (path, blob-sha) for the trees in which the file of HEAD got renamed. """
+
+    pairs = "".join(headTree + " " + treeId + "\n" for treeId in set(trees))
+    output = _git_output(gitpath, ['diff-tree', '--stdin', '-r', '-M', '-z'], pairs)
+
+    # every pair starts with a "<tree> <tree>\n" line, followed by its raw (NUL-separated) diff-entries.
+    renames = {}
+    currentTree = None
+    tokens = output.split("\0")
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        index += 1
+        if "\n" in token:
+            header, _, token = token.rpartition("\n")
+            currentTree = header.split("\n")[-1].split(" ")[-1]
+        if not token.startswith(":"):
+            continue
+        fields = token[1:].split(" ")
+        if len(fields) >= 5 and fields[4][:1] in "RC":
+            oldPath, newPath = tokens[index], tokens[index+1]
+            index += 2
+            if oldPath == filerelpath and fields[4][:1] == "R":
+                renames[currentTree] = (newPath, fields[3])
+        else:
+            index += 1
+    return renames
+
+def _parse_batch_check(line, expectedType):
+    """ Returns the sha from a line of 'cat-file --batch-check' output, or None if missing or of another type. """
+
+    fields = line.split(" ")
+    if len(fields) == 3 and fields[1] == expectedType:
+        return fields[0]
+    return None
+
+def _git_output(gitpath, arguments, inputText=None):
+    exitCode, output, err = run_git(gitpath, arguments,
+        inputText.encode(errors="surrogateescape") if inputText != None else None)
+    return output.decode(errors="surrogateescape")
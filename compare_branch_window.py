@@ -11,15 +11,18 @@
 """
 
 from gi.repository import Gtk
-import subprocess
-from subprocess import Popen, PIPE
-import os
-from helpers import group
-import time
+from helpers import build_diff_command, BUILTIN_DIFF_VIEWER
+from diff_window import DiffWindow, read_file
+from repository_service import RepositoryService
+from spool import Spool
+from job_scheduler import JobScheduler
+from branch_matrix import read_branch_matrix, RENAMED
 
 class CompareBranchWindow:
     """ 
     Class for handling the 'compare with branch' functionality.
+    Lists the local and the remote-tracking branches; the table is re-read whenever the repository changes
+    (like when a background-fetch moved remote branches).
     """
     
     def __init__(self, gitpath, filepath):
@@ -30,60 +33,103 @@ class CompareBranchWindow:
         self._src_filepath = filepath
         self._gitpath = gitpath
         self.window = Gtk.Window()
+        self._repositoryService = RepositoryService.acquire(gitpath)
+        self._blobServer = self._repositoryService.blobServer
+        self.window.connect("destroy", self._on_window_destroyed)
         self.set_diff_viewer("meld %s %s")
 
-        try:
-            # list branches
-            sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'branch'], 
-                    stdin=PIPE, stdout=PIPE, stderr=PIPE)
-            sp.wait()
-
-            output, err = sp.communicate()
-            output = output.decode()
-            lines = output.split("\n")
-
-            listStore = Gtk.ListStore(str)
-
-            for line in lines:
-                isCurrent = line[0:1] == '*'
-                branch    = line[2:]
-
-                if not isCurrent and branch.strip() != "":
-                    listStore.append([branch])
-                  
-            treeview = Gtk.TreeView(model=listStore)
-            treeview.get_selection().connect("changed", self._on_table_changed)
-
-            grid = Gtk.Grid()
-            grid.attach(treeview, 0, 0, 1, 1)
-            
+        self._branch = None
+        self._states = {}
+        self._isDestroyed = False
+
+        self._listStore = Gtk.ListStore(str, str, str, str)
+
+        treeview = Gtk.TreeView(model=self._listStore)
+        treeview.get_selection().connect("changed", self._on_table_changed)
+
+        i = 0
+        for columnName in ["branch", "file", "+", "-"]:
             cell   = Gtk.CellRendererText()
-            column = Gtk.TreeViewColumn("branch", cell, text=0)
+            column = Gtk.TreeViewColumn(columnName, cell, text=i)
             treeview.append_column(column)
+            i += 1
 
-            compareButton = Gtk.Button()
-            compareButton.set_label("Compare")
-            compareButton.connect("clicked", self._on_compare_button_clicked)
-            grid.attach(compareButton, 0, 1, 1, 1)
+        scrolledWindow = Gtk.ScrolledWindow()
+        scrolledWindow.set_vexpand(True)
+        scrolledWindow.set_hexpand(True)
+        scrolledWindow.add(treeview)
 
-            self.window.add(grid)
-            self.window.show_all()
-        except OSError as error:
-            print(error)
+        grid = Gtk.Grid()
+        grid.attach(scrolledWindow, 0, 0, 1, 1)
+
+        compareButton = Gtk.Button()
+        compareButton.set_label("Compare")
+        compareButton.connect("clicked", self._on_compare_button_clicked)
+        grid.attach(compareButton, 0, 1, 1, 1)
+
+        self.window.set_default_size(480, 320)
+        self.window.add(grid)
+        self.window.show_all()
+
+        self._repositoryService.add_listener(self._load_branches)
+        self._load_branches()
+
+    def _load_branches(self):
+        """ The state of the file on all branches is resolved in one batched pass in a worker. """
+
+        JobScheduler.get_shared().submit(
+            ("branch-matrix", id(self)),
+            self.__read_branch_matrix,
+            (self._gitpath, self._src_filepath),
+            onDone=self._on_branches_loaded
+        )
 
     def set_diff_viewer(self, diffviewer):
         self._diffviewer = diffviewer
 
     def get_diff_viewer(self):
         return self._diffviewer
-        
+
+    def _on_window_destroyed(self, window, data=None):
+        """ Will be called when the branches-window gets closed. """
+
+        JobScheduler.get_shared().cancel(("branch-matrix", id(self)))
+        self._repositoryService.remove_listener(self._load_branches)
+        RepositoryService.release(self._gitpath)
+        self._isDestroyed = True
+
+    def __read_branch_matrix(self, gitpath, filepath):
+        """ Runs in a worker; the branches come from the (shared) ref-list of the repository. """
+
+        return read_branch_matrix(gitpath, filepath, self._blobServer, self._repositoryService.get_refs())
+
+    def _on_branches_loaded(self, branchStates):
+        """ Fills the table with the state of the file on every branch (in the GTK main-thread). """
+
+        if self._isDestroyed:
+            return
+        self._states = {}
+        self._listStore.clear()
+        for branchState in branchStates:
+            self._states[branchState.branch] = branchState
+
+            state = branchState.state
+            if state == RENAMED:
+                state += " to " + branchState.path
+
+            added   = "" if branchState.added   == None else "+" + str(branchState.added)
+            removed = "" if branchState.removed == None else "-" + str(branchState.removed)
+
+            self._listStore.append([branchState.branch, state, added, removed])
+
     def _on_table_changed(self, selection):
         """
         Will be called when the selected entry (branch) of the displayed table changes.
         """
 
         (model, iter) = selection.get_selected()
-        self._branch = model[iter][0]
+        if iter != None:
+            self._branch = model[iter][0]
 
     def _on_compare_button_clicked(self, button, data=None):
         """
@@ -96,32 +142,36 @@ class CompareBranchWindow:
         gitpath  = self._gitpath
         filepath = self._src_filepath
 
+        if branch == None:
+            return
+
         gitpathLen = len(gitpath) +1
         filerelpath = filepath[gitpathLen:]
 
-        tmpFilepath = "/tmp/addiks-compare" + filepath.replace("/", ".")
+        # the file might have another name on that branch; compare with the commit the table was computed from,
+        # the branch might have moved since (like by a background-fetch).
+        revision = branch
+        branchState = self._states.get(branch)
+        if branchState != None:
+            revision = branchState.commitId
+            if branchState.path != None:
+                filerelpath = branchState.path
+
+        if self.get_diff_viewer().strip() == BUILTIN_DIFF_VIEWER:
+            blobServer = self._blobServer
+            DiffWindow(filepath, branch + ":" + filerelpath, filepath,
+                lambda: (read_file(filepath), blobServer.get_contents(revision, filerelpath)))
+            return
 
         try:
-            # fetch file-content from different branch.
-            sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'show', branch+':'+filerelpath], 
-                    stdin=PIPE, stdout=PIPE, stderr=PIPE)
-            sp.wait()
-
-            output, err = sp.communicate()
-            output = output.decode()
-
-            f = open(tmpFilepath, 'w')
-            f.write(output)
-            f.close()
-
-            diffviewer = self.get_diff_viewer()
-            diffviewer = diffviewer % (filepath, tmpFilepath)
-            diffviewer = diffviewer.split(" ")
-            
-            # call the diff-viewer (by default meld)
-            sp = subprocess.Popen(diffviewer)
-            time.sleep(3)
-            os.remove(tmpFilepath)
-            
+            spool = Spool.get_shared()
+
+            # fetch file-content from different branch into the spool.
+            tmpFilepath = spool.acquire_revision(self._blobServer, revision, filerelpath)
+
+            # call the diff-viewer (by default meld), the spool-file is removed when it exits.
+            diffviewer = build_diff_command(self.get_diff_viewer(), filepath, tmpFilepath)
+            spool.spawn_viewer(diffviewer, [tmpFilepath])
+
         except OSError as error:
             print(error)
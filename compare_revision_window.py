@@ -10,16 +10,143 @@
  * @version 1.0
 """
 
-from gi.repository import Gtk
-import subprocess
-from subprocess import Popen, PIPE
-import os
-from helpers import group
-import time
+from gi.repository import Gtk, GLib, GObject
+from array import array
+from bisect import bisect_left
+from repository_service import RepositoryService
+from history_loader import HistoryLoader
+from history_store import HistoryStore, HistoryIndex, ROW_MERGE, ROW_RENAMED, ROW_BINARY, ROW_UNCHANGED
+from job_scheduler import JobScheduler, PRIORITY_BACKGROUND
+from spool import Spool
+from helpers import build_diff_command, BUILTIN_DIFF_VIEWER
+from diff_window import DiffWindow, read_file
+
+class HistoryModel(GObject.Object, Gtk.TreeModel):
+    """
+    Flat tree-model showing rows of a HistoryStore (all of them or a selection), with the columns
+    (commit, added, removed, kind of change, author, date, message, commit-id).
+    Rows are not copied into the model: the cells are produced from the store when the view asks for them,
+    and a view in fixed-height-mode only asks for the visible rows.
+    """
+
+    def __init__(self, store, rows=()):
+        GObject.Object.__init__(self)
+        self._store = store
+        self._rows = array('I', rows) # the store-row of every model-row
+
+    def get_store(self):
+        return self._store
+
+    def get_store_row(self, index):
+        """ Returns the store-row shown in a row of the model. """
+
+        return self._rows[index]
+
+    def add_rows(self, rows):
+        """ Shows further store-rows at the end and tells the views about them. """
+
+        for row in rows:
+            self._rows.append(row)
+            index = len(self._rows) - 1
+            self.row_inserted(Gtk.TreePath.new_from_indices([index]), self.__make_iter(index))
+
+    def do_get_flags(self):
+        return Gtk.TreeModelFlags.LIST_ONLY | Gtk.TreeModelFlags.ITERS_PERSIST
+
+    def do_get_n_columns(self):
+        return 8
+
+    def do_get_column_type(self, column):
+        return GObject.TYPE_STRING
+
+    def do_get_iter(self, path):
+        index = path.get_indices()[0]
+        if index < len(self._rows):
+            return (True, self.__make_iter(index))
+        return (False, None)
+
+    def do_get_path(self, iter):
+        return Gtk.TreePath.new_from_indices([iter.user_data - 1])
+
+    def do_get_value(self, iter, column):
+        store = self._store
+        row = self._rows[iter.user_data - 1]
+        if column == 0:
+            return store.get_commit_id(row)[-8:]
+        elif column == 1:
+            added = store.get_added(row)
+            return "" if added == None else "+" + str(added)
+        elif column == 2:
+            removed = store.get_removed(row)
+            return "" if removed == None else "-" + str(removed)
+        elif column == 3:
+            return self.__describe_flags(store.get_flags(row))
+        elif column == 4:
+            return store.get_author(row)
+        elif column == 5:
+            return store.get_date(row)
+        elif column == 6:
+            message = store.get_message(row)
+            if len(message)>60:
+                message = message[0:55] + " ..."
+            return message
+        return store.get_commit_id(row)
+
+    def __describe_flags(self, flags):
+        kinds = []
+        if flags & ROW_MERGE:
+            kinds.append("merge")
+        if flags & ROW_RENAMED:
+            kinds.append("renamed")
+        if flags & ROW_BINARY:
+            kinds.append("binary")
+        return ", ".join(kinds)
+
+    def do_iter_next(self, iter):
+        index = iter.user_data # the index of the next row (user_data is the index plus one)
+        if index < len(self._rows):
+            iter.user_data = index + 1
+            return (True, iter)
+        return (False, None)
+
+    def do_iter_previous(self, iter):
+        index = iter.user_data - 2
+        if index >= 0:
+            iter.user_data = index + 1
+            return (True, iter)
+        return (False, None)
+
+    def do_iter_children(self, parent):
+        return self.do_iter_nth_child(parent, 0)
+
+    def do_iter_has_child(self, iter):
+        return False
+
+    def do_iter_n_children(self, iter):
+        if iter == None:
+            return len(self._rows)
+        return 0
+
+    def do_iter_nth_child(self, parent, index):
+        if parent == None and index < len(self._rows):
+            return (True, self.__make_iter(index))
+        return (False, None)
+
+    def do_iter_parent(self, child):
+        return (False, None)
+
+    def __make_iter(self, index):
+        # user_data is a pointer, the row-index is stored plus one so the first row is not NULL.
+        iter = Gtk.TreeIter()
+        iter.user_data = index + 1
+        return iter
 
 class CompareRevisionWindow:
     """
     Class for handling the 'open file history' functionality.
+    Every commit is listed with the lines it added/removed and whether it renamed the file or is a merge,
+    all taken from the numstat of the one 'git log' that streams the history (no diff per row).
+    Merges and whitespace-only commits can be hidden, so 'compare with above' steps over them.
     """
 
     def __init__(self, gitpath, filepath):
@@ -30,99 +157,332 @@ class CompareRevisionWindow:
         self.window = Gtk.Window()
         self._src_filepath = filepath
         self._gitpath = gitpath
-        self._commits = []
-        self._commit = None
-        self._prevCommit = None
+        self._store = None
+        self._index = None
+        self._revision = None      # (commit-id, path) of the selected row
+        self._prevRevision = None  # (commit-id, path) of the row above
+        self._historyLoader = None
+        self._searchLoader = None
+        self._searchTimeoutId = None
+        self._filterQuery = None
+        self._hideMerges = False
+        self._hideWhitespace = False
+        self._repositoryService = RepositoryService.acquire(gitpath)
+        self._blobServer = self._repositoryService.blobServer
+        self.window.connect("destroy", self._on_window_destroyed)
         self.set_diff_viewer("meld %s %s")
 
-        try:
-            # fetch file-history from git.
-            sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'log', '--follow', '--full-history', filepath], 
-                    stdin=PIPE, stdout=PIPE, stderr=PIPE)
-            sp.wait()
-
-            output, err = sp.communicate()
-            output = output.decode()
-            lines = output.split("\n")
-
-            listStore = Gtk.ListStore(str, str, str, str, str, str)
-
-            commitBefore = None
-            for data in group(lines, 6):
-                commit  = data[0]
-                author  = data[1]
-                date    = data[2]
-                message = data[4]
-                message = message.strip()
-
-                if(len(commit)  > 0 and
-                   len(author)  > 0 and
-                   len(date)    > 0 and
-                   len(message) > 0):
-                       
-
-                    commit   = commit.split(" ")
-                    commit   = commit[1]
-                    commitId = commit
-                    commit   = commit[-8:]
-
-                    author = author.split(" ")
-                    author = author[1] + " " + author[2]
-
-                    if len(message)>60:
-                        message = message[0:55] + " ..."
-
-                    listStore.append([commit, author, date, message, commitId, commitBefore])
-                    self._commits.append([commitId, commitBefore])
-                    commitBefore = commitId
-
-            treeview = Gtk.TreeView(model=listStore)
-            treeview.get_selection().connect("changed", self._on_table_changed)
-
-            i = 0
-            for columnName in ["commit", "author", "date", "message"]:
-                cell   = Gtk.CellRendererText()
-                column = Gtk.TreeViewColumn(columnName, cell, text=i)
-                treeview.append_column(column)
-                i += 1
-
-            grid = Gtk.Grid()
-            grid.attach(treeview, 0, 0, 2, 1)
-
-            self.compareButton = Gtk.Button()
-            self.compareButton.set_label("Compare with current file")
-            self.compareButton.connect("clicked", self._on_compare_button_clicked)
-            grid.attach(self.compareButton, 0, 1, 1, 1)
-
-            self.comparePreviousButton = Gtk.Button()
-            self.comparePreviousButton.set_label("Compare with above")
-            self.comparePreviousButton.connect("clicked", self._on_compare_next_button_clicked)
-            grid.attach(self.comparePreviousButton, 1, 1, 1, 1)
-
-            self.window.add(grid)
-            self.window.show_all()
-        except OSError as error:
-            print(error)
+        self._historyModel = None
+        self._filterModel = None
+
+        self._searchEntry = Gtk.SearchEntry()
+        self._searchEntry.set_hexpand(True)
+        self._searchEntry.connect("search-changed", self._on_search_changed)
+
+        self._searchMode = Gtk.ComboBoxText()
+        self._searchMode.append("filter",  "Filter messages, authors and dates")
+        self._searchMode.append("pickaxe", "Search changes adding/removing the text (-S)")
+        self._searchMode.append("regex",   "Search changes matching the regex (-G)")
+        self._searchMode.set_active_id("filter")
+        self._searchMode.connect("changed", self._on_search_changed)
+
+        self._searchStatus = Gtk.Label()
+
+        hideMergesButton = Gtk.CheckButton(label="Hide merges")
+        hideMergesButton.connect("toggled", self._on_hide_merges_toggled)
+
+        hideWhitespaceButton = Gtk.CheckButton(label="Hide whitespace-only")
+        hideWhitespaceButton.set_tooltip_text("Reloads the history ignoring whitespace; the line-counts then ignore it, too.")
+        hideWhitespaceButton.connect("toggled", self._on_hide_whitespace_toggled)
+
+        treeview = Gtk.TreeView()
+        treeview.get_selection().connect("changed", self._on_table_changed)
+        self._treeview = treeview
+
+        # fixed row-heights and column-widths: only the visible rows ever get read from the model.
+        i = 0
+        for columnName, width in [("commit", 80), ("+", 50), ("-", 50), ("change", 90),
+                                  ("author", 140), ("date", 220), ("message", 400)]:
+            cell   = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(columnName, cell, text=i)
+            column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+            column.set_fixed_width(width)
+            column.set_resizable(True)
+            treeview.append_column(column)
+            i += 1
+        treeview.set_fixed_height_mode(True)
+
+        scrolledWindow = Gtk.ScrolledWindow()
+        scrolledWindow.set_vexpand(True)
+        scrolledWindow.set_hexpand(True)
+        scrolledWindow.add(treeview)
+        scrolledWindow.get_vadjustment().connect("value-changed", self._on_scrolled)
+
+        searchBox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=4)
+        searchBox.pack_start(self._searchEntry, True, True, 0)
+        searchBox.pack_start(self._searchMode, False, False, 0)
+        searchBox.pack_start(self._searchStatus, False, False, 0)
+        searchBox.pack_start(hideMergesButton, False, False, 0)
+        searchBox.pack_start(hideWhitespaceButton, False, False, 0)
+
+        grid = Gtk.Grid()
+        grid.attach(searchBox, 0, 0, 2, 1)
+        grid.attach(scrolledWindow, 0, 1, 2, 1)
+
+        self.compareButton = Gtk.Button()
+        self.compareButton.set_label("Compare with current file")
+        self.compareButton.connect("clicked", self._on_compare_button_clicked)
+        grid.attach(self.compareButton, 0, 2, 1, 1)
+
+        self.comparePreviousButton = Gtk.Button()
+        self.comparePreviousButton.set_label("Compare with above")
+        self.comparePreviousButton.connect("clicked", self._on_compare_next_button_clicked)
+        grid.attach(self.comparePreviousButton, 1, 2, 1, 1)
+
+        self.window.set_default_size(800, 400)
+        self.window.add(grid)
+        self.window.show_all()
+
+        self._load_history()
+        self._filter("")
 
     def set_diff_viewer(self, diffviewer):
         self._diffviewer = diffviewer
 
     def get_diff_viewer(self):
         return self._diffviewer
-        
+
+    def _on_window_destroyed(self, window, data=None):
+        """ Will be called when the history-window gets closed. """
+
+        if self._historyLoader != None:
+            self._historyLoader.cancel()
+        self._stop_search()
+        RepositoryService.release(self._gitpath)
+
+    def _load_history(self):
+        """
+        (Re-)Starts streaming the file-history from git, page by page, into an empty store (shown once filtered).
+        To hide whitespace-only commits the log ignores whitespace (-w): those commits then list no change.
+        """
+
+        if self._historyLoader != None:
+            self._historyLoader.cancel()
+            self._historyLoader = None
+        self._store = HistoryStore()
+        self._index = HistoryIndex(self._store)
+        self._historyModel = HistoryModel(self._store)
+
+        loader = None
+        def deliver(commits, isComplete):
+            GLib.idle_add(self._append_commits, loader, commits)
+
+        try:
+            logArguments = ['-w'] if self._hideWhitespace else []
+            loader = HistoryLoader(self._gitpath, self._src_filepath, deliver,
+                historyCache=self._repositoryService.historyCache, logArguments=logArguments)
+            self._historyLoader = loader
+            loader.start()
+        except OSError as error:
+            print(error)
+
+    def _append_commits(self, loader, commits):
+        """ Appends a batch of commits to the history-table (in the GTK main-thread). """
+
+        if loader != self._historyLoader:
+            return False # the history got reloaded meanwhile
+
+        firstRow = self._store.append(commits)
+        self._historyModel.add_rows(range(firstRow, len(self._store)))
+
+        if self._filterModel != None:
+            # while filtering, the whole history gets loaded, so the filter sees all of it.
+            self._filterModel.add_rows(self.__select_rows(firstRow))
+            self.__show_filter_status()
+            self._historyLoader.request_more()
+        return False
+
+    def _on_scrolled(self, adjustment):
+        """ Loads the next page of history (or search-results) when the table is scrolled near its end. """
+
+        loader = self._historyLoader
+        if self._searchLoader != None:
+            loader = self._searchLoader
+        if loader != None:
+            remaining = adjustment.get_upper() - adjustment.get_value() - adjustment.get_page_size()
+            if remaining < adjustment.get_page_size():
+                loader.request_more()
+
+    ### SEARCH
+
+    def _on_search_changed(self, widget, data=None):
+        """ Will be called when the search-text or the search-mode changes. """
+
+        self._stop_search()
+        query = self._searchEntry.get_text()
+        mode = self._searchMode.get_active_id()
+
+        if mode == "filter" or len(query) <= 0:
+            self._filter(query)
+        else:
+            # searching the contents of every revision is expensive, wait until the user stopped typing.
+            self._filter("")
+            self._searchTimeoutId = GLib.timeout_add(400, self._start_content_search, query, mode)
+
+    def _filter(self, query):
+        """
+        Shows only the loaded commits whose message, author or date contain all words of the query
+        and that are not hidden (merges, whitespace-only).
+        """
+
+        self._filterQuery = query if len(query.split()) > 0 else None
+        if self._filterQuery == None and not self._hideMerges and not self._hideWhitespace:
+            self._filterModel = None
+            self._searchStatus.set_text("")
+            self._treeview.set_model(self._historyModel)
+        else:
+            self._filterModel = HistoryModel(self._store, self.__select_rows(0))
+            self._treeview.set_model(self._filterModel)
+            self.__show_filter_status()
+            if self._historyLoader != None:
+                self._historyLoader.request_more()
+
+    def __select_rows(self, firstRow):
+        """ Returns the store-rows (from firstRow on) that match the filter-query and are not hidden. """
+
+        rows = range(firstRow, len(self._store))
+        if self._filterQuery != None:
+            foundRows = self._index.search(self._filterQuery)
+            rows = foundRows[bisect_left(foundRows, firstRow):]
+        if self._hideMerges or self._hideWhitespace:
+            rows = [row for row in rows if not self.__is_hidden(self._store.get_flags(row))]
+        return rows
+
+    def __is_hidden(self, flags):
+        if flags & ROW_MERGE:
+            return self._hideMerges
+        # with -w, a commit that only changed whitespace lists no change on the file.
+        return self._hideWhitespace and flags & ROW_UNCHANGED
+
+    def _on_hide_merges_toggled(self, button, data=None):
+        self._hideMerges = button.get_active()
+        self.__refilter()
+
+    def _on_hide_whitespace_toggled(self, button, data=None):
+        self._hideWhitespace = button.get_active()
+        self._load_history()
+        self.__refilter()
+
+    def __refilter(self):
+        """ Re-applies the filter, unless the table shows the results of a content-search. """
+
+        if self._searchLoader == None and self._searchTimeoutId == None:
+            self._filter(self._searchEntry.get_text() if self._searchMode.get_active_id() == "filter" else "")
+
+    def __show_filter_status(self):
+        status = "%d of %d commits" % (self._filterModel.iter_n_children(None), len(self._store))
+        if self._historyLoader != None and not self._historyLoader.is_finished():
+            status += " loaded so far"
+        self._searchStatus.set_text(status)
+
+    def _start_content_search(self, query, mode):
+        """ Runs 'git log -S/-G' for the file in the background and streams the commits it finds into the table. """
+
+        self._searchTimeoutId = None
+        searchStore = HistoryStore()
+        searchModel = HistoryModel(searchStore)
+        option = '-S' if mode == "pickaxe" else '-G'
+
+        loader = None
+        def deliver(commits, isComplete):
+            GLib.idle_add(self._append_search_results, loader, searchModel, commits, isComplete)
+
+        try:
+            loader = HistoryLoader(self._gitpath, self._src_filepath, deliver, logArguments=[option + query])
+            self._searchLoader = loader
+            self._treeview.set_model(searchModel)
+            self._searchStatus.set_text("searching ...")
+            loader.start()
+        except OSError as error:
+            print(error)
+        return False
+
+    def _append_search_results(self, loader, searchModel, commits, isComplete):
+        """ Appends commits found by the content-search (in the GTK main-thread). """
+
+        if loader != self._searchLoader:
+            return False # the search was cancelled or replaced meanwhile
+
+        store = searchModel.get_store()
+        firstRow = store.append(commits)
+        searchModel.add_rows(range(firstRow, len(store)))
+
+        status = "%d commits found" % len(store)
+        if not isComplete:
+            status = "searching ... " + status
+        self._searchStatus.set_text(status)
+        return False
+
+    def _stop_search(self):
+        """ Cancels a pending or running content-search. """
+
+        if self._searchTimeoutId != None:
+            GLib.source_remove(self._searchTimeoutId)
+            self._searchTimeoutId = None
+        if self._searchLoader != None:
+            self._searchLoader.cancel()
+            self._searchLoader = None
+
+    ### SELECTION
+
     def _on_table_changed(self, selection):
         """ Will be called when the selected row in the history-table changes. """
 
         (model, iter) = selection.get_selected()
+        if iter == None:
+            return
 
-        self._commit = model[iter][4]
+        index = model.get_path(iter).get_indices()[0]
+        self._revision = self._get_revision(model, index)
 
-        if model[iter][5] != None:
-            self._prevCommit = model[iter][5]
+        if index > 0:
+            self._prevRevision = self._get_revision(model, index - 1)
             self.comparePreviousButton.sensitive = True
         else:
+            self._prevRevision = None
             self.comparePreviousButton.sensitive = False
-            
+
+        self._prefetch_neighbours(model, index)
+
+    def _get_revision(self, model, index):
+        """ Returns the commit-id of a row of the table and the path the file had in that commit. """
+
+        store = model.get_store()
+        row = model.get_store_row(index)
+        filerelpath = store.get_path(row) # carried down past renames for rows that list no change
+        if filerelpath == None:
+            # no row up to this one listed the file, so it was not renamed since: it has its current path.
+            filerelpath = self._src_filepath[len(self._gitpath)+1:]
+        return (store.get_commit_id(row), filerelpath)
+
+    def _prefetch_neighbours(self, model, rowIndex):
+        """
+        Loads the blobs of the selected revision and its neighbours into the blob-cache in the background,
+        so the compare-buttons only have to write out already fetched contents.
+        """
+
+        revisions = []
+        for index in (rowIndex, rowIndex - 1, rowIndex + 1):
+            if index >= 0 and index < model.iter_n_children(None):
+                revisions.append(self._get_revision(model, index))
+
+        JobScheduler.get_shared().submit(
+            ("prefetch", id(self)),
+            self._blobServer.prefetch,
+            (revisions, ),
+            priority=PRIORITY_BACKGROUND
+        )
+
 
     ### BUTTON EVENTS:
 
@@ -132,92 +492,63 @@ class CompareRevisionWindow:
         Shows a diff between the selected revision and the historically next one.
         """
 
-        commitA  = self._commit
-        commitB  = self._prevCommit
-        gitpath  = self._gitpath
-        filepath = self._src_filepath
+        if self._revision == None or self._prevRevision == None:
+            return
 
-        gitpathLen = len(gitpath) +1
-        filerelpath = filepath[gitpathLen:]
+        commitA, filerelpathA = self._revision
+        commitB, filerelpathB = self._prevRevision
 
-        tmpFilepathA = "/tmp/addiks-compare" + filepath.replace("/", ".") + "-A"
-        tmpFilepathB = "/tmp/addiks-compare" + filepath.replace("/", ".") + "-B"
+        if self.get_diff_viewer().strip() == BUILTIN_DIFF_VIEWER:
+            blobServer = self._blobServer
+            DiffWindow(commitA[:8] + ":" + filerelpathA, commitB[:8] + ":" + filerelpathB, filerelpathA,
+                lambda: (blobServer.get_contents(commitA, filerelpathA), blobServer.get_contents(commitB, filerelpathB)))
+            return
 
         try:
-            # fetches the contents of the file from another revision.
-            sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'show', commitA+':'+filerelpath], 
-                    stdin=PIPE, stdout=PIPE, stderr=PIPE)
-            sp.wait()
-
-            output, err = sp.communicate()
-            output = output.decode()
-
-            f = open(tmpFilepathA, 'w')
-            f.write(output)
-            f.close()
-
-            # fetches the contents of the file from another revision.
-            sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'show', commitB+':'+filerelpath], 
-                    stdin=PIPE, stdout=PIPE, stderr=PIPE)
-            sp.wait()
-
-            output, err = sp.communicate()
-            output = output.decode()
-
-            f = open(tmpFilepathB, 'w')
-            f.write(output)
-            f.close()
-
-            diffviewer = self.get_diff_viewer()
-            diffviewer = diffviewer % (tmpFilepathA, tmpFilepathB)
-            diffviewer = diffviewer.split(" ")
-            
-            # open diff-viewer (by default meld)
-            sp = subprocess.Popen(diffviewer)
-            time.sleep(3)
-            os.remove(tmpFilepathA)
-            os.remove(tmpFilepathB)
-            
+            spool = Spool.get_shared()
+
+            # fetches the contents of the file from both revisions into the spool.
+            tmpFilepathA = spool.acquire_revision(self._blobServer, commitA, filerelpathA)
+            try:
+                tmpFilepathB = spool.acquire_revision(self._blobServer, commitB, filerelpathB)
+            except OSError:
+                spool.release_file(tmpFilepathA) # no diff-viewer will ever release it
+                raise
+
+            # open diff-viewer (by default meld), the spool-files are removed when it exits.
+            diffviewer = build_diff_command(self.get_diff_viewer(), tmpFilepathA, tmpFilepathB)
+            spool.spawn_viewer(diffviewer, [tmpFilepathA, tmpFilepathB])
+
         except OSError as error:
             print(error)
-        
+
     def _on_compare_button_clicked(self, button, data=None):
         """
         Will be called when user clicks the 'compare with current file' button.
         Shows a diff between the selected revision and the current open file.
         """
 
-        commit   = self._commit
-        gitpath  = self._gitpath
+        if self._revision == None:
+            return
+
+        commit, filerelpath = self._revision
         filepath = self._src_filepath
-        
-        gitpathLen = len(gitpath) +1
-        filerelpath = filepath[gitpathLen:]
 
-        tmpFilepath = "/tmp/addiks-compare" + filepath.replace("/", ".")
+        if self.get_diff_viewer().strip() == BUILTIN_DIFF_VIEWER:
+            blobServer = self._blobServer
+            DiffWindow(filepath, commit[:8] + ":" + filerelpath, filepath,
+                lambda: (read_file(filepath), blobServer.get_contents(commit, filerelpath)))
+            return
 
         try:
-            # fetches the contents of the file from another revision.
-            sp = subprocess.Popen(['git', '--git-dir='+gitpath+'/.git', '--work-tree='+gitpath, 'show', commit+':'+filerelpath], 
-                    stdin=PIPE, stdout=PIPE, stderr=PIPE)
-            sp.wait()
-
-            output, err = sp.communicate()
-            output = output.decode()
-
-            f = open(tmpFilepath, 'w')
-            f.write(output)
-            f.close()
-
-            diffviewer = self.get_diff_viewer()
-            diffviewer = diffviewer % (filepath, tmpFilepath)
-            diffviewer = diffviewer.split(" ")
-            
-            # open diff-viewer (by default meld)
-            sp = subprocess.Popen(diffviewer)
-            time.sleep(3)
-            os.remove(tmpFilepath)
-            
+            spool = Spool.get_shared()
+
+            # fetches the contents of the file from another revision into the spool.
+            tmpFilepath = spool.acquire_revision(self._blobServer, commit, filerelpath)
+
+            # open diff-viewer (by default meld), the spool-file is removed when it exits.
+            diffviewer = build_diff_command(self.get_diff_viewer(), filepath, tmpFilepath)
+            spool.spawn_viewer(diffviewer, [tmpFilepath])
+
         except OSError as error:
             print(error)
-
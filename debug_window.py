@@ -0,0 +1,104 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from gi.repository import Gtk, GLib
+from git_runner import GitTrace, TRACE_ENVIRONMENT_VARIABLE
+from blob_cache import BlobCache
+from job_scheduler import JobScheduler
+import time
+
+class DebugWindow:
+    """
+    Shows what the plugin is doing: the latest git-calls (with duration, exit-code, bytes read and caller),
+    cache hit-rates and the numbers of the job-queue. Refreshes itself every second while open.
+    """
+
+    def __init__(self):
+        self.window = Gtk.Window()
+        self.window.set_title("git activity")
+        self.window.set_default_size(900, 480)
+        self.window.connect("destroy", self._on_window_destroyed)
+
+        self._summary = Gtk.Label()
+        self._summary.set_xalign(0.0)
+        self._summary.set_selectable(True)
+
+        self._listStore = Gtk.ListStore(str, str, str, str, str, str)
+        treeview = Gtk.TreeView(model=self._listStore)
+
+        i = 0
+        for columnName in ["started", "ms", "exit", "bytes read", "caller", "command"]:
+            cell   = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(columnName, cell, text=i)
+            column.set_resizable(True)
+            treeview.append_column(column)
+            i += 1
+
+        scrolledWindow = Gtk.ScrolledWindow()
+        scrolledWindow.set_vexpand(True)
+        scrolledWindow.set_hexpand(True)
+        scrolledWindow.add(treeview)
+
+        grid = Gtk.Grid()
+        grid.attach(self._summary, 0, 0, 1, 1)
+        grid.attach(scrolledWindow, 0, 1, 1, 1)
+
+        self.window.add(grid)
+        self.window.show_all()
+
+        self._refresh()
+        self._timeoutId = GLib.timeout_add(1000, self._refresh)
+
+    def _on_window_destroyed(self, window, data=None):
+        GLib.source_remove(self._timeoutId)
+
+    def _refresh(self):
+        trace = GitTrace.get_shared()
+        counters = trace.get_counters()
+        blobCache = BlobCache.get_shared()
+        jobs = JobScheduler.get_shared().get_statistics()
+
+        lines = [
+            "git-calls: %d (%d failed), %.2fs in total" % (
+                counters.get('git.calls', 0), counters.get('git.failed', 0), counters.get('git.seconds', 0.0)),
+            "status-cache: %s    history-cache: %s    blame-cache: %s    blob-cache: %s (%d KiB)" % (
+                self.__hit_rate(counters.get('status-cache.hit', 0), counters.get('status-cache.miss', 0)),
+                self.__hit_rate(counters.get('history-cache.hit', 0), counters.get('history-cache.miss', 0)),
+                self.__hit_rate(counters.get('blame-cache.hit', 0), counters.get('blame-cache.miss', 0)),
+                self.__hit_rate(blobCache.hits, blobCache.misses), blobCache.get_size() // 1024),
+            "jobs: %d done, %d failed, %d queued, %d running; latency avg %.1fms max %.1fms; duration avg %.1fms max %.1fms" % (
+                jobs['completed'], jobs['failed'], jobs['queueDepth'], jobs['running'],
+                jobs['latencyAverage'] * 1000, jobs['latencyMax'] * 1000,
+                jobs['durationAverage'] * 1000, jobs['durationMax'] * 1000),
+            "background-fetches: %d changed, %d unchanged, %d failed, %d aborted" % (
+                counters.get('fetch.changed', 0), counters.get('fetch.unchanged', 0),
+                counters.get('fetch.failed', 0), counters.get('fetch.aborted', 0)),
+            "trace-file: set %s to record every git-call as JSON-lines" % TRACE_ENVIRONMENT_VARIABLE,
+        ]
+        self._summary.set_text("\n".join(lines))
+
+        self._listStore.clear()
+        for call in reversed(trace.get_calls()):
+            self._listStore.append([
+                time.strftime("%H:%M:%S", time.localtime(call['started'])),
+                "running" if call['duration'] == None else "%.1f" % (call['duration'] * 1000),
+                "" if call['exitCode'] == None else str(call['exitCode']),
+                str(call['bytesRead']),
+                call['action'],
+                " ".join(call['argv']),
+            ])
+        return True
+
+    def __hit_rate(self, hits, misses):
+        if hits + misses <= 0:
+            return "-"
+        return "%d%% of %d" % (hits * 100 // (hits + misses), hits + misses)
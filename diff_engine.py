@@ -0,0 +1,315 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from difflib import SequenceMatcher
+from collections import namedtuple, Counter
+import bisect
+import re
+
+ADDED    = "added"
+MODIFIED = "modified"
+DELETED  = "deleted"
+
+# number of unchanged lines around an edited region that are re-diffed with it (anchors to resynchronize on).
+ANCHOR_LINES = 3
+
+# regions of more lines than this are first split at lines that occur exactly once on both sides.
+UNIQUE_ANCHOR_MIN_LINES = 200
+
+# changed lines longer than this are highlighted as a whole, not word by word.
+INLINE_MAX_LINE_LENGTH = 1000
+
+INLINE_TOKEN_PATTERN = re.compile(r"\w+|\s+|[^\w\s]")
+
+# leftText/rightText: both sides with filler-lines inserted so that every row has the same line-number on both.
+# hunks: (row, leftLength, rightLength) per hunk, ascending; the hunk covers max(leftLength, rightLength) rows,
+#        the side with less lines is padded with fillers. hunkRows: the rows of the hunks (for bisecting).
+# inline: row => (leftRanges, rightRanges), the changed (start, end) character-ranges of a changed line-pair.
+SideBySide = namedtuple("SideBySide", ["leftText", "rightText", "rowCount", "hunks", "hunkRows", "inline"])
+
+def hash_lines(lines):
+    return [hash(line) for line in lines]
+
+def diff_hashes(baseHashes, bufferHashes, baseOffset=0, bufferOffset=0):
+    """
+    Diffs two lists of line-hashes.
+    Returns a list of hunks (baseStart, baseLength, bufferStart, bufferLength), offsets added to the positions.
+    """
+
+    baseEnd = len(baseHashes)
+    bufferEnd = len(bufferHashes)
+
+    # common prefix and suffix are cheap to strip and are by far the most common case.
+    prefix = 0
+    while prefix < baseEnd and prefix < bufferEnd and baseHashes[prefix] == bufferHashes[prefix]:
+        prefix += 1
+    while baseEnd > prefix and bufferEnd > prefix and baseHashes[baseEnd-1] == bufferHashes[bufferEnd-1]:
+        baseEnd -= 1
+        bufferEnd -= 1
+
+    if prefix == baseEnd and prefix == bufferEnd:
+        return []
+
+    if (baseEnd - prefix) + (bufferEnd - prefix) > UNIQUE_ANCHOR_MIN_LINES:
+        # diffing a large region as a whole gets slow when the changes are spread over it,
+        # so only the gaps between lines that are certainly the same on both sides get diffed.
+        anchors = _find_unique_anchors(baseHashes, prefix, baseEnd, bufferHashes, prefix, bufferEnd)
+        if len(anchors) > 0:
+            hunks = []
+            baseStart = bufferStart = prefix
+            for baseAnchor, bufferAnchor in anchors + [(baseEnd, bufferEnd)]:
+                if baseAnchor > baseStart or bufferAnchor > bufferStart:
+                    hunks += diff_hashes(baseHashes[baseStart:baseAnchor], bufferHashes[bufferStart:bufferAnchor],
+                        baseOffset + baseStart, bufferOffset + bufferStart)
+                baseStart = baseAnchor + 1
+                bufferStart = bufferAnchor + 1
+            return hunks
+
+    hunks = []
+    matcher = SequenceMatcher(None, baseHashes[prefix:baseEnd], bufferHashes[prefix:bufferEnd], autojunk=False)
+    for tag, baseStart, baseStop, bufferStart, bufferStop in matcher.get_opcodes():
+        if tag != "equal":
+            hunks.append((
+                baseOffset + prefix + baseStart, baseStop - baseStart,
+                bufferOffset + prefix + bufferStart, bufferStop - bufferStart
+            ))
+    return hunks
+
+def _find_unique_anchors(baseHashes, baseStart, baseEnd, bufferHashes, bufferStart, bufferEnd):
+    """
+    Returns (base-index, buffer-index) of lines that occur exactly once in both regions, as the longest chain
+    that ascends on both sides (like 'patience diff' does it).
+    """
+
+    baseRegion = baseHashes[baseStart:baseEnd]
+    bufferRegion = bufferHashes[bufferStart:bufferEnd]
+    baseCounts = Counter(baseRegion)
+    bufferCounts = Counter(bufferRegion)
+    basePositions = {lineHash: index for index, lineHash in enumerate(baseRegion, baseStart)
+                     if baseCounts[lineHash] == 1 and bufferCounts[lineHash] == 1}
+
+    # in buffer-order.
+    pairs = [(basePositions[lineHash], index) for index, lineHash in enumerate(bufferRegion, bufferStart)
+             if lineHash in basePositions]
+    if all(pairs[index][0] < pairs[index+1][0] for index in range(len(pairs) - 1)):
+        return pairs # nothing moved, the usual case
+
+    # longest increasing subsequence of the base-indexes.
+    tails = []        # smallest base-index ending a chain of length n+1
+    tailPairs = []    # index (into pairs) of that chain-end
+    previous = []
+    for pairIndex, (baseIndex, bufferIndex) in enumerate(pairs):
+        length = bisect.bisect_left(tails, baseIndex)
+        if length == len(tails):
+            tails.append(baseIndex)
+            tailPairs.append(pairIndex)
+        else:
+            tails[length] = baseIndex
+            tailPairs[length] = pairIndex
+        previous.append(tailPairs[length-1] if length > 0 else None)
+
+    anchors = []
+    pairIndex = tailPairs[-1] if len(tailPairs) > 0 else None
+    while pairIndex != None:
+        anchors.append(pairs[pairIndex])
+        pairIndex = previous[pairIndex]
+    anchors.reverse()
+    return anchors
+
+class LineDiff:
+    """
+    Line-diff between a base-text (like the HEAD-revision of a file) and a buffer that is being edited.
+
+    The diff is kept as a sorted list of hunks. An edit of the buffer only re-diffs the region of the hunks it
+    touches plus a few unchanged anchor-lines around it; hunks below the edit are just shifted.
+    So the cost of an edit depends on the size of the changed region, not on the size of the file.
+    """
+
+    def __init__(self, baseLines, bufferLines):
+        self._baseHashes = hash_lines(baseLines)
+        self._bufferHashes = hash_lines(bufferLines)
+        self._hunks = diff_hashes(self._baseHashes, self._bufferHashes)
+
+    @classmethod
+    def from_hunks(cls, baseLines, bufferLines, hunks):
+        """ Creates a diff from an already computed (full) diff, e.g. from a worker-thread. """
+
+        lineDiff = cls.__new__(cls)
+        lineDiff._baseHashes = hash_lines(baseLines)
+        lineDiff._bufferHashes = hash_lines(bufferLines)
+        lineDiff._hunks = list(hunks)
+        return lineDiff
+
+    def get_hunks(self):
+        return list(self._hunks)
+
+    def get_buffer_line_count(self):
+        return len(self._bufferHashes)
+
+    def update(self, startLine, oldLineCount, newLines):
+        """
+        Applies an edit of the buffer: the lines [startLine, startLine+oldLineCount) were replaced by newLines.
+        Returns the range (start, end) of buffer-lines whose markers need to be redrawn.
+        """
+
+        newLineCount = len(newLines)
+        delta = newLineCount - oldLineCount
+        self._bufferHashes[startLine:startLine+oldLineCount] = hash_lines(newLines)
+
+        hunks = self._hunks
+        bufferStarts = [hunk[2] for hunk in hunks]
+
+        # the region (in old buffer-coordinates) to re-diff: the edit, its anchors and all hunks touching them.
+        regionStart = max(0, startLine - ANCHOR_LINES)
+        regionEnd = startLine + oldLineCount + ANCHOR_LINES
+        first = bisect.bisect_left(bufferStarts, regionStart)
+        if first > 0 and hunks[first-1][2] + hunks[first-1][3] >= regionStart:
+            first -= 1
+        last = first
+        while last < len(hunks) and hunks[last][2] <= regionEnd:
+            last += 1
+
+        if first < last:
+            regionStart = min(regionStart, hunks[first][2])
+            regionEnd = max(regionEnd, hunks[last-1][2] + hunks[last-1][3])
+
+        oldBufferLength = len(self._bufferHashes) - delta
+        regionEnd = min(regionEnd, oldBufferLength)
+
+        # outside of hunks, buffer-lines map to base-lines by the offset of all hunks above.
+        baseStart = self.__map_to_base(regionStart, first)
+        baseEnd = self.__map_to_base(regionEnd, last)
+
+        newRegionEnd = regionEnd + delta
+        regionHunks = diff_hashes(
+            self._baseHashes[baseStart:baseEnd],
+            self._bufferHashes[regionStart:newRegionEnd],
+            baseStart,
+            regionStart
+        )
+
+        shiftedHunks = [(a, b, c + delta, d) for (a, b, c, d) in hunks[last:]]
+        self._hunks = hunks[:first] + regionHunks + shiftedHunks
+
+        return (regionStart, newRegionEnd)
+
+    def get_line_states(self, start=0, end=None):
+        """
+        Returns a dict buffer-line => ADDED / MODIFIED / DELETED for the lines in [start, end).
+        DELETED marks the line below which base-lines were removed.
+        """
+
+        if end == None:
+            end = len(self._bufferHashes)
+
+        states = {}
+        for baseStart, baseLength, bufferStart, bufferLength in self._hunks:
+            if bufferStart > end:
+                break
+            if bufferLength == 0:
+                line = max(0, bufferStart - 1)
+                if start <= line < end:
+                    states.setdefault(line, DELETED)
+                continue
+            state = MODIFIED if baseLength > 0 else ADDED
+            for line in range(max(start, bufferStart), min(end, bufferStart + bufferLength)):
+                states[line] = state
+        return states
+
+    def __map_to_base(self, bufferLine, hunkIndex):
+        """ Maps a buffer-line that lies outside of hunks to its base-line, hunkIndex = number of hunks above it. """
+
+        if hunkIndex <= 0:
+            return bufferLine
+        baseStart, baseLength, bufferStart, bufferLength = self._hunks[hunkIndex-1]
+        return bufferLine - (bufferStart + bufferLength) + (baseStart + baseLength)
+
+def split_text_lines(contents):
+    """ Decodes the contents (bytes) of a file into lines like gedit shows them; None (missing file) has no lines. """
+
+    if contents == None:
+        return []
+    lines = contents.decode(errors="replace").replace("\r\n", "\n").split("\n")
+    if len(lines) > 1 and lines[-1] == "":
+        lines.pop() # gedit does not show the trailing newline as an empty line
+    return lines
+
+def diff_side_by_side(leftLines, rightLines):
+    """
+    Diffs two lists of lines (without line-endings) for showing them side by side, including the word-wise
+    differences of changed line-pairs. Returns a SideBySide. Meant to run in a worker.
+    """
+
+    left = []
+    right = []
+    hunks = []
+    inline = {}
+    leftPosition = 0
+    rightPosition = 0
+    for leftStart, leftLength, rightStart, rightLength in diff_hashes(hash_lines(leftLines), hash_lines(rightLines)):
+        left += leftLines[leftPosition:leftStart]
+        right += rightLines[rightPosition:rightStart]
+
+        row = len(left)
+        rowCount = max(leftLength, rightLength)
+        left += leftLines[leftStart:leftStart+leftLength]
+        left += [""] * (rowCount - leftLength)
+        right += rightLines[rightStart:rightStart+rightLength]
+        right += [""] * (rowCount - rightLength)
+        hunks.append((row, leftLength, rightLength))
+
+        for offset in range(min(leftLength, rightLength)):
+            ranges = diff_inline(leftLines[leftStart+offset], rightLines[rightStart+offset])
+            if ranges != None:
+                inline[row+offset] = ranges
+
+        leftPosition = leftStart + leftLength
+        rightPosition = rightStart + rightLength
+
+    left += leftLines[leftPosition:]
+    right += rightLines[rightPosition:]
+
+    return SideBySide("\n".join(left), "\n".join(right), len(left), hunks, [hunk[0] for hunk in hunks], inline)
+
+def diff_inline(leftLine, rightLine):
+    """
+    Returns the changed character-ranges ([(start, end), ...] for each line) between two versions of a line,
+    compared word by word. Returns None for lines too long to compare.
+    """
+
+    if len(leftLine) > INLINE_MAX_LINE_LENGTH or len(rightLine) > INLINE_MAX_LINE_LENGTH:
+        return None
+
+    leftTokens = INLINE_TOKEN_PATTERN.findall(leftLine)
+    rightTokens = INLINE_TOKEN_PATTERN.findall(rightLine)
+    leftOffsets = _token_offsets(leftTokens)
+    rightOffsets = _token_offsets(rightTokens)
+
+    leftRanges = []
+    rightRanges = []
+    matcher = SequenceMatcher(None, leftTokens, rightTokens, autojunk=False)
+    for tag, leftStart, leftStop, rightStart, rightStop in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if leftStart < leftStop:
+            leftRanges.append((leftOffsets[leftStart], leftOffsets[leftStop]))
+        if rightStart < rightStop:
+            rightRanges.append((rightOffsets[rightStart], rightOffsets[rightStop]))
+    return (leftRanges, rightRanges)
+
+def _token_offsets(tokens):
+    """ Returns the character-offset of every token plus the end of the line. """
+
+    offsets = [0]
+    for token in tokens:
+        offsets.append(offsets[-1] + len(token))
+    return offsets
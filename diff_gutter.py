@@ -0,0 +1,164 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from gi.repository import GtkSource, Gdk
+from diff_engine import LineDiff, diff_hashes, hash_lines, split_text_lines, ADDED, MODIFIED, DELETED
+from job_scheduler import JobScheduler, PRIORITY_DEFAULT
+
+MARK_CATEGORIES = {
+    ADDED:    ("addiks-gitmenu-added",    "#8ae234"),
+    MODIFIED: ("addiks-gitmenu-modified", "#fcaf3e"),
+    DELETED:  ("addiks-gitmenu-deleted",  "#ef2929"),
+}
+
+class DiffGutter:
+    """
+    Shows which lines of a document differ from the HEAD-revision as marks in the gutter of its view.
+    Edits of the buffer are fed into an incremental LineDiff, so only the edited region is re-diffed.
+    """
+
+    def __init__(self, view, blobServer, filerelpath):
+        self._view = view
+        self._buffer = view.get_buffer()
+        self._blobServer = blobServer
+        self._filerelpath = filerelpath
+        self._lineDiff = None
+        self._pendingEdit = None
+        self._queuedEdits = None # edits that happened while a full diff was computed in a worker
+        self._generation = 0
+
+        for state, (category, color) in MARK_CATEGORIES.items():
+            attributes = GtkSource.MarkAttributes()
+            rgba = Gdk.RGBA()
+            rgba.parse(color)
+            attributes.set_background(rgba)
+            view.set_mark_attributes(category, attributes, 0)
+        view.set_show_line_marks(True)
+
+        self._handlers = [
+            self._buffer.connect("insert-text", self._on_insert_text),
+            self._buffer.connect_after("insert-text", self._on_after_edit),
+            self._buffer.connect("delete-range", self._on_delete_range),
+            self._buffer.connect_after("delete-range", self._on_after_edit),
+        ]
+
+    def detach(self):
+        """ Removes all marks and signal-handlers from the view. """
+
+        for handlerId in self._handlers:
+            self._buffer.disconnect(handlerId)
+        self._handlers = []
+        self._generation += 1
+        self.__clear_marks(self._buffer.get_start_iter(), self._buffer.get_end_iter())
+
+    def refresh_base(self):
+        """
+        (Re-)Loads the HEAD-revision of the file and computes the full diff against the buffer, both in a worker.
+        Edits happening in the meantime are queued and applied incrementally once the full diff is there.
+        """
+
+        self._generation += 1
+        generation = self._generation
+        buffer = self._buffer
+        bufferLines = buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), True).split("\n")
+        self._queuedEdits = []
+
+        JobScheduler.get_shared().submit(
+            ("diff-gutter", id(self)),
+            self.__compute_full_diff,
+            (bufferLines, ),
+            priority=PRIORITY_DEFAULT,
+            onDone=lambda result: self.__apply_full_diff(generation, bufferLines, result),
+            onError=lambda error: self.__drop_full_diff(generation)
+        )
+
+    def __compute_full_diff(self, bufferLines):
+        # not committed yet (None): everything is added.
+        baseLines = split_text_lines(self._blobServer.get_contents("HEAD", self._filerelpath))
+        return (baseLines, diff_hashes(hash_lines(baseLines), hash_lines(bufferLines)))
+
+    def __apply_full_diff(self, generation, bufferLines, result):
+        if generation != self._generation:
+            return # superseded or detached
+        baseLines, hunks = result
+        self._lineDiff = LineDiff.from_hunks(baseLines, bufferLines, hunks)
+        queuedEdits = self._queuedEdits
+        self._queuedEdits = None
+        for startLine, oldLineCount, newLines in queuedEdits:
+            self._lineDiff.update(startLine, oldLineCount, newLines)
+        self.__render(0, self._buffer.get_line_count())
+
+    def __drop_full_diff(self, generation):
+        if generation == self._generation:
+            self._queuedEdits = None # no base to apply them to; the next refresh starts over
+
+    ### BUFFER EVENTS
+
+    def _on_insert_text(self, buffer, location, text, length):
+        line = location.get_line()
+        self._pendingEdit = (line, 1, line, line + text.count("\n") + 1)
+
+    def _on_delete_range(self, buffer, start, end):
+        startLine = start.get_line()
+        self._pendingEdit = (startLine, end.get_line() - startLine + 1, startLine, startLine + 1)
+
+    def _on_after_edit(self, buffer, *arguments):
+        if self._pendingEdit == None:
+            return
+        startLine, oldLineCount, newStart, newEnd = self._pendingEdit
+        self._pendingEdit = None
+        newLines = self.__get_lines(newStart, newEnd)
+
+        if self._queuedEdits != None:
+            self._queuedEdits.append((startLine, oldLineCount, newLines))
+
+        elif self._lineDiff != None:
+            regionStart, regionEnd = self._lineDiff.update(startLine, oldLineCount, newLines)
+            self.__render(regionStart, regionEnd)
+
+    ### MARKS
+
+    def __render(self, startLine, endLine):
+        buffer = self._buffer
+        lineCount = buffer.get_line_count()
+        startLine = max(0, min(startLine, lineCount - 1))
+        endLine = max(startLine, min(endLine, lineCount))
+
+        startIter = buffer.get_iter_at_line(startLine)
+        if endLine < lineCount:
+            endIter = buffer.get_iter_at_line(max(startLine, endLine - 1))
+            if not endIter.ends_line():
+                endIter.forward_to_line_end()
+        else:
+            endIter = buffer.get_end_iter()
+        self.__clear_marks(startIter, endIter)
+
+        for line, state in self._lineDiff.get_line_states(startLine, endLine).items():
+            category = MARK_CATEGORIES[state][0]
+            buffer.create_source_mark(None, category, buffer.get_iter_at_line(line))
+
+    def __clear_marks(self, startIter, endIter):
+        for category, color in MARK_CATEGORIES.values():
+            self._buffer.remove_source_marks(startIter, endIter, category)
+
+    def __get_lines(self, startLine, endLine):
+        """ Returns the text of the buffer-lines [startLine, endLine) without line-endings. """
+
+        buffer = self._buffer
+        lines = []
+        for line in range(startLine, min(endLine, buffer.get_line_count())):
+            startIter = buffer.get_iter_at_line(line)
+            endIter = startIter.copy()
+            if not endIter.ends_line():
+                endIter.forward_to_line_end()
+            lines.append(buffer.get_text(startIter, endIter, True))
+        return lines
@@ -0,0 +1,215 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from gi.repository import Gtk, GtkSource, Pango
+from diff_engine import diff_side_by_side, split_text_lines
+from job_scheduler import JobScheduler, PRIORITY_HIGH
+import bisect
+
+# rows whose highlighting gets applied at once when one of them scrolls into view.
+RENDER_BLOCK_ROWS = 200
+
+# line-tags (whole rows) and the tag of the changed words inside of changed rows.
+LINE_TAGS = {
+    "changed": "#dde7f6",
+    "added":   "#d9f2cc",
+    "removed": "#f6d4d4",
+    "filler":  "#eeeeec",
+}
+INLINE_TAG = ("inline", "#a6c4ee")
+
+def read_file(filepath):
+    """ Returns the contents (bytes) of a file, or None if it cannot be read. """
+
+    try:
+        with open(filepath, "rb") as f:
+            return f.read()
+    except OSError as error:
+        print(error)
+        return None
+
+class DiffWindow:
+    """
+    Shows two versions of a file side by side, as built-in alternative to an external diff-viewer
+    ('builtin' in the diffrc). The contents come straight from memory (no temporary files).
+    Reading and diffing, including the word-wise differences of changed lines, happen in a worker;
+    the highlighting is applied block by block when rows scroll into view, so large files open as fast as small ones.
+    """
+
+    def __init__(self, titleLeft, titleRight, filename, read_contents):
+        """ read_contents: returns the contents (bytes, or None if missing) of the (left, right) side; runs in a worker. """
+
+        self._sideBySide = None
+        self._renderedBlocks = set()
+        self._isDestroyed = False
+
+        self.window = Gtk.Window()
+        self.window.set_title("%s - %s" % (titleLeft, titleRight))
+        self.window.set_default_size(1000, 700)
+        self.window.connect("destroy", self._on_window_destroyed)
+
+        language = GtkSource.LanguageManager.get_default().guess_language(filename, None)
+        self._leftView = self.__create_view(language)
+        self._rightView = self.__create_view(language)
+
+        leftScrolledWindow = Gtk.ScrolledWindow()
+        leftScrolledWindow.add(self._leftView)
+
+        # both sides have the same rows, so they scroll together by sharing one adjustment.
+        self._adjustment = leftScrolledWindow.get_vadjustment()
+        rightScrolledWindow = Gtk.ScrolledWindow(vadjustment=self._adjustment)
+        rightScrolledWindow.add(self._rightView)
+
+        grid = Gtk.Grid()
+        grid.set_column_homogeneous(True)
+        column = 0
+        for title, scrolledWindow in ((titleLeft, leftScrolledWindow), (titleRight, rightScrolledWindow)):
+            label = Gtk.Label(label=title)
+            label.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
+            scrolledWindow.set_vexpand(True)
+            scrolledWindow.set_hexpand(True)
+            grid.attach(label, column, 0, 1, 1)
+            grid.attach(scrolledWindow, column, 1, 1, 1)
+            column += 1
+
+        self._statusLabel = Gtk.Label(label="loading ...")
+        self._statusLabel.set_xalign(0.0)
+        grid.attach(self._statusLabel, 0, 2, 2, 1)
+
+        self._adjustment.connect("value-changed", self._on_scrolled)
+        self._leftView.connect("size-allocate", self._on_scrolled)
+
+        self.window.add(grid)
+        self.window.show_all()
+
+        JobScheduler.get_shared().submit(
+            ("diff-window", id(self)),
+            self.__compute,
+            (read_contents, ),
+            priority=PRIORITY_HIGH,
+            onDone=self._on_computed,
+            onError=self._on_failed
+        )
+
+    def _on_window_destroyed(self, window, data=None):
+        self._isDestroyed = True
+        JobScheduler.get_shared().cancel(("diff-window", id(self)))
+
+    def __create_view(self, language):
+        buffer = GtkSource.Buffer()
+        if language != None:
+            buffer.set_language(language)
+        for name, color in LINE_TAGS.items():
+            buffer.create_tag(name, paragraph_background=color)
+        buffer.create_tag(INLINE_TAG[0], background=INLINE_TAG[1])
+
+        view = GtkSource.View(buffer=buffer)
+        view.set_editable(False)
+        view.set_wrap_mode(Gtk.WrapMode.NONE)
+        view.override_font(Pango.FontDescription("monospace"))
+        return view
+
+    def __compute(self, read_contents):
+        """ Runs in a worker: reads both sides and diffs them. Returns a SideBySide, or None for binary files. """
+
+        leftContents, rightContents = read_contents()
+        for contents in (leftContents, rightContents):
+            if contents != None and b"\0" in contents[:8000]:
+                return None
+        return diff_side_by_side(split_text_lines(leftContents), split_text_lines(rightContents))
+
+    def _on_computed(self, sideBySide):
+        if self._isDestroyed:
+            return
+        if sideBySide == None:
+            self._statusLabel.set_text("binary files differ")
+            return
+
+        self._sideBySide = sideBySide
+        for view, text in ((self._leftView, sideBySide.leftText), (self._rightView, sideBySide.rightText)):
+            buffer = view.get_buffer()
+            buffer.begin_not_undoable_action()
+            buffer.set_text(text)
+            buffer.end_not_undoable_action()
+            buffer.place_cursor(buffer.get_start_iter())
+
+        if len(sideBySide.hunks) > 0:
+            self._statusLabel.set_text("%d changes" % len(sideBySide.hunks))
+        else:
+            self._statusLabel.set_text("identical")
+        self.__render_visible()
+
+    def _on_failed(self, error):
+        if not self._isDestroyed:
+            self._statusLabel.set_text("cannot compare: %s" % error)
+
+    def _on_scrolled(self, *arguments):
+        if self._sideBySide != None:
+            self.__render_visible()
+
+    ### HIGHLIGHTING
+
+    def __render_visible(self):
+        """ Highlights the blocks of rows that are (about to be) visible and were not highlighted yet. """
+
+        view = self._leftView
+        rectangle = view.get_visible_rect()
+        topIter, top = view.get_line_at_y(rectangle.y)
+        bottomIter, bottom = view.get_line_at_y(rectangle.y + rectangle.height)
+
+        for block in range(topIter.get_line() // RENDER_BLOCK_ROWS, bottomIter.get_line() // RENDER_BLOCK_ROWS + 1):
+            if block not in self._renderedBlocks:
+                self._renderedBlocks.add(block)
+                self.__render_block(block * RENDER_BLOCK_ROWS, (block + 1) * RENDER_BLOCK_ROWS)
+
+    def __render_block(self, start, end):
+        sideBySide = self._sideBySide
+        leftBuffer = self._leftView.get_buffer()
+        rightBuffer = self._rightView.get_buffer()
+        hunks = sideBySide.hunks
+
+        index = max(0, bisect.bisect_right(sideBySide.hunkRows, start) - 1)
+        while index < len(hunks) and hunks[index][0] < end:
+            row, leftLength, rightLength = hunks[index]
+            index += 1
+            rowCount = max(leftLength, rightLength)
+            if row + rowCount <= start:
+                continue
+
+            self.__tag_rows(leftBuffer, "changed" if rightLength > 0 else "removed", row, row + leftLength, start, end)
+            self.__tag_rows(leftBuffer, "filler", row + leftLength, row + rowCount, start, end)
+            self.__tag_rows(rightBuffer, "changed" if leftLength > 0 else "added", row, row + rightLength, start, end)
+            self.__tag_rows(rightBuffer, "filler", row + rightLength, row + rowCount, start, end)
+
+            for inlineRow in range(max(row, start), min(row + min(leftLength, rightLength), end)):
+                ranges = sideBySide.inline.get(inlineRow)
+                if ranges != None:
+                    leftRanges, rightRanges = ranges
+                    self.__tag_ranges(leftBuffer, inlineRow, leftRanges)
+                    self.__tag_ranges(rightBuffer, inlineRow, rightRanges)
+
+    def __tag_rows(self, buffer, tagName, startRow, endRow, blockStart, blockEnd):
+        startRow = max(startRow, blockStart)
+        endRow = min(endRow, blockEnd)
+        if startRow >= endRow:
+            return
+        startIter = buffer.get_iter_at_line(startRow)
+        if endRow < buffer.get_line_count():
+            endIter = buffer.get_iter_at_line(endRow)
+        else:
+            endIter = buffer.get_end_iter()
+        buffer.apply_tag_by_name(tagName, startIter, endIter)
+
+    def __tag_ranges(self, buffer, row, ranges):
+        for start, end in ranges:
+            buffer.apply_tag_by_name(INLINE_TAG[0],
+                buffer.get_iter_at_line_offset(row, start), buffer.get_iter_at_line_offset(row, end))
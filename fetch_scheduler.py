@@ -0,0 +1,150 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from job_scheduler import JobScheduler
+from repository_service import RepositoryService, FETCH_CHANGED, FETCH_FAILED, FETCH_ABORTED
+from git_runner import GitTrace
+import time
+
+# fetches running at the same time over all repositories.
+MAX_CONCURRENT_FETCHES = 1
+
+# the editor counts as idle when the user did nothing for this long.
+IDLE_SECONDS = 30
+
+# how often (while gedit runs) the scheduler looks for fetches that are due.
+TICK_SECONDS = 10
+
+# a remote that keeps failing or has nothing new is not asked more rarely than this.
+MAX_DELAY_SECONDS = 3600
+
+class RemoteState:
+    """ When the remotes of one repository get fetched next, and how far that got backed off. """
+
+    __slots__ = ("dueAt", "delay", "running", "lastResult")
+
+    def __init__(self, dueAt, delay):
+        self.dueAt      = dueAt
+        self.delay      = delay
+        self.running    = False
+        self.lastResult = None
+
+class FetchScheduler:
+    """
+    Fetches the remotes of the repositories in use (those with a RepositoryService) in the background,
+    so remote-tracking branches are already up to date when the user compares against them.
+
+    - A fetch only starts while the editor is idle (no activity reported for IDLE_SECONDS)
+      and never while the user writes to that repository (a fetch running then gets aborted and retried).
+    - At most MAX_CONCURRENT_FETCHES run at once, on an own pool so they never hold up the shared workers.
+    - After a fetch that brought nothing new or failed, the delay to the next one doubles
+      (up to MAX_DELAY_SECONDS); when branches moved, it drops back to the configured interval.
+    """
+
+    __shared = None
+
+    @classmethod
+    def get_shared(cls, interval):
+        """ Returns the scheduler of the plugin (driven by the GTK main-loop), starting it on first use. """
+
+        if cls.__shared == None:
+            from gi.repository import GLib
+            cls.__shared = FetchScheduler(interval, JobScheduler(MAX_CONCURRENT_FETCHES, GLib.idle_add))
+            cls.__shared._timeoutId = GLib.timeout_add_seconds(TICK_SECONDS, cls.__shared._on_tick)
+        return cls.__shared
+
+    @classmethod
+    def shutdown_shared(cls):
+        if cls.__shared != None:
+            from gi.repository import GLib
+            GLib.source_remove(cls.__shared._timeoutId)
+            cls.__shared.shutdown()
+            cls.__shared = None
+
+    def __init__(self, interval, jobScheduler, get_services=RepositoryService.get_services, clock=time.monotonic):
+        self._interval = interval
+        self._jobScheduler = jobScheduler
+        self._get_services = get_services
+        self._clock = clock
+        self._states = {}  # work-tree => RemoteState
+        self._lastActivityAt = clock()
+        self._timeoutId = None
+
+    def note_activity(self):
+        """ Tells the scheduler the user is working, which postpones fetches until the editor is idle again. """
+
+        self._lastActivityAt = self._clock()
+
+    def get_state(self, gitpath):
+        return self._states.get(gitpath)
+
+    def tick(self):
+        """ Starts the fetches that are due, if the editor is idle. Returns the number of fetches started. """
+
+        now = self._clock()
+        if now - self._lastActivityAt < IDLE_SECONDS:
+            return 0
+
+        services = self._get_services()
+        gitpaths = set(service.gitpath for service in services)
+        for gitpath in list(self._states):
+            if gitpath not in gitpaths and not self._states[gitpath].running:
+                del self._states[gitpath] # repository not in use anymore
+
+        running = sum(1 for state in self._states.values() if state.running)
+        started = 0
+        for service in sorted(services, key=lambda service: self.__get_due_at(service.gitpath, now)):
+            if running >= MAX_CONCURRENT_FETCHES:
+                break
+            state = self._states.setdefault(service.gitpath, RemoteState(now, self._interval))
+            if state.running or state.dueAt > now or service.is_writing():
+                continue
+            state.running = True
+            running += 1
+            started += 1
+            self._jobScheduler.submit(
+                ("fetch", service.gitpath),
+                service.fetch,
+                onDone=lambda result, service=service: self._on_fetched(service, result),
+                onError=lambda error, service=service: self._on_fetched(service, FETCH_FAILED)
+            )
+        return started
+
+    def shutdown(self):
+        self._jobScheduler.shutdown()
+
+    def _on_tick(self):
+        self.tick()
+        return True
+
+    def _on_fetched(self, service, result):
+        """ Called (in the main-thread) with the result of a fetch (FETCH_FAILED if it raised); schedules the next one. """
+
+        state = self._states.get(service.gitpath)
+        if state == None:
+            return
+        state.running = False
+        state.lastResult = result
+        GitTrace.get_shared().count("fetch." + result)
+
+        if result == FETCH_ABORTED:
+            return # still due, retried once the editor is idle again
+        if result == FETCH_CHANGED:
+            state.delay = self._interval
+            service.invalidate()
+        else:
+            state.delay = min(state.delay * 2, max(MAX_DELAY_SECONDS, self._interval))
+        state.dueAt = self._clock() + state.delay
+
+    def __get_due_at(self, gitpath, now):
+        state = self._states.get(gitpath)
+        return state.dueAt if state != None else now
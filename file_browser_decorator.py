@@ -0,0 +1,197 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from gi.repository import GLib
+from job_scheduler import JobScheduler, PRIORITY_BACKGROUND
+from status_cache import CONFLICT, MODIFIED, STAGED, UNTRACKED, IGNORED
+import os
+
+FILE_BROWSER_BUS_PATH = "/plugins/filebrowser"
+
+EMBLEMS = {
+    CONFLICT:  "dialog-warning",
+    MODIFIED:  "emblem-important",
+    STAGED:    "emblem-default",
+    UNTRACKED: "emblem-new",
+    IGNORED:   "emblem-unreadable",
+}
+
+class FileBrowserDecorator:
+    """
+    Shows the git-state of files and directories (untracked, modified, staged, ignored, conflict; directories
+    show the strongest state below them) as emblems in gedit's file-browser panel, talking to the file-browser
+    plugin through the message-bus of the window.
+
+    Only rows the file-browser reports as inserted get decorated, i.e. the contents of expanded directories.
+    All states come from the one 'git status' snapshot the repository-service keeps anyway, read in a worker.
+    When the repository changed, only the rows whose paths differ between the old and the new snapshot
+    are looked at again, so nothing walks the tree and no git-call is made per file.
+    """
+
+    def __init__(self, window, get_repository_service, get_repository_index):
+        self._bus = window.get_message_bus()
+        self._get_repository_service = get_repository_service
+        self._get_repository_index = get_repository_index
+        self._handlers = []
+        self._rows = {}          # path => (row-id, is-directory) of every row in the file-browser
+        self._emblems = {}       # path => emblem currently shown on the row
+        self._pending = set()    # paths of rows inserted since the last decoration
+        self._pendingSourceId = None
+        self._snapshots = {}     # work-tree => StatusSnapshot the rows were decorated from
+        self._waiting = {}       # work-tree => paths to decorate once its snapshot got read
+
+    def attach(self):
+        """ Starts decorating, if the file-browser is there (and not done yet). Returns True when attached. """
+
+        if len(self._handlers) > 0:
+            return True
+        if not self._bus.is_registered(FILE_BROWSER_BUS_PATH, "inserted"):
+            return False
+
+        self._handlers = [
+            self._bus.connect(FILE_BROWSER_BUS_PATH, "inserted", self._on_inserted, None),
+            self._bus.connect(FILE_BROWSER_BUS_PATH, "deleted", self._on_deleted, None),
+        ]
+
+        # rows inserted before (the file-browser might have been activated first) are reported again.
+        self._bus.send(FILE_BROWSER_BUS_PATH, "refresh")
+        return True
+
+    def detach(self):
+        """ Stops decorating and removes the emblems. """
+
+        for handlerId in self._handlers:
+            self._bus.disconnect(handlerId)
+        self._handlers = []
+
+        if self._pendingSourceId != None:
+            GLib.source_remove(self._pendingSourceId)
+            self._pendingSourceId = None
+
+        for path in list(self._emblems):
+            self.__set_emblem(path, None)
+        self._rows = {}
+        self._pending = set()
+        self._snapshots = {}
+        self._waiting = {}
+
+    def refresh(self, gitpath):
+        """ Re-reads the state of a work-tree after it changed; only rows whose state changed are updated. """
+
+        if gitpath in self._snapshots:
+            self.__read_snapshot(gitpath)
+
+    ### FILE-BROWSER EVENTS
+
+    def _on_inserted(self, bus, message, data=None):
+        location = message.props.location
+        if location == None or location.get_path() == None:
+            return
+        path = location.get_path()
+        self._rows[path] = (message.props.id, message.props.is_directory)
+        self._pending.add(path)
+
+        # a directory gets expanded row by row, decorate all of them at once.
+        if self._pendingSourceId == None:
+            self._pendingSourceId = GLib.idle_add(self.__decorate_pending)
+
+    def _on_deleted(self, bus, message, data=None):
+        location = message.props.location
+        if location != None and location.get_path() != None:
+            path = location.get_path()
+            self._rows.pop(path, None)
+            self._emblems.pop(path, None)
+            self._pending.discard(path)
+
+    ### DECORATION
+
+    def __decorate_pending(self):
+        self._pendingSourceId = None
+        repositoryIndex = self._get_repository_index()
+
+        pathsByGitpath = {}
+        for path in self._pending:
+            if "/.git/" in path + "/":
+                continue
+            gitpath = repositoryIndex.get_work_tree(path)
+            if gitpath != None and path != gitpath:
+                pathsByGitpath.setdefault(gitpath, []).append(path)
+        self._pending = set()
+
+        for gitpath, paths in pathsByGitpath.items():
+            snapshot = self._snapshots.get(gitpath)
+            if snapshot != None:
+                self.__apply(gitpath, snapshot, paths)
+            else:
+                self._waiting.setdefault(gitpath, set()).update(paths)
+                self.__read_snapshot(gitpath)
+        return False
+
+    def __read_snapshot(self, gitpath):
+        """ Reads the status-snapshot of a work-tree in a worker, a running read for it is not repeated. """
+
+        statusCache = self._get_repository_service(gitpath).statusCache
+        JobScheduler.get_shared().submit(
+            ("file-browser-status", id(self), gitpath),
+            statusCache.get_snapshot,
+            priority=PRIORITY_BACKGROUND,
+            onDone=lambda snapshot: self.__on_snapshot_read(gitpath, snapshot)
+        )
+
+    def __on_snapshot_read(self, gitpath, snapshot):
+        """ Decorates the rows waiting for the snapshot and those whose state changed since the last one. """
+
+        if len(self._handlers) <= 0:
+            return # detached meanwhile
+
+        paths = self._waiting.pop(gitpath, set())
+        previous = self._snapshots.get(gitpath)
+        self._snapshots[gitpath] = snapshot
+        if previous != None and previous is not snapshot:
+            paths |= self.__get_rows_changed(gitpath, previous.get_changed_paths(snapshot))
+
+        self.__apply(gitpath, snapshot, paths)
+
+    def __get_rows_changed(self, gitpath, changedRelpaths):
+        """ Returns the paths of the rows affected by the changed entries of a snapshot. """
+
+        paths = set()
+        for relpath in changedRelpaths:
+            path = os.path.join(gitpath, relpath.rstrip("/"))
+            if path in self._rows:
+                paths.add(path)
+            if relpath.endswith("/"):
+                # an untracked or ignored directory (dis)appeared: everything shown below it changed.
+                prefix = path + "/"
+                paths.update(rowPath for rowPath in self._rows if rowPath.startswith(prefix))
+        return paths
+
+    def __apply(self, gitpath, snapshot, paths):
+        for path in paths:
+            row = self._rows.get(path)
+            if row == None:
+                continue
+            rowId, isDirectory = row
+            state = snapshot.get_state(path[len(gitpath)+1:], isDirectory)
+            emblem = EMBLEMS.get(state)
+            if self._emblems.get(path) != emblem:
+                self.__set_emblem(path, emblem)
+
+    def __set_emblem(self, path, emblem):
+        row = self._rows.get(path)
+        if row == None:
+            return
+        if emblem == None:
+            self._emblems.pop(path, None)
+        else:
+            self._emblems[path] = emblem
+        self._bus.send(FILE_BROWSER_BUS_PATH, "set_emblem", id=row[0], emblem=emblem)
@@ -0,0 +1,267 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+import subprocess
+from subprocess import PIPE
+from collections import deque
+from threading import Lock
+from helpers import git_command
+import signal
+import json
+import time
+import sys
+import os
+
+# if set, every finished git-call is appended as one JSON-line to the file named by this variable.
+TRACE_ENVIRONMENT_VARIABLE = "ADDIKS_GITMENU_TRACE"
+
+class GitTrace:
+    """
+    Records every git-invocation of the plugin (argv, cwd, wall-time, exit-code, bytes read/written and the
+    calling code) in a rolling in-memory log, plus named counters (like cache hits and misses).
+    """
+
+    __shared = None
+
+    @classmethod
+    def get_shared(cls):
+        if cls.__shared == None:
+            cls.__shared = GitTrace(os.environ.get(TRACE_ENVIRONMENT_VARIABLE))
+        return cls.__shared
+
+    def __init__(self, tracePath=None, maxCalls=500):
+        self._lock = Lock()
+        self._calls = deque(maxlen=maxCalls)
+        self._counters = {}
+        self._tracePath = tracePath
+        self._traceFile = None
+
+    def start_call(self, argv, cwd=None, action=None):
+        """ Registers a git-call that is about to start; returns its record (a dict) for finish_call. """
+
+        call = {
+            'started':      time.time(),
+            'argv':         list(argv),
+            'cwd':          cwd if cwd != None else os.getcwd(),
+            'action':       action if action != None else get_caller(),
+            'duration':     None,
+            'exitCode':     None,
+            'bytesRead':    0,
+            'bytesWritten': 0,
+        }
+        with self._lock:
+            self._calls.append(call)
+            self._counters['git.calls'] = self._counters.get('git.calls', 0) + 1
+        return call
+
+    def finish_call(self, call, exitCode, bytesRead=None, bytesWritten=None):
+        """ Completes the record of a git-call and writes it into the trace-file (if enabled). """
+
+        with self._lock:
+            if call['duration'] != None:
+                return # already finished
+            call['duration'] = time.time() - call['started']
+            call['exitCode'] = exitCode
+            if bytesRead != None:
+                call['bytesRead'] = bytesRead
+            if bytesWritten != None:
+                call['bytesWritten'] = bytesWritten
+            self._counters['git.seconds'] = self._counters.get('git.seconds', 0.0) + call['duration']
+            if exitCode != 0:
+                self._counters['git.failed'] = self._counters.get('git.failed', 0) + 1
+            self.__write_trace(call)
+
+    def count(self, name, amount=1):
+        """ Increments a named counter (like 'status-cache.hit'). """
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def get_calls(self):
+        """ Returns copies of the recorded git-calls, oldest first. """
+
+        with self._lock:
+            return [dict(call) for call in self._calls]
+
+    def get_counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def __write_trace(self, call):
+        if self._tracePath == None:
+            return
+        try:
+            if self._traceFile == None:
+                self._traceFile = open(self._tracePath, "a")
+            self._traceFile.write(json.dumps(call) + "\n")
+            self._traceFile.flush()
+        except OSError as error:
+            print(error)
+            self._tracePath = None
+
+def get_caller(depth=3):
+    """ Describes the code that called into git as 'module.function' frames, innermost first. """
+
+    frames = []
+    frame = sys._getframe(1)
+    while frame != None and len(frames) < depth:
+        if frame.f_code.co_filename != __file__:
+            moduleName = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+            frames.append(moduleName + "." + frame.f_code.co_name)
+        frame = frame.f_back
+    return " < ".join(frames)
+
+def run_git(gitpath, arguments, inputData=None, cwd=None):
+    """
+    Runs git (with the given arguments on a work-dir) to completion.
+    Returns (exit-code, stdout, stderr) as bytes.
+    """
+
+    argv = git_command(gitpath, arguments)
+    trace = GitTrace.get_shared()
+    call = trace.start_call(argv, cwd)
+    try:
+        sp = subprocess.Popen(argv, cwd=cwd,
+            stdin=PIPE if inputData != None else subprocess.DEVNULL, stdout=PIPE, stderr=PIPE)
+    except OSError:
+        trace.finish_call(call, None)
+        raise
+    output, err = sp.communicate(inputData)
+    trace.finish_call(call, sp.returncode, len(output), len(inputData) if inputData != None else 0)
+    return (sp.returncode, output, err)
+
+class CountingReader:
+    """ Wraps the stdout-pipe of a git-process and counts the bytes read from it. """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytesRead = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.bytesRead += len(data)
+        return data
+
+    def read1(self, size=-1):
+        data = self._stream.read1(size)
+        self.bytesRead += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self._stream.readline(size)
+        self.bytesRead += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = self._stream.readinto(buffer)
+        self.bytesRead += count or 0
+        return count
+
+    def fileno(self):
+        return self._stream.fileno()
+
+    def close(self):
+        self._stream.close()
+
+class GitProcess:
+    """
+    A git-process whose output is streamed (or that keeps running, like 'cat-file --batch').
+    Behaves like the used parts of subprocess.Popen; the call is recorded when the process got waited for.
+    """
+
+    def __init__(self, gitpath, arguments, stdin=subprocess.DEVNULL, stdout=PIPE, stderr=subprocess.DEVNULL, cwd=None,
+                 environment=None, newSession=False):
+        """
+        environment: variables to set for git (in addition to the own ones).
+        newSession: detaches git from the terminal gedit may have been started in, so it cannot ask for anything;
+                    kill() then also ends the processes started by git (like ssh or upload-pack).
+        """
+
+        argv = git_command(gitpath, arguments)
+        env = None
+        if environment != None:
+            env = dict(os.environ)
+            env.update(environment)
+        self._newSession = newSession
+        self._trace = GitTrace.get_shared()
+        self._call = self._trace.start_call(argv, cwd)
+        try:
+            self._process = subprocess.Popen(argv, stdin=stdin, stdout=stdout, stderr=stderr, cwd=cwd,
+                env=env, start_new_session=newSession)
+        except OSError:
+            self._trace.finish_call(self._call, None)
+            raise
+        self.stdin = self._process.stdin
+        self.stdout = CountingReader(self._process.stdout) if self._process.stdout != None else None
+        self.stderr = self._process.stderr
+
+    @property
+    def returncode(self):
+        return self._process.returncode
+
+    def poll(self):
+        result = self._process.poll()
+        if result != None:
+            self.__finish()
+        return result
+
+    def wait(self, timeout=None):
+        result = self._process.wait(timeout)
+        self.__finish()
+        return result
+
+    def kill(self):
+        if self._newSession and self._process.returncode == None:
+            try:
+                os.killpg(self._process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass # already gone
+        else:
+            self._process.kill()
+
+    def copy_stdout(self, target, chunkSize=1024*1024):
+        """
+        Streams the (remaining) output of the process into a binary file in fixed-size chunks, so the output
+        is never held in memory as a whole. Where the kernel allows it (linux), the pipe is spliced into the
+        file without passing through python at all. Nothing must have been read from stdout before.
+        Returns the number of bytes copied.
+        """
+
+        stdout = self.stdout
+        copied = 0
+        if hasattr(os, "splice"):
+            target.flush()
+            try:
+                while True:
+                    count = os.splice(stdout.fileno(), target.fileno(), chunkSize)
+                    if count <= 0:
+                        stdout.bytesRead += copied
+                        return copied
+                    copied += count
+            except OSError:
+                stdout.bytesRead += copied
+                if copied > 0:
+                    raise
+                # the file-system does not support splicing, copy through a buffer instead.
+
+        buffer = bytearray(chunkSize)
+        view = memoryview(buffer)
+        while True:
+            count = stdout.readinto(buffer)
+            if not count:
+                return copied
+            target.write(view[:count])
+            copied += count
+
+    def __finish(self):
+        self._trace.finish_call(self._call, self._process.returncode,
+            self.stdout.bytesRead if self.stdout != None else 0)
@@ -10,13 +10,37 @@
  * @version 1.0
 """
 
-import os
+import hashlib
+from repository_index import RepositoryIndex
 
 def file_get_contents(filename):
     """ retrieves the contents of a file. """
     with open(filename) as f:
         return f.read()
 
+def git_command(gitpath, arguments):
+    """ Builds the command-line for calling git with the given arguments on a work-dir. """
+    gitdir = RepositoryIndex.get_shared().get_git_dir(gitpath)
+    return ['git', '--git-dir='+gitdir, '--work-tree='+gitpath] + arguments
+
+def get_blob_sha(contents):
+    """ Returns the sha git would give a blob with the given contents (bytes). """
+    return hashlib.sha1(b"blob %d\0" % len(contents) + contents).hexdigest()
+
+# the diffrc-value that selects the built-in diff-window (diff_window.DiffWindow) instead of an external program.
+BUILTIN_DIFF_VIEWER = "builtin"
+
+def build_diff_command(diffviewer, filepathA, filepathB):
+    """ Builds the command-line of a diff-viewer from its template (like 'meld %s %s'). """
+    command = []
+    filepaths = [filepathA, filepathB]
+    for part in diffviewer.strip().split(" "):
+        if part == "%s" and len(filepaths) > 0:
+            part = filepaths.pop(0)
+        if len(part) > 0:
+            command.append(part)
+    return command
+
 def group(lst, n):
     """group([0,3,4,10,2,3], 2) => [(0,3), (4,10), (2,3)]
     
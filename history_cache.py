@@ -0,0 +1,257 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from threading import Lock
+from git_runner import GitTrace
+import sqlite3
+import json
+import time
+import os
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS histories (
+        id         INTEGER PRIMARY KEY,
+        repository TEXT NOT NULL,
+        path       TEXT NOT NULL,
+        tip        TEXT NOT NULL,
+        lastUsed   REAL NOT NULL,
+        size       INTEGER NOT NULL,
+        UNIQUE (repository, path)
+    );
+    CREATE TABLE IF NOT EXISTS history_rows (
+        history  INTEGER NOT NULL,
+        sequence INTEGER NOT NULL,
+        commitId TEXT NOT NULL,
+        parents  TEXT NOT NULL,
+        author   TEXT NOT NULL,
+        date     TEXT NOT NULL,
+        message  TEXT NOT NULL,
+        added    INTEGER,
+        removed  INTEGER,
+        path     TEXT,
+        oldPath  TEXT,
+        PRIMARY KEY (history, sequence)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS history_rows_commit ON history_rows (commitId);
+    CREATE TABLE IF NOT EXISTS blames (
+        repository TEXT NOT NULL,
+        commitId   TEXT NOT NULL,
+        path       TEXT NOT NULL,
+        data       TEXT NOT NULL,
+        lastUsed   REAL NOT NULL,
+        size       INTEGER NOT NULL,
+        PRIMARY KEY (repository, commitId, path)
+    );
+"""
+
+def get_cache_directory():
+    """ Returns (and creates) the directory for persistent caches of this plugin. """
+
+    cacheHome = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    directory = os.path.join(cacheHome, "addiks-gitmenu")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+class HistoryCache:
+    """
+    Persistent (SQLite) cache of file-histories (including rename-chains and per-commit line-stats) and blame-results.
+    History below a commit never changes, so a cached history is keyed by its tip and only the commits
+    between that tip and the current HEAD need to be asked from git.
+    The cache is bounded in size; least recently used histories and blames are evicted first.
+    """
+
+    __shared = None
+
+    @classmethod
+    def get_shared(cls):
+        """ Returns the cache in the user's cache-directory, or None if it cannot be opened. """
+
+        if cls.__shared == None:
+            try:
+                cls.__shared = HistoryCache(os.path.join(get_cache_directory(), "history.sqlite"))
+            except (OSError, sqlite3.Error) as error:
+                print(error)
+        return cls.__shared
+
+    def __init__(self, databasePath, maxBytes=64*1024*1024):
+        self._maxBytes = maxBytes
+        self._lock = Lock()
+        self._connection = sqlite3.connect(databasePath, check_same_thread=False)
+        self._connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(SCHEMA)
+        self._connection.commit()
+
+    def load_history(self, repository, path, batchSize=500):
+        """
+        Returns (tip, batches) of a cached history, or None if nothing is cached for this file.
+        'batches' yields lists of rows (newest first, with the fields of a HistoryEntry); every batch is only read
+        when it is asked for, so the first rows can be shown before a long history got read completely.
+        """
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, tip FROM histories WHERE repository = ? AND path = ?", (repository, path)
+            ).fetchone()
+            if row == None:
+                GitTrace.get_shared().count('history-cache.miss')
+                return None
+            GitTrace.get_shared().count('history-cache.hit')
+            historyId, tip = row
+            self._connection.execute("UPDATE histories SET lastUsed = ? WHERE id = ?", (time.time(), historyId))
+            self._connection.commit()
+        return (tip, self.__read_rows(historyId, batchSize))
+
+    def __read_rows(self, historyId, batchSize):
+        beforeSequence = None
+        while True:
+            with self._lock:
+                if beforeSequence == None:
+                    rows = self._connection.execute(
+                        "SELECT sequence, commitId, parents, author, date, message, added, removed, path, oldPath "
+                        "FROM history_rows WHERE history = ? ORDER BY sequence DESC LIMIT ?", (historyId, batchSize)
+                    ).fetchall()
+                else:
+                    rows = self._connection.execute(
+                        "SELECT sequence, commitId, parents, author, date, message, added, removed, path, oldPath "
+                        "FROM history_rows WHERE history = ? AND sequence < ? ORDER BY sequence DESC LIMIT ?",
+                        (historyId, beforeSequence, batchSize)
+                    ).fetchall()
+            if len(rows) <= 0:
+                return
+
+            batch = []
+            for sequence, commitId, parents, author, date, message, added, removed, entryPath, oldPath in rows:
+                parents = parents.split(" ") if len(parents) > 0 else []
+                batch.append((commitId, parents, author, date, message, added, removed, entryPath, oldPath))
+            beforeSequence = rows[-1][0]
+            yield batch
+
+    def store_history(self, repository, path, tip, newEntries, replace):
+        """
+        Stores the history of a file up to the commit 'tip'.
+        newEntries (newest first) are added on top of the already cached rows, unless replace is True.
+        """
+
+        size = sum(self.__entry_size(entry) for entry in newEntries)
+
+        with self._lock:
+            connection = self._connection
+            row = connection.execute(
+                "SELECT id, size FROM histories WHERE repository = ? AND path = ?", (repository, path)
+            ).fetchone()
+
+            if row != None and replace:
+                connection.execute("DELETE FROM history_rows WHERE history = ?", (row[0], ))
+                connection.execute("DELETE FROM histories WHERE id = ?", (row[0], ))
+                row = None
+
+            if row == None:
+                cursor = connection.execute(
+                    "INSERT INTO histories (repository, path, tip, lastUsed, size) VALUES (?, ?, ?, ?, ?)",
+                    (repository, path, tip, time.time(), size)
+                )
+                historyId = cursor.lastrowid
+                nextSequence = 0
+            else:
+                historyId = row[0]
+                connection.execute(
+                    "UPDATE histories SET tip = ?, lastUsed = ?, size = ? WHERE id = ?",
+                    (tip, time.time(), row[1] + size, historyId)
+                )
+                nextSequence = connection.execute(
+                    "SELECT COALESCE(MAX(sequence), -1) + 1 FROM history_rows WHERE history = ?", (historyId, )
+                ).fetchone()[0]
+
+            connection.executemany(
+                "INSERT INTO history_rows (history, sequence, commitId, parents, author, date, message, "
+                "added, removed, path, oldPath) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(historyId, nextSequence + index, entry.commitId, " ".join(entry.parents), entry.author,
+                  entry.date, entry.message, entry.added, entry.removed, entry.path, entry.oldPath)
+                 for index, entry in enumerate(reversed(newEntries))]
+            )
+            connection.commit()
+            self.__evict()
+
+    def load_blame(self, repository, commitId, path):
+        """ Returns a cached blame-result (as stored by store_blame) or None. """
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM blames WHERE repository = ? AND commitId = ? AND path = ?",
+                (repository, commitId, path)
+            ).fetchone()
+            if row == None:
+                GitTrace.get_shared().count('blame-cache.miss')
+                return None
+            GitTrace.get_shared().count('blame-cache.hit')
+            self._connection.execute(
+                "UPDATE blames SET lastUsed = ? WHERE repository = ? AND commitId = ? AND path = ?",
+                (time.time(), repository, commitId, path)
+            )
+            self._connection.commit()
+        return json.loads(row[0])
+
+    def store_blame(self, repository, commitId, path, blame):
+        """ Stores a (json-serializable) blame-result of a file at a commit. """
+
+        data = json.dumps(blame)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO blames (repository, commitId, path, data, lastUsed, size) VALUES (?, ?, ?, ?, ?, ?)",
+                (repository, commitId, path, data, time.time(), len(data))
+            )
+            self._connection.commit()
+            self.__evict()
+
+    def get_size(self):
+        """ Returns the (estimated) number of bytes the cached data uses. """
+
+        with self._lock:
+            return self.__get_size()
+
+    def __get_size(self):
+        connection = self._connection
+        return (connection.execute("SELECT COALESCE(SUM(size), 0) FROM histories").fetchone()[0] +
+                connection.execute("SELECT COALESCE(SUM(size), 0) FROM blames").fetchone()[0])
+
+    def __evict(self):
+        """ Removes least recently used entries until the cache fits into its size-limit. """
+
+        connection = self._connection
+        totalSize = self.__get_size()
+        if totalSize <= self._maxBytes:
+            return
+
+        candidates = connection.execute(
+            "SELECT lastUsed, 'history', id, NULL, NULL, size FROM histories "
+            "UNION ALL SELECT lastUsed, 'blame', repository, commitId, path, size FROM blames "
+            "ORDER BY lastUsed ASC"
+        ).fetchall()
+
+        for lastUsed, kind, key, commitId, path, size in candidates:
+            if totalSize <= self._maxBytes:
+                break
+            if kind == 'history':
+                connection.execute("DELETE FROM history_rows WHERE history = ?", (key, ))
+                connection.execute("DELETE FROM histories WHERE id = ?", (key, ))
+            else:
+                connection.execute(
+                    "DELETE FROM blames WHERE repository = ? AND commitId = ? AND path = ?", (key, commitId, path)
+                )
+            totalSize -= size
+
+        connection.commit()
+        connection.execute("PRAGMA incremental_vacuum")
+
+    def __entry_size(self, entry):
+        return 80 + len(entry.author) + len(entry.date) + len(entry.message) + len(entry.path or "") + len(entry.oldPath or "")
@@ -0,0 +1,288 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from threading import Thread, Condition
+from collections import namedtuple
+from git_runner import GitProcess, run_git
+import time
+
+# every commit starts with \x1e, its fields are separated by \x1f; -z terminates header and numstat-fields with NUL.
+HISTORY_FORMAT = "%x1e%H%x1f%P%x1f%an%x1f%ad%x1f%s"
+
+# added/removed are None for binary files and commits without changes on the file (merges),
+# oldPath is set when the file was renamed in that commit.
+HistoryEntry = namedtuple("HistoryEntry", [
+    "commitId", "parents", "author", "date", "message", "added", "removed", "path", "oldPath"
+])
+
+class HistoryLogParser:
+    """
+    Incrementally parses the output of 'git log -z --numstat --format=HISTORY_FORMAT'.
+    Feed it chunks of bytes; it returns the commits that are complete so far.
+    """
+
+    def __init__(self):
+        self._rest = b""
+        self._current = None
+        self._pendingPaths = 0
+
+    def feed(self, chunk):
+        tokens = (self._rest + chunk).split(b"\0")
+        self._rest = tokens.pop()
+        return self.__parse_tokens(tokens)
+
+    def finish(self):
+        """ Parses everything that is left and returns the last commits. """
+
+        tokens = [self._rest]
+        self._rest = b""
+        result = self.__parse_tokens(tokens)
+        if self._current != None:
+            result.append(HistoryEntry(**self._current))
+            self._current = None
+        return result
+
+    def __parse_tokens(self, tokens):
+        result = []
+        for token in tokens:
+            token = token.lstrip(b"\n")
+            if len(token) <= 0 and self._pendingPaths <= 0:
+                continue
+
+            if token[:1] == b"\x1e":
+                if self._current != None:
+                    result.append(HistoryEntry(**self._current))
+                self._current = self.__parse_header(token[1:])
+                self._pendingPaths = 0
+
+            elif self._current == None:
+                continue
+
+            elif self._pendingPaths > 0:
+                # renamed file: "added \t removed \t" is followed by the old and the new path.
+                path = token.decode(errors="surrogateescape")
+                if self._pendingPaths == 2:
+                    self._current['oldPath'] = path
+                else:
+                    self._current['path'] = path
+                self._pendingPaths -= 1
+
+            elif b"\t" in token:
+                added, removed, path = token.decode(errors="surrogateescape").split("\t", 2)
+                self._current['added'] = int(added) if added.isdigit() else None
+                self._current['removed'] = int(removed) if removed.isdigit() else None
+                if len(path) > 0:
+                    self._current['path'] = path
+                else:
+                    self._pendingPaths = 2
+
+        return result
+
+    def __parse_header(self, token):
+        fields = token.decode(errors="replace").split("\x1f")
+        while len(fields) < 5:
+            fields.append("")
+        commitId, parents, author, date, message = fields[:5]
+        return {
+            'commitId': commitId,
+            'parents':  parents.split(" ") if len(parents) > 0 else [],
+            'author':   author,
+            'date':     date,
+            'message':  message.strip(),
+            'added':    None,
+            'removed':  None,
+            'path':     None,
+            'oldPath':  None,
+        }
+
+class HistoryLoader:
+    """
+    Streams the history of a file from 'git log' in a background-thread.
+    Parsed commits are handed to a callback in batches, one page at a time;
+    further pages are only delivered when they are requested.
+
+    The output of git is parsed while it streams in, so the first page is delivered as soon as it got parsed,
+    long before git has walked the whole history.
+
+    If a history-cache is given, a cached history is reused: only the commits between the cached tip and
+    the current HEAD are asked from git, and the result is written back into the cache.
+    The cached rows are read in batches, so they as well do not need to be read completely for the first page.
+    """
+
+    def __init__(self, gitpath, filepath, deliver, pageSize=200, flushInterval=0.05, historyCache=None,
+                 logArguments=()):
+        """
+        'deliver' will be called from the reader-thread with a list of HistoryEntry's
+        and a flag telling if the history is complete.
+        'logArguments' are passed on to 'git log' to only list some of the commits (like ['-S', 'text']);
+        such a partial history is never cached.
+        """
+
+        self._gitpath = gitpath
+        self._filepath = filepath
+        self._deliver = deliver
+        self._pageSize = pageSize
+        self._flushInterval = flushInterval
+        self._historyCache = historyCache
+        self._logArguments = list(logArguments)
+        self._condition = Condition()
+        self._entries = []
+        self._wantedRows = pageSize
+        self._loadedRows = 0
+        self._lastFlush = time.time()
+        self._cancelled = False
+        self._finished = False
+        self._process = None
+        self._thread = None
+
+    def start(self):
+        """ Starts the reader-thread. """
+
+        self._thread = Thread(target=self.__run, daemon=True)
+        self._thread.start()
+
+    def request_more(self):
+        """ Allows the reader to deliver the next page. """
+
+        with self._condition:
+            if self._wantedRows <= self._loadedRows:
+                self._wantedRows = self._loadedRows + self._pageSize
+                self._condition.notify_all()
+
+    def cancel(self):
+        """ Stops loading; the git-process is terminated and no more batches will be delivered. """
+
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+        process = self._process
+        if process != None and process.poll() == None:
+            process.kill()
+
+    def is_finished(self):
+        return self._finished
+
+    def __run(self):
+        gitpath = self._gitpath
+        filerelpath = self._filepath[len(gitpath)+1:]
+        historyCache = self._historyCache
+
+        try:
+            head = self.__git_output(['rev-parse', '--verify', '-q', 'HEAD']).strip()
+            if len(head) <= 0 or len(self._logArguments) > 0:
+                historyCache = None # no commits yet, or only searching the history
+
+            cachedBatches = None
+            revisionRange = 'HEAD'
+            if historyCache != None:
+                revisionRange = head
+                cached = historyCache.load_history(gitpath, filerelpath)
+                if cached != None:
+                    tip, batches = cached
+                    if tip == head or self.__is_ancestor(tip, head):
+                        revisionRange = None if tip == head else tip + ".." + head
+                        cachedBatches = batches
+
+            newEntries = []
+            if revisionRange != None:
+                newEntries = self.__read_log(revisionRange)
+
+            # the cached commits are older than the new ones, they follow them.
+            for rows in (cachedBatches or []):
+                if self._cancelled:
+                    return
+                self.__add([HistoryEntry._make(row) for row in rows], False)
+
+            if self._cancelled:
+                return
+
+            self.__add([], True)
+            self.__deliver_remaining()
+
+            if historyCache != None and revisionRange != None and not self._cancelled:
+                historyCache.store_history(gitpath, filerelpath, head, newEntries, cachedBatches == None)
+
+        except (OSError, ValueError) as error:
+            if not self._cancelled:
+                print(error)
+
+    def __read_log(self, revisionRange):
+        """ Streams 'git log' (for the given range) into the entry-buffer; returns the entries that were read. """
+
+        self._process = GitProcess(self._gitpath, ['log', '--follow', '--full-history', '--numstat',
+             '-z', '--format='+HISTORY_FORMAT] + self._logArguments + [revisionRange, '--', self._filepath])
+        process = self._process
+        parser = HistoryLogParser()
+        entries = []
+        try:
+            while not self._cancelled:
+                chunk = process.stdout.read1(65536)
+                if len(chunk) <= 0:
+                    break
+                newEntries = parser.feed(chunk)
+                entries += newEntries
+                self.__add(newEntries, False)
+
+            if not self._cancelled:
+                newEntries = parser.finish()
+                entries += newEntries
+                self.__add(newEntries, False)
+        finally:
+            process.stdout.close()
+            process.wait()
+        return entries
+
+    def __add(self, entries, force):
+        """ Buffers entries and delivers what the current page (or the flush-interval) allows. """
+
+        with self._condition:
+            self._entries += entries
+            pageIsFull = len(self._entries) >= self._wantedRows
+        if force or pageIsFull or time.time() - self._lastFlush >= self._flushInterval:
+            self.__flush()
+
+    def __flush(self):
+        with self._condition:
+            if self._cancelled:
+                return
+            end = min(len(self._entries), self._wantedRows)
+            batch = self._entries[self._loadedRows:end]
+            self._loadedRows = max(self._loadedRows, end)
+            self._lastFlush = time.time()
+        if len(batch) > 0:
+            self._deliver(batch, False)
+
+    def __deliver_remaining(self):
+        """ Waits for page-requests until every buffered entry got delivered. """
+
+        while True:
+            self.__flush()
+            with self._condition:
+                while (not self._cancelled and
+                       self._loadedRows >= self._wantedRows and
+                       self._loadedRows < len(self._entries)):
+                    self._condition.wait()
+                if self._cancelled:
+                    return
+                if self._loadedRows >= len(self._entries):
+                    break
+
+        self._finished = True
+        self._deliver([], True)
+
+    def __git_output(self, arguments):
+        exitCode, output, err = run_git(self._gitpath, arguments)
+        return output.decode()
+
+    def __is_ancestor(self, commitA, commitB):
+        exitCode, output, err = run_git(self._gitpath, ['merge-base', '--is-ancestor', commitA, commitB])
+        return exitCode == 0
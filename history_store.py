@@ -0,0 +1,232 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from array import array
+from bisect import bisect_right
+import binascii
+import sys
+
+# flags of a row (a commit): what kind of change it made to the file.
+ROW_MERGE     = 1 # the commit has more than one parent
+ROW_RENAMED   = 2 # the file got renamed (the old path is known)
+ROW_BINARY    = 4 # changed, but git cannot count lines (binary file)
+ROW_UNCHANGED = 8 # no change listed for the file (merges, or only whitespace when the log ignored it)
+
+class HistoryStore:
+    """
+    Compact, append-only, column-wise storage of a file-history (the HistoryEntry's of the history-loader).
+    No python-object is kept per commit: commit-ids are packed as 20 binary bytes into one buffer,
+    authors are interned and referenced by number, and dates and messages are utf-8 in one text-buffer
+    addressed by offsets. Rows are only turned back into strings when asked for (i.e. when they are shown).
+    The path of the file only changes at renames, so it is only kept for the rows where it differs from the
+    row above (one run per name, looked up by bisection); the old paths of renamed revisions are kept in a dict by row.
+    The line-stats of every commit (from the numstat of the same log) are kept as numbers, plus a byte of ROW_* flags.
+    """
+
+    def __init__(self):
+        self._commitIds = bytearray()
+        self._authorIndexes = array('I')
+        self._authors = []
+        self._authorIndexByName = {}
+        self._texts = bytearray()
+        self._textOffsets = array('Q', [0]) # per row: start of date, start of message; plus the end
+        self._pathRows = array('I') # first row of every run of rows with the same path
+        self._pathNames = []
+        self._olderPath = None # path of the file below the last row: its old path if that row renamed it
+        self._oldPaths = {}
+        self._added = array('i')   # -1 if unknown (binary or unchanged)
+        self._removed = array('i')
+        self._flags = array('B')
+
+    def __len__(self):
+        return len(self._authorIndexes)
+
+    def append(self, entries):
+        """ Appends HistoryEntry's at the end; returns the row-index of the first one. """
+
+        firstRow = len(self)
+        for entry in entries:
+            self._commitIds += binascii.unhexlify(entry.commitId)
+
+            authorIndex = self._authorIndexByName.get(entry.author)
+            if authorIndex == None:
+                authorIndex = len(self._authors)
+                self._authors.append(entry.author)
+                self._authorIndexByName[entry.author] = authorIndex
+            self._authorIndexes.append(authorIndex)
+
+            self._texts += entry.date.encode("utf-8", "surrogateescape")
+            self._textOffsets.append(len(self._texts))
+            self._texts += entry.message.encode("utf-8", "surrogateescape")
+            self._textOffsets.append(len(self._texts))
+
+            row = len(self._authorIndexes) - 1
+            flags = 0
+            path = entry.path if entry.path != None else self._olderPath
+            if path != None and (len(self._pathNames) <= 0 or self._pathNames[-1] != path):
+                self._pathRows.append(row)
+                self._pathNames.append(path)
+            self._olderPath = entry.oldPath if entry.oldPath != None else path
+
+            if entry.path != None:
+                if entry.added == None:
+                    flags |= ROW_BINARY
+            else:
+                flags |= ROW_UNCHANGED
+            if entry.oldPath != None:
+                self._oldPaths[row] = entry.oldPath
+                flags |= ROW_RENAMED
+            if len(entry.parents) > 1:
+                flags |= ROW_MERGE
+            self._flags.append(flags)
+            self._added.append(entry.added if entry.added != None else -1)
+            self._removed.append(entry.removed if entry.removed != None else -1)
+        return firstRow
+
+    def get_commit_id(self, row):
+        return binascii.hexlify(self._commitIds[row * 20:row * 20 + 20]).decode()
+
+    def get_author(self, row):
+        return self._authors[self._authorIndexes[row]]
+
+    def get_date(self, row):
+        return self.__get_text(row * 2)
+
+    def get_message(self, row):
+        return self.__get_text(row * 2 + 1)
+
+    def get_path(self, row):
+        """
+        Returns the path of the file in the commit of a row: the path listed by that row, otherwise the one
+        carried down from the nearest row above (its old path if it renamed the file), or None if no row did.
+        """
+
+        run = bisect_right(self._pathRows, row) - 1
+        return self._pathNames[run] if run >= 0 else None
+
+    def get_old_path(self, row):
+        """ Returns the path the file had before it got renamed in the commit of a row, otherwise None. """
+
+        return self._oldPaths.get(row)
+
+    def get_added(self, row):
+        """ Returns the number of lines the commit of a row added to the file, or None if unknown (binary, unchanged). """
+
+        added = self._added[row]
+        return added if added >= 0 else None
+
+    def get_removed(self, row):
+        removed = self._removed[row]
+        return removed if removed >= 0 else None
+
+    def get_flags(self, row):
+        """ Returns the ROW_* flags of a row. """
+
+        return self._flags[row]
+
+    def get_memory_size(self):
+        """ Returns the (approximate) number of bytes used by the stored rows. """
+
+        return (len(self._commitIds) + len(self._texts)
+              + self._authorIndexes.itemsize * len(self._authorIndexes)
+              + self._textOffsets.itemsize * len(self._textOffsets)
+              + self._added.itemsize * len(self._added) * 2 + len(self._flags)
+              + sum(sys.getsizeof(author) for author in self._authors)
+              + self._pathRows.itemsize * len(self._pathRows)
+              + sum(sys.getsizeof(path) for path in self._pathNames)
+              + sum(sys.getsizeof(path) for path in self._oldPaths.values()))
+
+    def __get_text(self, index):
+        offsets = self._textOffsets
+        return self._texts[offsets[index]:offsets[index + 1]].decode("utf-8", "surrogateescape")
+
+class HistoryIndex:
+    """
+    Search-index over author, date and message of every row of a HistoryStore, for filtering while typing.
+    The rows are kept as one lower-cased text (one line per row) that is scanned with str.find, and a query
+    that only extends the previous one (the user typed on) just re-checks the rows that matched before.
+    Rows appended to the store are indexed on the next search.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._text = ""
+        self._lineStarts = array('Q')
+        self._indexedRows = 0
+        self._lastQuery = None
+        self._lastRows = None
+        self._lastRowCount = 0
+
+    def search(self, query):
+        """
+        Returns the rows (ascending) whose author, date or message contain every word of the query (ignoring case),
+        or None if the query is empty (every row matches).
+        """
+
+        self.__update()
+        query = query.lower()
+        words = query.split()
+        if len(words) <= 0:
+            return None
+
+        if self._lastQuery != None and query.startswith(self._lastQuery):
+            # every row matching the refined query also matched the previous one.
+            candidates = list(self._lastRows) + list(range(self._lastRowCount, self._indexedRows))
+            rows = [row for row in candidates if self.__line_matches(row, words)]
+        else:
+            rows = self.__scan(words)
+
+        self._lastQuery = query
+        self._lastRows = rows
+        self._lastRowCount = self._indexedRows
+        return rows
+
+    def __scan(self, words):
+        """ Finds the rows containing all words by searching the whole text for the longest one. """
+
+        text = self._text
+        lineStarts = self._lineStarts
+        longestWord = max(words, key=len)
+        rows = []
+        position = text.find(longestWord)
+        checkLine = len(words) > 1
+        while position >= 0:
+            row = bisect_right(lineStarts, position) - 1
+            if not checkLine or self.__line_matches(row, words):
+                rows.append(row)
+            lineEnd = text.find("\n", position)
+            position = text.find(longestWord, lineEnd + 1)
+        return rows
+
+    def __line_matches(self, row, words):
+        lineStarts = self._lineStarts
+        end = lineStarts[row + 1] if row + 1 < len(lineStarts) else len(self._text)
+        line = self._text[lineStarts[row]:end]
+        for word in words:
+            if word not in line:
+                return False
+        return True
+
+    def __update(self):
+        store = self._store
+        if self._indexedRows >= len(store):
+            return
+        lines = []
+        offset = len(self._text)
+        for row in range(self._indexedRows, len(store)):
+            line = "\x1f".join([store.get_author(row), store.get_date(row), store.get_message(row)])
+            line = line.lower().replace("\n", " ") + "\n"
+            self._lineStarts.append(offset)
+            offset += len(line)
+            lines.append(line)
+        self._text += "".join(lines)
+        self._indexedRows = len(store)
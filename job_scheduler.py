@@ -0,0 +1,213 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from threading import Thread, Condition, current_thread
+import heapq
+import time
+import traceback
+
+PRIORITY_HIGH       = 0
+PRIORITY_DEFAULT    = 100
+PRIORITY_BACKGROUND = 200
+
+class Job:
+    """ One unit of work waiting in (or running on) the scheduler. """
+
+    __slots__ = ("key", "group", "priority", "function", "arguments", "onDone", "onError", "enqueuedAt",
+                 "sequence")
+
+    def __init__(self, key, group, priority, function, arguments, onDone, onError, sequence):
+        self.key        = key
+        self.group      = group
+        self.priority   = priority
+        self.function   = function
+        self.arguments  = arguments
+        self.onDone     = onDone
+        self.onError    = onError
+        self.enqueuedAt = time.time()
+        self.sequence   = sequence
+
+class JobScheduler:
+    """
+    Runs jobs on a bounded pool of worker-threads.
+
+    - Jobs with the same key are coalesced: a pending job is replaced by the newer one,
+      and a key never runs on two workers at the same time.
+    - Submitting a job into a group drops all other pending jobs of that group (they got superseded).
+    - Jobs with a lower priority-value run first.
+    - The result of a job is handed to its onDone-callback (or the exception it raised to its onError-callback)
+      through the dispatcher (GLib.idle_add when used from GTK, so the callback runs in the main-thread).
+    """
+
+    __shared = None
+
+    @classmethod
+    def get_shared(cls):
+        """ Returns the scheduler shared by all windows (results dispatched into the GTK main-loop). """
+
+        if cls.__shared == None:
+            from gi.repository import GLib
+            cls.__shared = JobScheduler(2, GLib.idle_add)
+        return cls.__shared
+
+    def __init__(self, maxWorkers=2, dispatcher=None):
+        self._maxWorkers = maxWorkers
+        self._dispatcher = dispatcher
+        self._condition = Condition()
+        self._queue = []        # heap of (priority, sequence, key)
+        self._pending = {}      # key => Job
+        self._running = set()   # keys
+        self._workers = []
+        self._idleWorkers = 0
+        self._sequence = 0
+        self._stopped = False
+        self._statistics = {
+            'submitted': 0,
+            'coalesced': 0,
+            'superseded': 0,
+            'completed': 0,
+            'failed': 0,
+            'latencyTotal': 0.0,
+            'latencyMax': 0.0,
+            'durationTotal': 0.0,
+            'durationMax': 0.0,
+        }
+
+    def submit(self, key, function, arguments=(), priority=PRIORITY_DEFAULT, group=None, onDone=None, onError=None):
+        """
+        Schedules function(*arguments) to be run on a worker.
+        onDone (if given) will be called with the return-value of the function;
+        if the function raised, onError (if given) will be called with the exception instead.
+        """
+
+        with self._condition:
+            if self._stopped:
+                return
+            self._statistics['submitted'] += 1
+
+            if group != None:
+                for otherKey, otherJob in list(self._pending.items()):
+                    if otherJob.group == group and otherKey != key:
+                        del self._pending[otherKey]
+                        self._statistics['superseded'] += 1
+
+            if key in self._pending:
+                self._statistics['coalesced'] += 1
+                priority = min(priority, self._pending[key].priority)
+
+            self._sequence += 1
+            job = Job(key, group, priority, function, arguments, onDone, onError, self._sequence)
+            self._pending[key] = job
+            heapq.heappush(self._queue, (priority, job.sequence, key))
+
+            if self._idleWorkers <= 0 and len(self._workers) < self._maxWorkers:
+                worker = Thread(target=self.__work, daemon=True)
+                self._workers.append(worker)
+                worker.start()
+            self._condition.notify()
+
+    def cancel(self, key):
+        """ Drops a pending job (a job that already runs will finish). """
+
+        with self._condition:
+            if key in self._pending:
+                del self._pending[key]
+
+    def shutdown(self):
+        """ Drops all pending jobs and lets the workers terminate. """
+
+        with self._condition:
+            self._stopped = True
+            self._pending = {}
+            self._queue = []
+            self._condition.notify_all()
+
+    def get_statistics(self):
+        """ Returns queue-depth and latency-numbers (in seconds) for debugging. """
+
+        with self._condition:
+            statistics = dict(self._statistics)
+            statistics['queueDepth'] = len(self._pending)
+            statistics['running'] = len(self._running)
+            statistics['workers'] = len(self._workers)
+            started = statistics['completed'] + statistics['failed']
+            statistics['latencyAverage'] = statistics['latencyTotal'] / started if started > 0 else 0.0
+            statistics['durationAverage'] = statistics['durationTotal'] / started if started > 0 else 0.0
+            return statistics
+
+    def __next_job(self):
+        """ Pops the next runnable job from the queue; must be called with the condition held. """
+
+        deferred = []
+        job = None
+        while len(self._queue) > 0:
+            entry = heapq.heappop(self._queue)
+            priority, sequence, key = entry
+            candidate = self._pending.get(key)
+            if candidate == None or candidate.sequence != sequence:
+                continue # superseded or coalesced into a newer entry
+            if key in self._running:
+                deferred.append(entry)
+                continue
+            job = candidate
+            del self._pending[key]
+            break
+        for entry in deferred:
+            heapq.heappush(self._queue, entry)
+        return job
+
+    def __work(self):
+        while True:
+            with self._condition:
+                job = self.__next_job()
+                while job == None and not self._stopped:
+                    self._idleWorkers += 1
+                    self._condition.wait()
+                    self._idleWorkers -= 1
+                    job = self.__next_job()
+                if job == None:
+                    self._workers.remove(current_thread())
+                    return
+                self._running.add(job.key)
+                latency = time.time() - job.enqueuedAt
+
+            startedAt = time.time()
+            failed = False
+            result = None
+            try:
+                result = job.function(*job.arguments)
+            except Exception as exception:
+                failed = True
+                result = exception
+                traceback.print_exc()
+            duration = time.time() - startedAt
+
+            with self._condition:
+                self._running.discard(job.key)
+                statistics = self._statistics
+                statistics['failed' if failed else 'completed'] += 1
+                statistics['latencyTotal'] += latency
+                statistics['latencyMax'] = max(statistics['latencyMax'], latency)
+                statistics['durationTotal'] += duration
+                statistics['durationMax'] = max(statistics['durationMax'], duration)
+                self._condition.notify_all()
+
+            callback = job.onError if failed else job.onDone
+            if callback != None:
+                if self._dispatcher != None:
+                    self._dispatcher(self.__call_once, callback, result)
+                else:
+                    callback(result)
+
+    def __call_once(self, callback, result):
+        callback(result)
+        return False # for GLib.idle_add: do not repeat
@@ -0,0 +1,550 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from collections import OrderedDict
+from threading import RLock
+import binascii
+import mmap
+import os
+import struct
+import zlib
+
+OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+class ObjectReaderError(Exception):
+    """ Raised when the object-reader cannot handle something; callers should fall back to the git CLI. """
+    pass
+
+def read_delta_size(delta, offset):
+    """ Reads one of the two sizes (base, result) at the start of a delta; returns (size, offset after it). """
+
+    size = 0
+    shift = 0
+    while True:
+        byte = delta[offset]
+        offset += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return size, offset
+
+def apply_delta(base, delta):
+    """ Applies a git delta (as found in packfiles) onto a base-object. """
+
+    baseSize, offset = read_delta_size(delta, 0)
+    resultSize, offset = read_delta_size(delta, offset)
+    if baseSize != len(base):
+        raise ObjectReaderError("delta does not match its base")
+
+    result = bytearray()
+    deltaLength = len(delta)
+    while offset < deltaLength:
+        opcode = delta[offset]
+        offset += 1
+        if opcode & 0x80:
+            # copy from base
+            copyOffset = 0
+            copySize = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    copyOffset |= delta[offset] << (i * 8)
+                    offset += 1
+            for i in range(3):
+                if opcode & (1 << (4 + i)):
+                    copySize |= delta[offset] << (i * 8)
+                    offset += 1
+            if copySize == 0:
+                copySize = 0x10000
+            result += base[copyOffset:copyOffset + copySize]
+        elif opcode > 0:
+            # insert literal data
+            result += delta[offset:offset + opcode]
+            offset += opcode
+        else:
+            raise ObjectReaderError("invalid delta opcode")
+
+    if len(result) != resultSize:
+        raise ObjectReaderError("delta produced wrong size")
+    return bytes(result)
+
+def is_ref_path(refname):
+    """ Checks that a ref-name is 'HEAD' or below 'refs/', so it can safely be looked up as a file in the git-dir. """
+
+    if refname == "HEAD":
+        return True
+    if not refname.startswith("refs/") or "\\" in refname or "\0" in refname:
+        return False
+    return all(part not in ("", ".", "..") for part in refname.split("/"))
+
+class PackIndex:
+    """ A memory-mapped version-2 '.idx' file, searched binary by object-id. """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != b'\xfftOc' or struct.unpack(">I", self._map[4:8])[0] != 2:
+            raise ObjectReaderError("unsupported pack-index version: " + path)
+        self._fanout = struct.unpack(">256I", self._map[8:8 + 1024])
+        self._count = self._fanout[255]
+        self._shaOffset = 8 + 1024
+        self._crcOffset = self._shaOffset + 20 * self._count
+        self._offsetOffset = self._crcOffset + 4 * self._count
+        self._largeOffsetOffset = self._offsetOffset + 4 * self._count
+
+    def find(self, sha):
+        """ Returns the offset of an object (20-byte binary id) in the packfile, or None. """
+
+        first = sha[0]
+        low = self._fanout[first - 1] if first > 0 else 0
+        high = self._fanout[first]
+        shaMap = self._map
+        shaOffset = self._shaOffset
+        while low < high:
+            middle = (low + high) // 2
+            position = shaOffset + middle * 20
+            candidate = shaMap[position:position + 20]
+            if candidate < sha:
+                low = middle + 1
+            elif candidate > sha:
+                high = middle
+            else:
+                return self.__offset(middle)
+        return None
+
+    def __offset(self, index):
+        position = self._offsetOffset + index * 4
+        offset = struct.unpack(">I", self._map[position:position + 4])[0]
+        if offset & 0x80000000:
+            position = self._largeOffsetOffset + (offset & 0x7fffffff) * 8
+            offset = struct.unpack(">Q", self._map[position:position + 8])[0]
+        return offset
+
+    def close(self):
+        self._map.close()
+
+class Pack:
+    """ A packfile together with its index, the packfile is accessed through mmap. """
+
+    def __init__(self, packPath):
+        self.index = PackIndex(packPath[:-5] + ".idx")
+        with open(packPath, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != b'PACK':
+            raise ObjectReaderError("not a packfile: " + packPath)
+
+    def read_entry_header(self, offset):
+        """ Returns (type, size, dataOffset, deltaBase) of an entry; deltaBase is an offset or a binary sha. """
+
+        packMap = self._map
+        byte = packMap[offset]
+        offset += 1
+        objectType = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = packMap[offset]
+            offset += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+
+        deltaBase = None
+        if objectType == OBJ_OFS_DELTA:
+            byte = packMap[offset]
+            offset += 1
+            baseDistance = byte & 0x7f
+            while byte & 0x80:
+                byte = packMap[offset]
+                offset += 1
+                baseDistance = ((baseDistance + 1) << 7) | (byte & 0x7f)
+            deltaBase = baseDistance
+        elif objectType == OBJ_REF_DELTA:
+            deltaBase = packMap[offset:offset + 20]
+            offset += 20
+
+        return objectType, size, offset, deltaBase
+
+    def inflate(self, offset, size):
+        """ Inflates the zlib-stream starting at the given offset into exactly 'size' bytes. """
+
+        decompressor = zlib.decompressobj()
+        result = bytearray()
+        packMap = self._map
+        chunkSize = max(4096, size + 64)
+        while len(result) < size and not decompressor.eof:
+            chunk = packMap[offset:offset + chunkSize]
+            if len(chunk) <= 0:
+                break
+            offset += len(chunk)
+            result += decompressor.decompress(chunk)
+        if len(result) != size:
+            raise ObjectReaderError("corrupt packfile-entry")
+        return bytes(result)
+
+    def inflate_prefix(self, offset, length):
+        """ Inflates only the first 'length' bytes (or less, if the stream is shorter) of the zlib-stream at an offset. """
+
+        decompressor = zlib.decompressobj()
+        result = b""
+        packMap = self._map
+        while len(result) < length and not decompressor.eof:
+            chunk = packMap[offset:offset + 4096]
+            if len(chunk) <= 0:
+                break
+            offset += len(chunk)
+            result += decompressor.decompress(chunk, length - len(result))
+        return result
+
+    def close(self):
+        self._map.close()
+        self.index.close()
+
+class ObjectReader:
+    """
+    Reads objects directly from a git object-database without spawning git.
+    Supports loose objects and version-2 packfiles including OFS/REF deltas.
+    Resolved delta-bases are kept in a small LRU-cache, because history-walks hit the same bases again and again.
+    Like git's 'core.deltaBaseCacheLimit', the cache is bounded by the bytes it holds; objects larger than a
+    quarter of it are not kept at all (they would evict everything else).
+    Anything it cannot handle raises an ObjectReaderError.
+    """
+
+    def __init__(self, gitdir, deltaBaseCacheLimit=16*1024*1024):
+        self._gitdir = gitdir
+        self._objectsDir = os.path.join(gitdir, "objects")
+        commondirPath = os.path.join(gitdir, "commondir")
+        if os.path.exists(commondirPath): # linked work-tree: objects live in the main repository
+            with open(commondirPath) as f:
+                commondir = f.read().strip()
+            self._commonDir = os.path.normpath(os.path.join(gitdir, commondir))
+            self._objectsDir = os.path.join(self._commonDir, "objects")
+        else:
+            self._commonDir = gitdir
+        self._lock = RLock()
+        self._packs = {}
+        self._deltaBaseCache = OrderedDict()
+        self._deltaBaseCacheLimit = deltaBaseCacheLimit
+        self._deltaBaseCacheBytes = 0
+
+        if os.path.exists(os.path.join(self._objectsDir, "info", "alternates")):
+            raise ObjectReaderError("alternate object-databases are not supported")
+
+        configPath = os.path.join(self._commonDir, "config")
+        if os.path.exists(configPath):
+            with open(configPath, errors="replace") as f:
+                if "objectformat" in f.read().lower():
+                    raise ObjectReaderError("only sha1-repositories are supported")
+
+    def read_object(self, sha):
+        """ Returns (type, contents) of the object with the given hex-sha. """
+
+        with self._lock:
+            result = self.__read_loose(sha)
+            if result == None:
+                result = self.__read_packed(binascii.unhexlify(sha))
+            if result == None:
+                raise ObjectReaderError("object not found: " + sha)
+            return result
+
+    def get_object_size(self, sha):
+        """ Returns the size of an object's contents; only its header gets inflated, not the contents. """
+
+        with self._lock:
+            size = self.__read_loose_size(sha)
+            if size == None:
+                size = self.__read_packed_size(binascii.unhexlify(sha))
+            if size == None:
+                raise ObjectReaderError("object not found: " + sha)
+            return size
+
+    def resolve_ref(self, refname):
+        """ Resolves a ref (like 'HEAD', 'master', 'refs/heads/master') or a full sha into a commit-sha. """
+
+        if len(refname) == 40 and all(c in "0123456789abcdef" for c in refname):
+            return refname
+
+        candidates = [refname, "refs/" + refname, "refs/tags/" + refname, "refs/heads/" + refname,
+                      "refs/remotes/" + refname, "refs/remotes/" + refname + "/HEAD"]
+        for candidate in candidates:
+            sha = self.__read_ref(candidate, 0)
+            if sha != None:
+                return self.__peel(sha)
+
+        raise ObjectReaderError("cannot resolve ref: " + refname)
+
+    def get_tree_entry(self, treeSha, path):
+        """ Walks a tree down along a relative path; returns (mode, sha) or None if the path does not exist. """
+
+        entry = ("40000", treeSha)
+        for name in [part for part in path.split("/") if part != ""]:
+            if entry[0] not in ("40000", "040000"):
+                return None
+            entry = self.read_tree(entry[1]).get(name)
+            if entry == None:
+                return None
+        return entry
+
+    def read_tree(self, treeSha):
+        """ Returns the entries of a tree as dict name => (mode, sha). """
+
+        objectType, contents = self.read_object(treeSha)
+        if objectType != "tree":
+            raise ObjectReaderError("not a tree: " + treeSha)
+        entries = {}
+        offset = 0
+        length = len(contents)
+        while offset < length:
+            spacePosition = contents.index(b" ", offset)
+            nulPosition = contents.index(b"\0", spacePosition)
+            mode = contents[offset:spacePosition].decode()
+            name = contents[spacePosition + 1:nulPosition].decode(errors="surrogateescape")
+            sha = binascii.hexlify(contents[nulPosition + 1:nulPosition + 21]).decode()
+            entries[name] = (mode, sha)
+            offset = nulPosition + 21
+        return entries
+
+    def read_commit(self, commitSha):
+        """ Returns the headers of a commit as dict (with 'parent' as list) plus its message under 'message'. """
+
+        objectType, contents = self.read_object(commitSha)
+        if objectType != "commit":
+            raise ObjectReaderError("not a commit: " + commitSha)
+        headerText, separator, message = contents.decode(errors="replace").partition("\n\n")
+        commit = {'parent': [], 'message': message}
+        lastKey = None
+        for line in headerText.split("\n"):
+            if line.startswith(" ") and lastKey != None:
+                continue # continuation of a multi-line header (gpgsig, mergetag)
+            key, separator, value = line.partition(" ")
+            if key == "parent":
+                commit['parent'].append(value)
+            else:
+                commit[key] = value
+            lastKey = key
+        return commit
+
+    def get_blob_id(self, revision, filerelpath):
+        """ Returns the sha of a file's blob in a revision, or None if the file does not exist there. """
+
+        commit = self.read_commit(self.resolve_ref(revision))
+        entry = self.get_tree_entry(commit['tree'], filerelpath)
+        if entry == None:
+            return None
+        if entry[0] in ("40000", "040000", "160000"):
+            raise ObjectReaderError("not a file: " + filerelpath)
+        return entry[1]
+
+    def get_contents(self, revision, filerelpath):
+        """ Returns the contents of a file in a revision, or None if the file does not exist there. """
+
+        blobSha = self.get_blob_id(revision, filerelpath)
+        if blobSha == None:
+            return None
+        objectType, contents = self.read_object(blobSha)
+        return contents
+
+    def get_delta_base_cache_size(self):
+        """ Returns the bytes held by the delta-base cache. """
+
+        return self._deltaBaseCacheBytes
+
+    def close(self):
+        with self._lock:
+            for pack in self._packs.values():
+                pack.close()
+            self._packs = {}
+            self.__forget_delta_bases()
+
+    ### LOOSE OBJECTS
+
+    def __read_loose(self, sha):
+        path = os.path.join(self._objectsDir, sha[:2], sha[2:])
+        try:
+            with open(path, 'rb') as f:
+                raw = zlib.decompress(f.read())
+        except FileNotFoundError:
+            return None
+        except zlib.error as error:
+            raise ObjectReaderError(str(error))
+        header, separator, contents = raw.partition(b"\0")
+        objectType, separator, size = header.decode().partition(" ")
+        if int(size) != len(contents):
+            raise ObjectReaderError("corrupt loose object: " + sha)
+        return (objectType, contents)
+
+    def __read_loose_size(self, sha):
+        path = os.path.join(self._objectsDir, sha[:2], sha[2:])
+        decompressor = zlib.decompressobj()
+        header = b""
+        try:
+            with open(path, 'rb') as f:
+                while b"\0" not in header and not decompressor.eof:
+                    chunk = f.read(4096)
+                    if len(chunk) <= 0:
+                        break
+                    header += decompressor.decompress(chunk, 64)
+        except FileNotFoundError:
+            return None
+        except zlib.error as error:
+            raise ObjectReaderError(str(error))
+        if b"\0" not in header:
+            raise ObjectReaderError("corrupt loose object: " + sha)
+        objectType, separator, size = header.partition(b"\0")[0].decode().partition(" ")
+        return int(size)
+
+    ### PACKFILES
+
+    def __get_packs(self, reload=False):
+        """
+        Returns the packs of the object-database. On reload (after a miss) the pack-directory is scanned again:
+        packs that appeared since (fetch, gc) get mapped, packs whose file is gone (repack) get unmapped.
+        """
+
+        packDir = os.path.join(self._objectsDir, "pack")
+        if reload or len(self._packs) <= 0:
+            try:
+                names = [name for name in os.listdir(packDir) if name.endswith(".pack")]
+            except FileNotFoundError:
+                names = []
+            for name in [name for name in self._packs if name not in names]:
+                self._packs.pop(name).close()
+                # cached delta-bases are keyed by id() of their pack, which a new pack could get again.
+                self.__forget_delta_bases()
+            for name in names:
+                if name not in self._packs and os.path.exists(os.path.join(packDir, name[:-5] + ".idx")):
+                    self._packs[name] = Pack(os.path.join(packDir, name))
+        return list(self._packs.values())
+
+    def __read_packed(self, binarySha):
+        for reload in (False, True): # new packs might have appeared since the last scan (gc, fetch)
+            for pack in self.__get_packs(reload):
+                offset = pack.index.find(binarySha)
+                if offset != None:
+                    return self.__read_pack_entry(pack, offset)
+        return None
+
+    def __read_packed_size(self, binarySha):
+        for reload in (False, True):
+            for pack in self.__get_packs(reload):
+                offset = pack.index.find(binarySha)
+                if offset != None:
+                    objectType, size, dataOffset, deltaBase = pack.read_entry_header(offset)
+                    if objectType in OBJECT_TYPES:
+                        return size
+                    # a delta starts with the sizes of its base and of its result.
+                    deltaHeader = pack.inflate_prefix(dataOffset, 20)
+                    baseSize, headerOffset = read_delta_size(deltaHeader, 0)
+                    resultSize, headerOffset = read_delta_size(deltaHeader, headerOffset)
+                    return resultSize
+        return None
+
+    def __read_pack_entry(self, pack, offset):
+        cacheKey = (id(pack), offset)
+        if cacheKey in self._deltaBaseCache:
+            self._deltaBaseCache.move_to_end(cacheKey)
+            return self._deltaBaseCache[cacheKey]
+
+        # walk down the delta-chain (iteratively, chains can be deep) until a cached or full object is found.
+        chain = []
+        result = None
+        baseIsInPack = True
+        while result == None:
+            objectType, size, dataOffset, deltaBase = pack.read_entry_header(offset)
+
+            if objectType in OBJECT_TYPES:
+                result = (OBJECT_TYPES[objectType], pack.inflate(dataOffset, size))
+
+            elif objectType == OBJ_OFS_DELTA:
+                chain.append((offset, pack.inflate(dataOffset, size)))
+                offset = offset - deltaBase
+                result = self._deltaBaseCache.get((id(pack), offset))
+
+            elif objectType == OBJ_REF_DELTA:
+                chain.append((offset, pack.inflate(dataOffset, size)))
+                baseOffset = pack.index.find(deltaBase)
+                if baseOffset == None:
+                    # the base is stored loose or in another pack.
+                    baseIsInPack = False
+                    result = self.read_object(binascii.hexlify(deltaBase).decode())
+                else:
+                    offset = baseOffset
+                    result = self._deltaBaseCache.get((id(pack), offset))
+
+            else:
+                raise ObjectReaderError("unknown pack-entry type %d" % objectType)
+
+        if len(chain) > 0 and baseIsInPack:
+            self.__remember((id(pack), offset), result)
+
+        objectType, contents = result
+        for deltaOffset, delta in reversed(chain):
+            contents = apply_delta(contents, delta)
+            self.__remember((id(pack), deltaOffset), (objectType, contents))
+
+        return (objectType, contents)
+
+    def __remember(self, cacheKey, value):
+        objectType, contents = value
+        if len(contents) > self._deltaBaseCacheLimit // 4:
+            return
+        cache = self._deltaBaseCache
+        if cacheKey in cache:
+            cache.move_to_end(cacheKey)
+            return
+        cache[cacheKey] = value
+        self._deltaBaseCacheBytes += len(contents)
+        while self._deltaBaseCacheBytes > self._deltaBaseCacheLimit:
+            evictedKey, (evictedType, evictedContents) = cache.popitem(last=False)
+            self._deltaBaseCacheBytes -= len(evictedContents)
+
+    def __forget_delta_bases(self):
+        self._deltaBaseCache.clear()
+        self._deltaBaseCacheBytes = 0
+
+    ### REFS
+
+    def __read_ref(self, refname, depth):
+        if depth > 5 or not is_ref_path(refname):
+            return None
+
+        for baseDir in (self._gitdir, self._commonDir):
+            path = os.path.join(baseDir, refname)
+            if os.path.isfile(path):
+                with open(path) as f:
+                    value = f.read().strip()
+                if value.startswith("ref: "):
+                    return self.__read_ref(value[5:], depth + 1)
+                return value
+
+        packedRefsPath = os.path.join(self._commonDir, "packed-refs")
+        if os.path.isfile(packedRefsPath):
+            with open(packedRefsPath) as f:
+                for line in f:
+                    if line[:1] in ("#", "^"):
+                        continue
+                    parts = line.strip().split(" ", 1)
+                    if len(parts) == 2 and parts[1] == refname:
+                        return parts[0]
+
+        return None
+
+    def __peel(self, sha):
+        """ Follows annotated tags down to the commit they point to. """
+
+        for i in range(10):
+            objectType, contents = self.read_object(sha)
+            if objectType != "tag":
+                return sha
+            sha = contents.split(b"\n", 1)[0].split(b" ")[1].decode()
+        raise ObjectReaderError("tag-chain too deep")
@@ -0,0 +1,42 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from git_runner import run_git
+import os
+
+def read_head(gitpath):
+    """ Returns the commit-sha of HEAD (or an empty string if there are no commits yet). """
+
+    exitCode, output, err = run_git(gitpath, ['rev-parse', '--verify', '-q', 'HEAD'])
+    return output.decode().strip()
+
+def get_changed_paths(gitpath, oldHead):
+    """
+    Returns the absolute paths of the files that changed from oldHead to the current HEAD,
+    plus the files left unmerged (with conflict-markers) by a failed merge.
+    """
+
+    changedPaths = set()
+    arguments = [['diff', '--name-only', '-z', '--diff-filter=U']]
+    newHead = read_head(gitpath)
+    if len(newHead) > 0 and newHead != oldHead:
+        if len(oldHead) > 0:
+            arguments.append(['diff', '--name-only', '-z', '--no-renames', oldHead, newHead])
+        else:
+            arguments.append(['ls-tree', '-r', '-z', '--name-only', newHead])
+
+    for argument in arguments:
+        exitCode, output, err = run_git(gitpath, argument)
+        for filerelpath in output.decode(errors="surrogateescape").split("\0"):
+            if len(filerelpath) > 0:
+                changedPaths.add(os.path.join(gitpath, filerelpath))
+    return changedPaths
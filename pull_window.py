@@ -0,0 +1,169 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from gi.repository import Gtk, Gio, GLib, Pango
+from helpers import git_command
+from git_runner import GitTrace
+from pull_changes import read_head, get_changed_paths
+from job_scheduler import JobScheduler, PRIORITY_HIGH
+from repository_service import RepositoryService
+
+class PullWindow:
+    """
+    Runs 'git pull' asynchronously and streams its progress into a scrollable panel.
+    The pull can be cancelled. When it is done, 'onFinished' is called (in the main-thread)
+    with the work-dir and the set of absolute paths of the files the pull changed.
+    While it runs, it counts as a write of the user (a background-fetch of the repository gets aborted).
+    """
+
+    def __init__(self, gitpath, onFinished):
+        self._gitpath = gitpath
+        self._onFinished = onFinished
+        self._process = None
+        self._cancellable = Gio.Cancellable()
+        self._oldHead = read_head(gitpath)
+        self._lineStart = None
+        self._isDestroyed = False
+        self._call = None
+        self._bytesRead = 0
+        self._repositoryService = RepositoryService.acquire(gitpath)
+        self._repositoryService.begin_write()
+
+        self.window = Gtk.Window()
+        self.window.set_title("git pull")
+        self.window.set_default_size(640, 320)
+        self.window.connect("destroy", self._on_window_destroyed)
+
+        self._textView = Gtk.TextView()
+        self._textView.set_editable(False)
+        self._textView.set_cursor_visible(False)
+        self._textView.override_font(Pango.FontDescription("monospace"))
+        self._textBuffer = self._textView.get_buffer()
+
+        scrolledWindow = Gtk.ScrolledWindow()
+        scrolledWindow.set_vexpand(True)
+        scrolledWindow.set_hexpand(True)
+        scrolledWindow.add(self._textView)
+
+        self._button = Gtk.Button()
+        self._button.set_label("Cancel")
+        self._button.connect("clicked", self._on_button_clicked)
+
+        grid = Gtk.Grid()
+        grid.attach(scrolledWindow, 0, 0, 1, 1)
+        grid.attach(self._button, 0, 1, 1, 1)
+
+        self.window.add(grid)
+        self.window.show_all()
+
+        try:
+            launcher = Gio.SubprocessLauncher.new(
+                Gio.SubprocessFlags.STDOUT_PIPE | Gio.SubprocessFlags.STDERR_MERGE)
+            launcher.setenv("GIT_TERMINAL_PROMPT", "0", True) # there is no terminal to ask for credentials
+            argv = git_command(gitpath, ['pull', '--progress'])
+            self._call = GitTrace.get_shared().start_call(argv)
+            self._process = launcher.spawnv(argv)
+        except GLib.Error as error:
+            GitTrace.get_shared().finish_call(self._call, None)
+            self.__append_output(str(error) + "\n")
+            self.__finish()
+            return
+
+        self.__read_next()
+        self._process.wait_async(self._cancellable, self._on_process_exited, None)
+
+    def cancel(self):
+        """ Terminates the running pull. """
+
+        if self._process != None:
+            self._process.force_exit()
+
+    def _on_window_destroyed(self, window, data=None):
+        """ Closing the window cancels the pull; documents changed so far still get reloaded. """
+
+        self._isDestroyed = True
+        self.cancel()
+
+    def _on_button_clicked(self, button, data=None):
+        if self._process != None:
+            self.cancel()
+        else:
+            self.window.destroy()
+
+    def __read_next(self):
+        self._process.get_stdout_pipe().read_bytes_async(
+            4096, GLib.PRIORITY_DEFAULT, self._cancellable, self._on_output, None)
+
+    def _on_output(self, stream, result, data=None):
+        try:
+            chunk = stream.read_bytes_finish(result)
+        except GLib.Error:
+            return # cancelled
+        if chunk.get_size() <= 0:
+            return
+        self._bytesRead += chunk.get_size()
+        self.__append_output(chunk.get_data().decode(errors="replace"))
+        self.__read_next()
+
+    def _on_process_exited(self, process, result, data=None):
+        try:
+            process.wait_finish(result)
+        except GLib.Error:
+            return # cancelled
+        GitTrace.get_shared().finish_call(self._call,
+            None if process.get_if_signaled() else process.get_exit_status(), self._bytesRead)
+        if process.get_if_signaled():
+            self.__append_output("\n[cancelled]\n")
+        elif process.get_exit_status() != 0:
+            self.__append_output("\n[git pull failed with exit-code %d]\n" % process.get_exit_status())
+        self._process = None
+        self.__finish()
+
+    def __finish(self):
+        if not self._isDestroyed:
+            self._button.set_label("Close")
+
+        self._repositoryService.end_write()
+        RepositoryService.release(self._gitpath)
+
+        # find out which files were changed by the pull without blocking the editor.
+        JobScheduler.get_shared().submit(
+            ("pull-changes", self._gitpath),
+            get_changed_paths,
+            (self._gitpath, self._oldHead),
+            priority=PRIORITY_HIGH,
+            onDone=lambda changedPaths: self._onFinished(self._gitpath, changedPaths)
+        )
+
+    def __append_output(self, text):
+        """ Appends output of git; a carriage-return (used by progress-meters) overwrites the current line. """
+
+        if self._isDestroyed:
+            return
+
+        textBuffer = self._textBuffer
+        parts = text.replace("\r\n", "\n").split("\r")
+        for index, part in enumerate(parts):
+            if index > 0 and self._lineStart != None:
+                textBuffer.delete(textBuffer.get_iter_at_mark(self._lineStart), textBuffer.get_end_iter())
+            for lineIndex, line in enumerate(part.split("\n")):
+                if lineIndex > 0:
+                    textBuffer.insert(textBuffer.get_end_iter(), "\n")
+                    if self._lineStart != None:
+                        textBuffer.delete_mark(self._lineStart)
+                        self._lineStart = None
+                if self._lineStart == None:
+                    self._lineStart = textBuffer.create_mark(None, textBuffer.get_end_iter(), True)
+                textBuffer.insert(textBuffer.get_end_iter(), line)
+
+        textBuffer.place_cursor(textBuffer.get_end_iter())
+        self._textView.scroll_to_mark(textBuffer.get_insert(), 0.0, False, 0.0, 1.0)
@@ -0,0 +1,191 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from threading import Lock
+import os
+
+def read_git_entry(directory):
+    """
+    Checks if a directory contains a '.git' entry.
+    Returns the absolute path to the git-directory, or None if the directory is no work-tree root.
+    Understands '.git' files ("gitdir: ...") as used by linked work-trees and submodules.
+    """
+
+    dotgit = os.path.join(directory, ".git")
+    if os.path.isdir(dotgit):
+        return dotgit
+
+    elif os.path.isfile(dotgit):
+        try:
+            with open(dotgit) as f:
+                line = f.readline().strip()
+        except OSError:
+            return None
+        if line.startswith("gitdir:"):
+            gitdir = line[len("gitdir:"):].strip()
+            if not os.path.isabs(gitdir):
+                gitdir = os.path.join(directory, gitdir)
+            return os.path.normpath(gitdir)
+
+    return None
+
+class RepositoryIndexNode:
+    """ One directory in the discovery-trie. """
+
+    __slots__ = ("children", "scanned", "gitdir", "device")
+
+    def __init__(self):
+        self.children = {}
+        self.scanned  = False # was this directory checked for a '.git' entry?
+        self.gitdir   = None  # git-directory, if this directory is a work-tree root
+        self.device   = None  # the filesystem (st_dev) of the directory, once it was needed
+
+class RepositoryIndex:
+    """
+    Maps directories to the git work-tree containing them.
+    Known directories are kept in a prefix-trie (one node per path-component), so a lookup on a warm cache
+    is one walk from the root down to the directory without touching the filesystem.
+    Nodes stay valid until they are invalidated explicitly (see DiscoveryMonitor).
+
+    Like git, the search for a work-tree climbs up from a directory, but never above the home-directory
+    and never across a filesystem-boundary, so directories like '/' or '/home' are not checked (nor watched).
+    """
+
+    __shared = None
+
+    @classmethod
+    def get_shared(cls):
+        """ Returns the index shared by all windows. """
+
+        if cls.__shared == None:
+            cls.__shared = RepositoryIndex()
+        return cls.__shared
+
+    def __init__(self, environ=None):
+        self._root = RepositoryIndexNode()
+        self._lock = Lock()
+        self._scanListeners = []
+        self._gitdirByWorkTree = {}
+
+        if environ == None:
+            environ = os.environ
+        self._home = os.path.normpath(environ["HOME"]) if len(environ.get("HOME", "")) > 0 else None
+
+        # a work-tree set up through GIT_DIR / GIT_WORK_TREE has no '.git' entry at all.
+        self._environWorkTree = None
+        if "GIT_DIR" in environ:
+            workTree = environ.get("GIT_WORK_TREE", os.getcwd())
+            self._environWorkTree = os.path.abspath(workTree)
+            self._gitdirByWorkTree[self._environWorkTree] = os.path.abspath(environ["GIT_DIR"])
+
+    def add_scan_listener(self, callback):
+        """ Registers a callback that is called with every directory that got checked on the filesystem. """
+
+        self._scanListeners.append(callback)
+
+    def remove_scan_listener(self, callback):
+        if callback in self._scanListeners:
+            self._scanListeners.remove(callback)
+
+    def get_work_tree(self, filepath):
+        """ Returns the absolute path of the work-tree containing the given file, or None. """
+
+        return self.get_work_tree_of_directory(os.path.dirname(os.path.abspath(filepath)))
+
+    def get_work_tree_of_directory(self, directory):
+        """ Returns the absolute path of the work-tree containing the given directory, or None. """
+
+        scanned = []
+        result = None
+
+        with self._lock:
+            node = self._root
+            currentPath = "/"
+            path = [(currentPath, node)]
+            for component in [part for part in directory.split("/") if part != ""]:
+                if component not in node.children:
+                    node.children[component] = RepositoryIndexNode()
+                node = node.children[component]
+                currentPath = os.path.join(currentPath, component)
+                path.append((currentPath, node))
+
+            for currentPath, node in path[self.__get_ceiling(path):]:
+                if not node.scanned:
+                    node.gitdir = read_git_entry(currentPath)
+                    node.scanned = True
+                    scanned.append(currentPath)
+                    if node.gitdir != None:
+                        self._gitdirByWorkTree[currentPath] = node.gitdir
+
+                if node.gitdir != None:
+                    result = currentPath
+
+            environWorkTree = self._environWorkTree
+            if environWorkTree != None and (result == None or len(environWorkTree) > len(result)):
+                if directory == environWorkTree or directory.startswith(environWorkTree + "/"):
+                    result = environWorkTree
+
+        for scannedPath in scanned:
+            for callback in self._scanListeners:
+                callback(scannedPath)
+
+        return result
+
+    def __get_ceiling(self, path):
+        """
+        Returns the index (in the list of (directory, node) from '/' down to a directory) of the topmost directory
+        to check: the home-directory if the directory is inside of it, and nothing on another filesystem.
+        """
+
+        device = None
+        for index in range(len(path) - 1, -1, -1):
+            ancestor, node = path[index]
+            ancestorDevice = self.__get_device(ancestor, node)
+            if device == None:
+                device = ancestorDevice # the directory, or its nearest ancestor that exists
+            elif ancestorDevice != device:
+                return index + 1
+            if ancestor == self._home:
+                return index
+        return 0
+
+    def __get_device(self, directory, node):
+        if node.device == None:
+            try:
+                node.device = os.stat(directory).st_dev
+            except OSError:
+                return None # does not exist (yet), not remembered
+        return node.device
+
+    def get_git_dir(self, workTree):
+        """ Returns the git-directory belonging to a work-tree (as returned by get_work_tree). """
+
+        gitdir = self._gitdirByWorkTree.get(workTree)
+        if gitdir == None:
+            gitdir = read_git_entry(workTree)
+            if gitdir == None:
+                gitdir = os.path.join(workTree, ".git")
+        return gitdir
+
+    def invalidate(self, directory):
+        """ Forgets if a directory is a work-tree root; it will be checked on the filesystem again on next lookup. """
+
+        with self._lock:
+            node = self._root
+            for component in [part for part in directory.split("/") if part != ""]:
+                node = node.children.get(component)
+                if node == None:
+                    return
+            node.scanned = False
+            node.gitdir = None
+            if directory != self._environWorkTree and directory in self._gitdirByWorkTree:
+                del self._gitdirByWorkTree[directory]
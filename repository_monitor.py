@@ -0,0 +1,163 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from gi.repository import GLib, Gio
+from repository_index import RepositoryIndex
+import os
+
+class RepositoryMonitor:
+    """
+    Watches '.git/index', '.git/HEAD', the local branches and directories of the work-tree of one repository.
+    Branches can be nested in directories ('feature/x' is 'refs/heads/feature/x'), so every directory below
+    'refs/heads' gets its own monitor, including those created later.
+    Bursts of change-events are debounced into one call of the given callback.
+    """
+
+    def __init__(self, gitpath, callback, debounceMilliseconds=300):
+        self._gitpath = gitpath
+        self._callback = callback
+        self._debounceMilliseconds = debounceMilliseconds
+        self._timeoutId = None
+        self._monitors = {}
+        self._gitdir = RepositoryIndex.get_shared().get_git_dir(gitpath)
+
+        self.__watch(self._gitdir + "/index", False)
+        self.__watch(self._gitdir + "/HEAD", False)
+        self.__watch(self._gitdir + "/packed-refs", False)
+        self.__watch_branch_directory(self._gitdir + "/refs/heads")
+        self.watch_directory(gitpath)
+
+    def watch_directory(self, directory):
+        """ Also watches the given directory of the work-tree (directory-monitors are not recursive). """
+
+        self.__watch(directory, True)
+
+    def cancel(self):
+        """ Stops all monitors and drops a pending notification. """
+
+        for monitor in self._monitors.values():
+            monitor.cancel()
+        self._monitors = {}
+        if self._timeoutId != None:
+            GLib.source_remove(self._timeoutId)
+            self._timeoutId = None
+
+    def __watch_branch_directory(self, directory):
+        """ Watches a directory of local branches together with all directories below it. """
+
+        self.__watch(directory, True)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                self.__watch_branch_directory(path)
+
+    def __watch(self, path, isDirectory):
+        if path in self._monitors:
+            return
+        try:
+            gfile = Gio.File.new_for_path(path)
+            if isDirectory:
+                monitor = gfile.monitor_directory(Gio.FileMonitorFlags.NONE, None)
+            else:
+                monitor = gfile.monitor_file(Gio.FileMonitorFlags.NONE, None)
+            monitor.connect("changed", self.__on_changed)
+            self._monitors[path] = monitor
+        except GLib.Error as error:
+            print(error)
+
+    def __on_changed(self, monitor, gfile, otherFile, eventType):
+        path = gfile.get_path()
+        if path != None and (path.startswith(self._gitdir) or os.path.basename(path) == ".git"):
+            # only index, HEAD and the local branches are relevant from inside the git-directory.
+            isBranch = path.startswith(self._gitdir + "/refs/heads/")
+            if not isBranch and path not in (self._gitdir + "/index", self._gitdir + "/HEAD", self._gitdir + "/packed-refs"):
+                return
+            if isBranch and eventType == Gio.FileMonitorEvent.CREATED and os.path.isdir(path):
+                self.__watch_branch_directory(path)
+            elif isBranch and eventType == Gio.FileMonitorEvent.DELETED and path in self._monitors:
+                self._monitors.pop(path).cancel() # a re-created directory needs a new monitor
+
+        if self._timeoutId == None:
+            self._timeoutId = GLib.timeout_add(self._debounceMilliseconds, self.__on_timeout)
+
+    def __on_timeout(self):
+        self._timeoutId = None
+        self._callback()
+        return False
+
+class DiscoveryMonitor:
+    """
+    Keeps the repository-index up to date: every directory the index had to check on the filesystem
+    (the directories of opened files and their ancestors up to the home-directory or the filesystem-boundary)
+    is watched for a '.git' entry appearing, disappearing or changing.
+    One monitor is shared by all gedit-windows; the last window to release it cancels it.
+    """
+
+    __shared = None
+    __users = 0
+
+    @classmethod
+    def acquire(cls, repositoryIndex):
+        """ Returns the shared monitor of the index and registers one more user of it. Main-thread only. """
+
+        if cls.__shared == None:
+            cls.__shared = DiscoveryMonitor(repositoryIndex)
+        cls.__users += 1
+        return cls.__shared
+
+    @classmethod
+    def release(cls):
+        """ Unregisters one user of the shared monitor. The last user to leave cancels it. """
+
+        cls.__users -= 1
+        if cls.__users <= 0 and cls.__shared != None:
+            cls.__shared.cancel()
+            cls.__shared = None
+            cls.__users = 0
+
+    def __init__(self, repositoryIndex):
+        self._index = repositoryIndex
+        self._monitors = {}
+        self._isCancelled = False
+        repositoryIndex.add_scan_listener(self._on_directory_scanned)
+
+    def cancel(self):
+        self._isCancelled = True
+        self._index.remove_scan_listener(self._on_directory_scanned)
+        for monitor in self._monitors.values():
+            monitor.cancel()
+        self._monitors = {}
+
+    def _on_directory_scanned(self, directory):
+        """ Called by the index (possibly from a worker-thread) for every directory it checked. """
+
+        GLib.idle_add(self.__watch, directory)
+
+    def __watch(self, directory):
+        if self._isCancelled:
+            return False
+        if directory not in self._monitors:
+            try:
+                monitor = Gio.File.new_for_path(directory).monitor_directory(Gio.FileMonitorFlags.NONE, None)
+                monitor.connect("changed", self.__on_changed, directory)
+                self._monitors[directory] = monitor
+            except GLib.Error as error:
+                print(error)
+        return False
+
+    def __on_changed(self, monitor, gfile, otherFile, eventType, directory):
+        if gfile.get_basename() == ".git" or (otherFile != None and otherFile.get_basename() == ".git"):
+            self._index.invalidate(directory)
@@ -0,0 +1,213 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from threading import Lock
+import subprocess
+from subprocess import PIPE
+from status_cache import StatusCache
+from blob_server import BlobServer
+from history_cache import HistoryCache
+from branch_matrix import read_refs
+from git_runner import GitProcess
+
+FETCH_CHANGED   = "changed"
+FETCH_UNCHANGED = "unchanged"
+FETCH_FAILED    = "failed"
+FETCH_ABORTED   = "aborted"
+
+# a background-fetch must never ask for credentials (credential-helpers and ssh-agents still work),
+# must not leave a FETCH_HEAD the user did not ask for and must not start a gc on its own.
+FETCH_ARGUMENTS = ['-c', 'fetch.writeFetchHEAD=false', '-c', 'gc.auto=0', '-c', 'maintenance.auto=false',
+                   'fetch', '--all', '--quiet']
+FETCH_ENVIRONMENT = {
+    'GIT_TERMINAL_PROMPT': "0",
+    'GIT_ASKPASS':         "true",
+    'SSH_ASKPASS':         "true",
+}
+
+class RepositoryService:
+    """
+    Everything the plugin keeps about one work-tree, shared by all gedit-windows (and the windows opened by them):
+    the file-states, the list of branches, the blob-server with its git-process, the history-cache and
+    the file-monitor. All of it is created once per work-tree and reference-counted;
+    the last user to release the service stops its monitor and processes.
+
+    When the monitor (or an own git-call) reports a change, the cached states and refs are dropped once
+    and every registered listener is notified, so all windows see the same update from one git-call.
+
+    Git-calls of the user that change the repository are wrapped in begin_write/end_write (or run_write);
+    a background-fetch does not start while one runs and gets aborted when one starts.
+    """
+
+    __services = {}
+    __servicesLock = Lock()
+
+    @classmethod
+    def acquire(cls, gitpath):
+        """ Returns the (shared) service of a work-dir and registers one more user of it. Main-thread only. """
+
+        with cls.__servicesLock:
+            if gitpath not in cls.__services:
+                cls.__services[gitpath] = RepositoryService(gitpath)
+            service = cls.__services[gitpath]
+            service._users += 1
+            return service
+
+    @classmethod
+    def release(cls, gitpath):
+        """ Unregisters one user of a service. The last user to leave shuts it down. """
+
+        with cls.__servicesLock:
+            service = cls.__services.get(gitpath)
+            if service != None:
+                service._users -= 1
+                if service._users <= 0:
+                    del cls.__services[gitpath]
+                    service.close()
+
+    @classmethod
+    def get_services(cls):
+        """ Returns the services currently in use. """
+
+        with cls.__servicesLock:
+            return list(cls.__services.values())
+
+    @classmethod
+    def shutdown_all(cls):
+        """ Shuts down all services, no matter who still uses them (when the plugin gets deactivated). """
+
+        with cls.__servicesLock:
+            services = list(cls.__services.values())
+            cls.__services = {}
+        for service in services:
+            service.close()
+
+    def __init__(self, gitpath, create_monitor=None):
+        """ create_monitor(gitpath, callback) creates the file-monitor; by default a (Gio-based) RepositoryMonitor. """
+
+        if create_monitor == None:
+            from repository_monitor import RepositoryMonitor
+            create_monitor = RepositoryMonitor
+        self.gitpath = gitpath
+        self._users = 0
+        self._lock = Lock()
+        self._refs = None
+        self._listeners = []
+        self._writes = 0
+        self._fetchProcess = None
+        self._fetchAborted = False
+        self.statusCache = StatusCache(gitpath)
+        self.blobServer = BlobServer(gitpath)
+        self.historyCache = HistoryCache.get_shared()
+        self.monitor = create_monitor(gitpath, self.invalidate)
+
+    def add_listener(self, callback):
+        """ Registers a callback that will be called (without arguments) whenever the repository changed. """
+
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def invalidate(self):
+        """ Marks cached states and refs as outdated and notifies all listeners. """
+
+        self.statusCache.invalidate()
+        self._refs = None
+        for callback in list(self._listeners):
+            callback()
+
+    def get_refs(self):
+        """
+        Returns the local and the remote-tracking branches (as from branch_matrix.read_refs).
+        They are read once and kept until the repository changes.
+        """
+
+        with self._lock:
+            refs = self._refs
+            if refs == None:
+                refs = [ref for ref in read_refs(self.gitpath, ("refs/heads", "refs/remotes"))
+                        if not ref.name.endswith("/HEAD")] # the symbolic default-branch of a remote
+                self._refs = refs
+            return refs
+
+    def begin_write(self):
+        """ Registers a git-call of the user that changes the repository; a running background-fetch gets aborted. """
+
+        with self._lock:
+            self._writes += 1
+            fetchProcess = self._fetchProcess
+            if fetchProcess != None:
+                self._fetchAborted = True
+                fetchProcess.kill()
+
+    def end_write(self):
+        with self._lock:
+            self._writes -= 1
+
+    def is_writing(self):
+        with self._lock:
+            return self._writes > 0
+
+    def run_write(self, function, arguments=()):
+        """ Runs function(*arguments), which changes the repository, between begin_write and end_write. """
+
+        self.begin_write()
+        try:
+            return function(*arguments)
+        finally:
+            self.end_write()
+
+    def fetch(self):
+        """
+        Fetches all remotes without any interaction. Meant to run in a worker of the fetch-scheduler.
+        Returns FETCH_CHANGED or FETCH_UNCHANGED (whether remote-tracking branches moved), FETCH_FAILED,
+        or FETCH_ABORTED if the user wrote to the repository meanwhile.
+        """
+
+        try:
+            before = read_refs(self.gitpath, ("refs/remotes",))
+            with self._lock:
+                if self._writes > 0:
+                    return FETCH_ABORTED
+                self._fetchAborted = False
+                self._fetchProcess = GitProcess(self.gitpath, FETCH_ARGUMENTS, stdout=subprocess.DEVNULL,
+                    stderr=PIPE, environment=FETCH_ENVIRONMENT, newSession=True)
+                fetchProcess = self._fetchProcess
+            err = fetchProcess.stderr.read()
+            exitCode = fetchProcess.wait()
+        except OSError as error:
+            print(error)
+            return FETCH_FAILED
+        finally:
+            with self._lock:
+                self._fetchProcess = None
+
+        with self._lock:
+            if self._fetchAborted:
+                return FETCH_ABORTED
+        if exitCode != 0:
+            print(err.decode(errors="replace"))
+            return FETCH_FAILED
+        if read_refs(self.gitpath, ("refs/remotes",)) != before:
+            return FETCH_CHANGED
+        return FETCH_UNCHANGED
+
+    def close(self):
+        with self._lock:
+            if self._fetchProcess != None:
+                self._fetchAborted = True
+                self._fetchProcess.kill()
+        self.monitor.cancel()
+        self.blobServer.close()
+        self._listeners = []
@@ -0,0 +1,156 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from gi.repository import GLib
+from threading import Lock
+import hashlib
+import shutil
+import tempfile
+import os
+
+class Spool:
+    """
+    Private directory for the temporary files handed to external diff-viewers.
+    Files are content-addressed and read-only, so concurrent compares of the same revision share one file
+    and compares of different revisions never overwrite each other.
+    Every file is reference-counted against the diff-viewer processes using it and removed when the last
+    of them exits (or when the plugin shuts down); nothing ever waits for the viewer.
+    """
+
+    __shared = None
+
+    @classmethod
+    def get_shared(cls):
+        if cls.__shared == None:
+            cls.__shared = Spool()
+        return cls.__shared
+
+    @classmethod
+    def shutdown_shared(cls):
+        """ Removes the shared spool-directory with everything in it. """
+
+        if cls.__shared != None:
+            cls.__shared.shutdown()
+            cls.__shared = None
+
+    def __init__(self, directory=None):
+        if directory == None:
+            directory = tempfile.mkdtemp(prefix="addiks-gitmenu-")
+        self._directory = directory
+        self._lock = Lock()
+        self._references = {}
+
+    def acquire_file(self, contents, originalPath):
+        """
+        Returns the path of a read-only spool-file with the given contents (bytes) and registers one user of it.
+        The file keeps the basename of originalPath, so diff-viewers show a meaningful name.
+        """
+
+        digest = hashlib.sha1(contents).hexdigest()
+        directory = os.path.join(self._directory, digest[:20])
+        path = os.path.join(directory, os.path.basename(originalPath))
+
+        with self._lock:
+            if path not in self._references:
+                os.makedirs(directory, exist_ok=True)
+                temporaryPath = path + ".part"
+                with open(temporaryPath, 'wb') as f:
+                    f.write(contents)
+                os.chmod(temporaryPath, 0o444)
+                os.rename(temporaryPath, path)
+                self._references[path] = 0
+            self._references[path] += 1
+
+        return path
+
+    def acquire_revision(self, blobServer, revision, filerelpath):
+        """
+        Like acquire_file, for the contents of a file in a revision (an empty file if it does not exist there).
+        The contents are streamed from the blob-server into the file, so big files never sit in memory as a whole.
+        """
+
+        blobSha = blobServer.get_blob_id(revision, filerelpath)
+        if blobSha == None:
+            return self.acquire_file(b"", filerelpath)
+
+        directory = os.path.join(self._directory, "blob-" + blobSha[:20])
+        path = os.path.join(directory, os.path.basename(filerelpath))
+
+        with self._lock:
+            if path in self._references:
+                self._references[path] += 1
+                return path
+            os.makedirs(directory, exist_ok=True)
+
+        # written outside of the lock, streaming a big blob must not block releasing other files.
+        fileDescriptor, temporaryPath = tempfile.mkstemp(suffix=".part", dir=directory)
+        try:
+            with os.fdopen(fileDescriptor, 'wb') as f:
+                blobServer.write_blob(blobSha, f)
+            os.chmod(temporaryPath, 0o444)
+        except OSError:
+            os.remove(temporaryPath)
+            raise
+
+        with self._lock:
+            if path in self._references:
+                os.remove(temporaryPath) # written concurrently by someone else
+            else:
+                os.rename(temporaryPath, path)
+                self._references[path] = 0
+            self._references[path] += 1
+
+        return path
+
+    def release_file(self, path):
+        """ Unregisters one user of a spool-file; the last one removes it. """
+
+        with self._lock:
+            if path not in self._references:
+                return
+            self._references[path] -= 1
+            if self._references[path] <= 0:
+                del self._references[path]
+                try:
+                    os.remove(path)
+                    os.rmdir(os.path.dirname(path))
+                except OSError:
+                    pass
+
+    def spawn_viewer(self, command, spoolFiles):
+        """
+        Starts an external program (like the diff-viewer) without waiting for it.
+        The given spool-files (already acquired) are released when the program exits.
+        """
+
+        try:
+            pid, stdin, stdout, stderr = GLib.spawn_async(
+                command,
+                flags=GLib.SpawnFlags.SEARCH_PATH | GLib.SpawnFlags.DO_NOT_REAP_CHILD
+            )
+        except GLib.Error as error:
+            for path in spoolFiles:
+                self.release_file(path)
+            raise OSError(str(error))
+
+        GLib.child_watch_add(GLib.PRIORITY_DEFAULT, pid, self.__on_viewer_exited, spoolFiles)
+        return pid
+
+    def shutdown(self):
+        with self._lock:
+            self._references = {}
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+    def __on_viewer_exited(self, pid, status, spoolFiles):
+        GLib.spawn_close_pid(pid)
+        for path in spoolFiles:
+            self.release_file(path)
@@ -0,0 +1,199 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from git_runner import run_git
+from diff_engine import diff_hashes, hash_lines
+import re
+
+CONTEXT_LINES = 3
+
+def split_lines(contents):
+    """ Splits bytes into lines, keeping the line-endings (the last line might have none). """
+
+    return re.findall(b"[^\n]*\n|[^\n]+$", contents)
+
+def stage_paths(gitpath, filepaths):
+    """ Stages (adds to the index) any number of files with a single git-invocation. """
+
+    return _run_with_pathspecs(gitpath, ['add', '--pathspec-from-file=-', '--pathspec-file-nul'], filepaths)
+
+def unstage_paths(gitpath, filepaths):
+    """ Unstages (resets the index to HEAD for) any number of files with a single git-invocation. """
+
+    return _run_with_pathspecs(gitpath, ['reset', '-q', 'HEAD', '--pathspec-from-file=-', '--pathspec-file-nul'], filepaths)
+
+def stage_hunks(gitpath, filepath, startLine, endLine):
+    """
+    Stages the hunks between index and work-tree file that touch the (0-based, inclusive) line-range.
+    The patch is built in-process and applied to the index with 'git apply --cached'.
+    Returns True if something was staged.
+    """
+
+    filerelpath = filepath[len(gitpath)+1:]
+    with open(filepath, "rb") as f:
+        workTreeLines = split_lines(f.read())
+
+    indexContents = _read_blob(gitpath, ":" + filerelpath)
+    indexLines = split_lines(indexContents) if indexContents != None else []
+
+    hunks = select_hunks(diff_hashes(hash_lines(indexLines), hash_lines(workTreeLines)), startLine, endLine)
+    if len(hunks) <= 0:
+        return False
+
+    patch = build_patch(filerelpath, indexLines, workTreeLines, hunks, isNewFile=indexContents == None)
+    return _apply_cached(gitpath, patch, False)
+
+def unstage_hunks(gitpath, filepath, startLine, endLine):
+    """
+    Unstages the hunks between HEAD and index that touch the (0-based, inclusive) line-range of the work-tree file.
+    The patch HEAD => index of these hunks is built in-process and applied in reverse with 'git apply --cached -R'.
+    Returns True if something was unstaged.
+    """
+
+    filerelpath = filepath[len(gitpath)+1:]
+    indexContents = _read_blob(gitpath, ":" + filerelpath)
+    headContents = _read_blob(gitpath, "HEAD:" + filerelpath)
+    if indexContents == None:
+        return False
+    if headContents == None:
+        # a newly added file cannot be partially removed from the index by a patch.
+        return unstage_paths(gitpath, [filepath])
+
+    with open(filepath, "rb") as f:
+        workTreeLines = split_lines(f.read())
+    indexLines = split_lines(indexContents)
+    headLines = split_lines(headContents)
+
+    # the line-range is given in work-tree lines, the hunks between HEAD and index are in index lines.
+    indexHunks = diff_hashes(hash_lines(indexLines), hash_lines(workTreeLines))
+    startLine = map_to_base(indexHunks, startLine)
+    endLine = map_to_base(indexHunks, endLine)
+
+    hunks = select_hunks(diff_hashes(hash_lines(headLines), hash_lines(indexLines)), startLine, endLine)
+    if len(hunks) <= 0:
+        return False
+
+    patch = build_patch(filerelpath, headLines, indexLines, hunks)
+    return _apply_cached(gitpath, patch, True)
+
+def select_hunks(hunks, startLine, endLine):
+    """
+    Returns the hunks (as from diff_engine.diff_hashes) that touch the target-lines [startLine, endLine].
+    A removal touches the lines directly above and below it.
+    """
+
+    selected = []
+    for hunk in hunks:
+        baseStart, baseLength, targetStart, targetLength = hunk
+        if targetLength > 0:
+            first, last = targetStart, targetStart + targetLength - 1
+        else:
+            first, last = targetStart - 1, targetStart
+        if first <= endLine and last >= startLine:
+            selected.append(hunk)
+    return selected
+
+def map_to_base(hunks, targetLine):
+    """ Maps a target-line to the corresponding base-line; lines inside of a hunk map to its start. """
+
+    offset = 0
+    for baseStart, baseLength, targetStart, targetLength in hunks:
+        if targetLine < targetStart:
+            break
+        if targetLine < targetStart + targetLength:
+            return baseStart
+        offset = (baseStart + baseLength) - (targetStart + targetLength)
+    return targetLine + offset
+
+def build_patch(filerelpath, baseLines, targetLines, hunks, context=CONTEXT_LINES, isNewFile=False):
+    """
+    Builds a unified diff (as bytes) that changes baseLines into targetLines, but only for the given hunks.
+    Hunks whose context would overlap are merged, like git itself does it.
+    """
+
+    path = filerelpath.encode(errors="surrogateescape")
+    patch = [b"diff --git a/" + path + b" b/" + path + b"\n"]
+    if isNewFile:
+        patch += [b"new file mode 100644\n", b"--- /dev/null\n"]
+    else:
+        patch += [b"--- a/" + path + b"\n"]
+    patch += [b"+++ b/" + path + b"\n"]
+
+    groups = []
+    for hunk in hunks:
+        if len(groups) > 0 and hunk[0] - (groups[-1][-1][0] + groups[-1][-1][1]) <= 2 * context:
+            groups[-1].append(hunk)
+        else:
+            groups.append([hunk])
+
+    delta = 0 # how many lines the already patched hunks above added (or removed)
+    for group in groups:
+        oldStart = max(0, group[0][0] - context)
+        oldEnd = min(len(baseLines), group[-1][0] + group[-1][1] + context)
+
+        body = []
+        position = oldStart
+        groupDelta = 0
+        for baseStart, baseLength, targetStart, targetLength in group:
+            body += [_patch_line(b" ", line) for line in baseLines[position:baseStart]]
+            body += [_patch_line(b"-", line) for line in baseLines[baseStart:baseStart+baseLength]]
+            body += [_patch_line(b"+", line) for line in targetLines[targetStart:targetStart+targetLength]]
+            position = baseStart + baseLength
+            groupDelta += targetLength - baseLength
+        body += [_patch_line(b" ", line) for line in baseLines[position:oldEnd]]
+
+        oldLength = oldEnd - oldStart
+        newLength = oldLength + groupDelta
+        newStart = oldStart + delta
+        patch.append(b"@@ -%d,%d +%d,%d @@\n" % (
+            oldStart + 1 if oldLength > 0 else oldStart, oldLength,
+            newStart + 1 if newLength > 0 else newStart, newLength
+        ))
+        patch += body
+        delta += groupDelta
+
+    return b"".join(patch)
+
+def _patch_line(prefix, line):
+    if line.endswith(b"\n"):
+        return prefix + line
+    return prefix + line + b"\n\\ No newline at end of file\n"
+
+def _read_blob(gitpath, objectName):
+    """ Returns the contents of a blob (like ':path' for the index or 'HEAD:path'), or None if it does not exist. """
+
+    exitCode, output, err = run_git(gitpath, ['cat-file', 'blob', objectName])
+    if exitCode != 0:
+        return None
+    return output
+
+def _apply_cached(gitpath, patch, reverse):
+    arguments = ['apply', '--cached', '--whitespace=nowarn']
+    if reverse:
+        arguments.append('--reverse')
+    exitCode, output, err = run_git(gitpath, arguments + ['-'], patch)
+    if exitCode != 0:
+        print(err.decode(errors="replace"))
+        return False
+    return True
+
+def _run_with_pathspecs(gitpath, arguments, filepaths):
+    """ Runs git with the (absolute) filepaths passed as NUL-separated pathspecs on stdin. """
+
+    pathspecs = b"\0".join(
+        b":(top,literal)" + filepath[len(gitpath)+1:].encode(errors="surrogateescape") for filepath in filepaths
+    )
+    exitCode, output, err = run_git(gitpath, arguments, pathspecs)
+    if exitCode != 0:
+        print(err.decode(errors="replace"))
+        return False
+    return True
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+
+Benchmark of what the plugin costs gedit before git is used at all: loading the plugin-module and
+activating it on a new window (which gedit does for every window it opens).
+Needs the gi-bindings of gedit (but no running gedit):
+
+    python3 startup_benchmark.py --runs 10 --windows 50
+
+Every run is a fresh interpreter, so the import-time is the one gedit pays on start-up.
+"""
+
+import subprocess
+from subprocess import PIPE
+import argparse
+import json
+import time
+import sys
+import os
+
+# per-window activation (including the first update of the state) should stay below this.
+ACTIVATION_TARGET_MS = 5.0
+
+PLUGIN_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+def probe(windows):
+    """
+    Runs in a fresh interpreter: loads the plugin like gedit does and activates it on a number of windows.
+    Prints the import-time, the activation-times (in seconds) and the modules of the plugin that got loaded.
+    """
+
+    import importlib.util
+    from gi.repository import GObject, Gio
+
+    sys.path.insert(0, PLUGIN_DIRECTORY)
+
+    startedAt = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("addiks_gitmenu", os.path.join(PLUGIN_DIRECTORY, "addiks-gitmenu.py"))
+    plugin = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(plugin)
+    importTime = time.perf_counter() - startedAt
+
+    class ProbeWindow(Gio.SimpleActionGroup):
+        """ Stands in for a gedit-window: on activation the plugin only adds actions and connects 'tab-removed'. """
+
+        __gsignals__ = {
+            'tab-removed': (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+        }
+
+    class ProbeActivatable(plugin.AddiksGitMenuWindow):
+        window = None
+
+    activationTimes = []
+    for index in range(windows):
+        activatable = ProbeActivatable()
+        activatable.window = ProbeWindow()
+        startedAt = time.perf_counter()
+        activatable.do_activate()
+        activatable.do_update_state() # gedit updates the state right after activating
+        activationTimes.append(time.perf_counter() - startedAt)
+        activatable.do_deactivate()
+
+    pluginModules = [os.path.splitext(name)[0] for name in os.listdir(PLUGIN_DIRECTORY) if name.endswith(".py")]
+    print(json.dumps({
+        'import':        importTime,
+        'activation':    activationTimes,
+        'modulesLoaded': sorted(name for name in pluginModules if name in sys.modules),
+    }))
+
+def run_probe(windows):
+    sp = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--probe", "--windows", str(windows)],
+        stdin=subprocess.DEVNULL, stdout=PIPE, stderr=PIPE)
+    output, err = sp.communicate()
+    if sp.returncode != 0:
+        raise OSError("startup-probe failed: %s" % err.decode(errors="replace"))
+    return json.loads(output.decode())
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks loading and activating the git-menu plugin.")
+    parser.add_argument("--runs",    type=int, default=5,  help="fresh interpreters to load the plugin in")
+    parser.add_argument("--windows", type=int, default=20, help="window-activations per run")
+    parser.add_argument("--output",  help="write the JSON-result to this file instead of stdout")
+    parser.add_argument("--probe",   action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.probe:
+        probe(arguments.windows)
+        return
+
+    from benchmark import percentiles, get_plugin_revision
+
+    importTimes = []
+    activationTimes = []
+    modulesLoaded = set()
+    for run in range(arguments.runs):
+        result = run_probe(arguments.windows)
+        importTimes.append(result['import'])
+        activationTimes += result['activation']
+        modulesLoaded.update(result['modulesLoaded'])
+
+    activation = percentiles(activationTimes)
+    report = {
+        'plugin':     get_plugin_revision(),
+        'python':     sys.version.split()[0],
+        'parameters': {
+            'runs':    arguments.runs,
+            'windows': arguments.windows,
+        },
+        'unit':       "ms",
+        'results':    {
+            'import':     percentiles(importTimes),
+            'activation': activation,
+        },
+        'activationTarget': ACTIVATION_TARGET_MS,
+        'withinTarget':     activation['p95'] <= ACTIVATION_TARGET_MS,
+        # modules of the plugin (besides the plugin-module itself) loaded by merely activating it.
+        'modulesLoaded':    sorted(modulesLoaded),
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if arguments.output != None:
+        with open(arguments.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from threading import Lock
+from git_runner import GitTrace, run_git
+
+def parse_porcelain_v2(output):
+    """
+    Parses the output of 'git status --porcelain=v2 -z'.
+    Returns a dict mapping relative paths to a two-letter status (like in '--porcelain=v1': X = index, Y = work-tree).
+    Untracked directories are stored with a trailing slash.
+    """
+
+    result = {}
+    records = output.split(b"\0")
+    index = 0
+    while index < len(records):
+        record = records[index].decode(errors="surrogateescape")
+        index += 1
+
+        if record[:2] in ("1 ", "u "):
+            fields = record.split(" ", 10 if record[0] == "u" else 8)
+            result[fields[-1]] = fields[1].replace(".", " ")
+
+        elif record[:2] == "2 ":
+            fields = record.split(" ", 9)
+            result[fields[-1]] = fields[1].replace(".", " ")
+            index += 1 # skip the original path of the rename
+
+        elif record[:2] == "? ":
+            result[record[2:]] = "??"
+
+        elif record[:2] == "! ":
+            result[record[2:]] = "!!"
+
+    return result
+
+# states of files shown as emblems, the strongest first: a directory shows the strongest state found below it.
+CONFLICT  = "conflict"
+MODIFIED  = "modified"
+STAGED    = "staged"
+UNTRACKED = "untracked"
+IGNORED   = "ignored"
+STATE_ORDER = [CONFLICT, MODIFIED, STAGED, UNTRACKED, IGNORED]
+
+def classify_status(status):
+    """ Maps a two-letter status (as from parse_porcelain_v2) to one of the states above, or None if unchanged. """
+
+    if status == "??":
+        return UNTRACKED
+    if status == "!!":
+        return IGNORED
+    if "U" in status or status in ("AA", "DD"):
+        return CONFLICT
+    if status[1:2] not in (" ", ""):
+        return MODIFIED
+    if status[:1] not in (" ", ""):
+        return STAGED
+    return None
+
+class StatusSnapshot:
+    """
+    The states of one 'git status' call for a whole repository: every changed, untracked or ignored path,
+    and (computed on first use) a roll-up of the strongest state below every directory.
+    """
+
+    def __init__(self, states):
+        self.states = states
+        self._rollup = None
+
+    def get_status(self, relpath):
+        """ Returns the two-letter status of a file (like '??', 'M ', ' M', 'MM'), or "" if it is unchanged. """
+
+        if relpath in self.states:
+            return self.states[relpath]
+
+        # files inside an untracked (or ignored) directory are only reported as that directory.
+        parts = relpath.split("/")
+        for depth in range(1, len(parts)):
+            directory = "/".join(parts[:depth]) + "/"
+            if directory in self.states:
+                return self.states[directory]
+
+        return ""
+
+    def get_state(self, relpath, isDirectory=False):
+        """ Returns the state (CONFLICT, MODIFIED, ...) of a file, or the rolled-up state of a directory. """
+
+        if isDirectory:
+            state = classify_status(self.get_status(relpath + "/"))
+            if state == None:
+                state = self.__get_rollup().get(relpath)
+            return state
+        return classify_status(self.get_status(relpath))
+
+    def get_changed_paths(self, other):
+        """
+        Returns the paths whose state might differ between this and another snapshot: the changed entries
+        and all directories above them. Entries of untracked or ignored directories keep their trailing slash,
+        everything below them changed as well.
+        """
+
+        changed = set()
+        for path in set(self.states) | set(other.states):
+            if self.states.get(path) != other.states.get(path):
+                changed.add(path)
+                parts = path.rstrip("/").split("/")
+                for depth in range(1, len(parts)):
+                    changed.add("/".join(parts[:depth]))
+        return changed
+
+    def __get_rollup(self):
+        rollup = self._rollup
+        if rollup == None:
+            rollup = {}
+            for path, status in self.states.items():
+                state = classify_status(status)
+                if state == None or state == IGNORED:
+                    continue # a directory is not ignored just because something in it is
+                parts = path.rstrip("/").split("/")
+                for depth in range(1, len(parts)):
+                    directory = "/".join(parts[:depth])
+                    current = rollup.get(directory)
+                    if current == None or STATE_ORDER.index(state) < STATE_ORDER.index(current):
+                        rollup[directory] = state
+            self._rollup = rollup
+        return rollup
+
+class StatusCache:
+    """
+    Holds the state of every file of one repository, filled from one 'git status' call.
+    The cache is refreshed lazily after it got invalidated (by file-monitors or after own git-calls).
+    Every invalidation bumps a generation; a 'git status' that was overtaken by one is not kept as current.
+    """
+
+    def __init__(self, gitpath):
+        self._gitpath = gitpath
+        self._lock = Lock()      # guards snapshot and generation, never held while git runs
+        self._readLock = Lock()  # only one 'git status' at a time
+        self._snapshot = None
+        self._generation = 0
+
+    def invalidate(self):
+        """ Marks the cached states as outdated (also those of a 'git status' that is running right now). """
+
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def get_snapshot(self):
+        """
+        Returns the StatusSnapshot of the whole repository.
+        The first call after an invalidation runs 'git status' once for the whole repository.
+        """
+
+        with self._readLock:
+            with self._lock:
+                snapshot = self._snapshot
+                generation = self._generation
+            if snapshot != None:
+                GitTrace.get_shared().count('status-cache.hit')
+                return snapshot
+
+            GitTrace.get_shared().count('status-cache.miss')
+            snapshot = StatusSnapshot(self.__read_states())
+            with self._lock:
+                if self._generation == generation:
+                    self._snapshot = snapshot
+            return snapshot
+
+    def get_status(self, filepath):
+        """ Returns the two-letter status (like '??', 'M ', ' M', 'MM') of a file, or "" if it is unchanged. """
+
+        return self.get_snapshot().get_status(filepath[len(self._gitpath)+1:])
+
+    def __read_states(self):
+        # '--no-optional-locks' keeps git from rewriting the index, which would trigger the monitor again.
+        # '--ignored=matching' lists ignored directories as a whole, without descending into them.
+        gitpath = self._gitpath
+        exitCode, output, err = run_git(gitpath,
+            ['--no-optional-locks', 'status', '--porcelain=v2', '-z', '--ignored=matching'], cwd=gitpath)
+        return parse_porcelain_v2(output)
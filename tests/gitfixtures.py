@@ -0,0 +1,61 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+import subprocess
+import os
+
+# no user- or system-configuration may change how the test-repositories behave.
+GIT_ENVIRONMENT = dict(os.environ,
+    GIT_CONFIG_NOSYSTEM="1", GIT_CONFIG_GLOBAL=os.devnull, HOME=os.devnull,
+    GIT_AUTHOR_NAME="Tester", GIT_AUTHOR_EMAIL="tester@example.org",
+    GIT_COMMITTER_NAME="Tester", GIT_COMMITTER_EMAIL="tester@example.org")
+
+def git(cwd, *arguments):
+    """ Runs git in a directory and returns its output (str); fails the test if git fails. """
+
+    return subprocess.run(["git"] + list(arguments), cwd=cwd, env=GIT_ENVIRONMENT,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout.decode()
+
+def init_repository(path, bare=False):
+    os.makedirs(path, exist_ok=True)
+    git(path, "init", "-q", "-b", "master", *(["--bare"] if bare else []))
+    return path
+
+def write_file(gitpath, filerelpath, contents):
+    filepath = os.path.join(gitpath, filerelpath)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "w") as f:
+        f.write(contents)
+    return filepath
+
+def commit_file(gitpath, filerelpath, contents, message="change"):
+    """ Writes a file, commits it and returns the id of the new commit. """
+
+    write_file(gitpath, filerelpath, contents)
+    git(gitpath, "add", "--", filerelpath)
+    git(gitpath, "commit", "-q", "-m", message)
+    return git(gitpath, "rev-parse", "HEAD").strip()
+
+def import_linear_history(gitpath, filerelpath, count):
+    """ Creates 'count' commits on master, each changing one file, quickly through 'git fast-import'. """
+
+    stream = []
+    for number in range(count):
+        contents = ("version %d\n" % number).encode()
+        stream.append(b"commit refs/heads/master\nmark :%d\ncommitter Tester <tester@example.org> %d +0000\n"
+                      b"data %d\ncommit %d\n" % (number + 1, 1000000000 + number, len(b"commit %d" % number), number))
+        if number > 0:
+            stream.append(b"from :%d\n" % number)
+        stream.append(b"M 644 inline %s\ndata %d\n%s\n" % (filerelpath.encode(), len(contents), contents))
+    subprocess.run(["git", "fast-import", "--quiet"], cwd=gitpath, env=GIT_ENVIRONMENT,
+        input=b"".join(stream), check=True)
+    git(gitpath, "checkout", "-q", "-f", "master")
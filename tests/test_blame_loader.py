@@ -0,0 +1,68 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+import tempfile
+import unittest
+import os
+from blame_loader import BlameLoader
+from tests.gitfixtures import init_repository, commit_file
+
+LINE_COUNT = 60
+
+class BlameLoaderTest(unittest.TestCase):
+    """ Blames a file whose every line was changed by its own commit. """
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._gitpath = init_repository(os.path.join(self._directory.name, "repository"))
+        self._filepath = os.path.join(self._gitpath, "a.txt")
+        self._commitIds = []
+        lines = ["line\n"] * LINE_COUNT
+        for index in range(LINE_COUNT):
+            lines[index] = "line %d\n" % index
+            self._commitIds.append(commit_file(self._gitpath, "a.txt", "".join(lines)))
+        with open(self._filepath, "rb") as f:
+            self._contents = f.read()
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def __blame(self, visibleLines):
+        """ Returns the delivered batches as lists of the 1-based lines they cover. """
+
+        batches = []
+        loader = BlameLoader(self._gitpath, self._filepath, self._contents,
+            lambda chunks, commits, isComplete: batches.append(
+                [(line, chunk.commitId) for chunk in chunks
+                 for line in range(chunk.finalLine, chunk.finalLine + chunk.lineCount)]),
+            flushInterval=60, visibleLines=visibleLines)
+        loader.start()
+        loader._thread.join()
+        return batches
+
+    def test_blames_the_visible_lines_before_the_rest(self):
+        batches = self.__blame((20, 29))
+
+        self.assertEqual(list(range(20, 30)), sorted(line for line, commitId in batches[0]))
+        blamed = dict(line for batch in batches for line in batch)
+        self.assertEqual(LINE_COUNT, len([line for batch in batches for line in batch]))
+        self.assertEqual(dict((index + 1, commitId) for index, commitId in enumerate(self._commitIds)), blamed)
+
+    def test_blames_the_whole_file_at_once_without_visible_lines(self):
+        for visibleLines in (None, (1, LINE_COUNT + 10), (LINE_COUNT + 5, LINE_COUNT + 10)):
+            batches = self.__blame(visibleLines)
+            self.assertEqual(LINE_COUNT, len(batches[0]), visibleLines)
+            self.assertEqual(dict((index + 1, commitId) for index, commitId in enumerate(self._commitIds)),
+                             dict(batches[0]))
+
+if __name__ == '__main__':
+    unittest.main()
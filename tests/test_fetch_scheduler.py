@@ -0,0 +1,192 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from threading import Thread, Event
+import tempfile
+import unittest
+import time
+import os
+from job_scheduler import JobScheduler
+from fetch_scheduler import FetchScheduler, IDLE_SECONDS, MAX_CONCURRENT_FETCHES
+from repository_service import RepositoryService, FETCH_CHANGED, FETCH_UNCHANGED, FETCH_FAILED, FETCH_ABORTED
+from tests.gitfixtures import git, init_repository, commit_file
+from tests.test_job_scheduler import ManualDispatcher
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FailingService:
+    """ Stands in for a RepositoryService whose fetch raises something unexpected. """
+
+    def __init__(self, gitpath):
+        self.gitpath = gitpath
+        self.fetches = 0
+
+    def is_writing(self):
+        return False
+
+    def fetch(self):
+        self.fetches += 1
+        raise RuntimeError("unexpected")
+
+    def invalidate(self):
+        pass
+
+class BlockingService(FailingService):
+    """ Stands in for a RepositoryService whose fetch runs until it gets released. """
+
+    def __init__(self, gitpath, release):
+        FailingService.__init__(self, gitpath)
+        self._release = release
+
+    def fetch(self):
+        self.fetches += 1
+        self._release.wait(5)
+        return FETCH_UNCHANGED
+
+class NoMonitor:
+    def cancel(self):
+        pass
+
+class RepositoryServiceFetchTest(unittest.TestCase):
+    """ Fetches from a local bare repository into a clone of it. """
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        root = self._directory.name
+        self._remote = init_repository(os.path.join(root, "remote.git"), bare=True)
+        self._other = os.path.join(root, "other")
+        self._local = os.path.join(root, "local")
+        git(root, "clone", "-q", self._remote, self._other)
+        commit_file(self._other, "a.txt", "1\n")
+        git(self._other, "push", "-q", "origin", "HEAD:master")
+        git(root, "clone", "-q", self._remote, self._local)
+        self._service = RepositoryService(self._local, lambda gitpath, callback: NoMonitor())
+
+    def tearDown(self):
+        self._service.close()
+        self._directory.cleanup()
+
+    def test_reports_whether_remote_branches_moved(self):
+        self.assertEqual(self._service.fetch(), FETCH_UNCHANGED)
+
+        commit_file(self._other, "a.txt", "2\n")
+        git(self._other, "push", "-q", "origin", "HEAD:master", "HEAD:feature")
+        self.assertEqual(self._service.fetch(), FETCH_CHANGED)
+        self.assertIn("origin/feature", [ref.name for ref in self._service.get_refs()])
+
+        self.assertEqual(self._service.fetch(), FETCH_UNCHANGED)
+
+    def test_fails_on_unreachable_remote(self):
+        git(self._local, "remote", "set-url", "origin", os.path.join(self._directory.name, "missing.git"))
+        self.assertEqual(self._service.fetch(), FETCH_FAILED)
+
+    def test_does_not_start_while_writing(self):
+        self._service.begin_write()
+        self.assertTrue(self._service.is_writing())
+        self.assertEqual(self._service.fetch(), FETCH_ABORTED)
+        self._service.end_write()
+        self.assertFalse(self._service.is_writing())
+
+    def test_writing_aborts_running_fetch(self):
+        # the remote answers only after a while, so the fetch is still running when the user starts writing.
+        slowUploadPack = os.path.join(self._directory.name, "slow-upload-pack")
+        with open(slowUploadPack, "w") as f:
+            f.write("#!/bin/sh\nsleep 5\nexec git-upload-pack \"$@\"\n")
+        os.chmod(slowUploadPack, 0o755)
+        git(self._local, "config", "remote.origin.uploadpack", slowUploadPack)
+
+        results = []
+        fetcher = Thread(target=lambda: results.append(self._service.fetch()))
+        fetcher.start()
+        deadline = time.monotonic() + 5
+        while self._service._fetchProcess == None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        startedAt = time.monotonic()
+        self._service.run_write(lambda: None)
+        fetcher.join(5)
+
+        self.assertEqual(results, [FETCH_ABORTED])
+        self.assertLess(time.monotonic() - startedAt, 3)
+
+class FetchSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._clock = Clock()
+        self._dispatcher = ManualDispatcher()
+        self._jobScheduler = JobScheduler(1, self._dispatcher)
+
+    def tearDown(self):
+        self._jobScheduler.shutdown()
+
+    def test_fetch_raising_is_retried_later(self):
+        service = FailingService("/work")
+        scheduler = FetchScheduler(60, self._jobScheduler, lambda: [service], self._clock)
+        self._clock.now = IDLE_SECONDS
+
+        self.assertEqual(scheduler.tick(), 1)
+        self._dispatcher.wait_and_run()
+
+        state = scheduler.get_state("/work")
+        self.assertFalse(state.running)
+        self.assertEqual(state.lastResult, FETCH_FAILED)
+        self.assertEqual(state.dueAt, IDLE_SECONDS + 120)
+
+        self._clock.now = state.dueAt
+        self.assertEqual(scheduler.tick(), 1)
+        self._dispatcher.wait_and_run()
+        self.assertEqual(service.fetches, 2)
+
+    def test_waits_for_idle_editor(self):
+        service = FailingService("/work")
+        scheduler = FetchScheduler(60, self._jobScheduler, lambda: [service], self._clock)
+        self._clock.now = IDLE_SECONDS
+        scheduler.note_activity()
+
+        self.assertEqual(scheduler.tick(), 0)
+        self._clock.now += IDLE_SECONDS
+        self.assertEqual(scheduler.tick(), 1)
+        self._dispatcher.wait_and_run()
+
+    def test_limits_concurrent_fetches(self):
+        release = Event()
+        services = [BlockingService("/work%d" % number, release) for number in range(MAX_CONCURRENT_FETCHES + 2)]
+        jobScheduler = JobScheduler(len(services), self._dispatcher) # workers are not the limit here
+        scheduler = FetchScheduler(60, jobScheduler, lambda: services, self._clock)
+        self._clock.now = IDLE_SECONDS
+        try:
+            self.assertEqual(scheduler.tick(), MAX_CONCURRENT_FETCHES)
+            self.assertEqual(scheduler.tick(), 0)
+
+            release.set()
+            self._dispatcher.wait_and_run(MAX_CONCURRENT_FETCHES)
+            self.assertEqual(scheduler.tick(), MAX_CONCURRENT_FETCHES)
+            self._dispatcher.wait_and_run(MAX_CONCURRENT_FETCHES)
+            self.assertEqual(sum(service.fetches for service in services), 2 * MAX_CONCURRENT_FETCHES)
+        finally:
+            release.set()
+            jobScheduler.shutdown()
+
+    def test_skips_repository_while_writing(self):
+        service = FailingService("/work")
+        service.is_writing = lambda: True
+        scheduler = FetchScheduler(60, self._jobScheduler, lambda: [service], self._clock)
+        self._clock.now = IDLE_SECONDS
+
+        self.assertEqual(scheduler.tick(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
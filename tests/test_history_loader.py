@@ -0,0 +1,133 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from threading import Event
+import tempfile
+import unittest
+import os
+from history_loader import HistoryLoader
+from history_cache import HistoryCache
+from history_store import HistoryStore, ROW_RENAMED, ROW_UNCHANGED
+from tests.gitfixtures import git, init_repository, commit_file, import_linear_history
+
+def load_history(gitpath, filepath, logArguments=(), historyCache=None):
+    """ Loads the whole history of a file through a HistoryLoader and returns the delivered entries. """
+
+    entries = []
+    finished = Event()
+    loader = None
+    def deliver(batch, isComplete):
+        entries.extend(batch)
+        if isComplete:
+            finished.set()
+        else:
+            loader.request_more()
+    loader = HistoryLoader(gitpath, filepath, deliver, logArguments=logArguments, historyCache=historyCache)
+    loader.start()
+    assert finished.wait(60)
+    loader._thread.join(10) # the cache gets written after the last batch
+    return entries
+
+class FirstPage:
+    """ Records the first batch a HistoryLoader delivers (and whether git was still running then). """
+
+    def __init__(self):
+        self.batches = []
+        self.gitWasRunning = None
+        self.delivered = Event()
+        self.loader = None
+
+    def deliver(self, batch, isComplete):
+        if len(self.batches) <= 0:
+            process = self.loader._process
+            self.gitWasRunning = process != None and process.poll() == None
+        self.batches.append((batch, isComplete))
+        self.delivered.set()
+
+class HistoryLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._gitpath = init_repository(os.path.join(self._directory.name, "work"))
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_rows_older_than_a_rename_use_the_old_path(self):
+        gitpath = self._gitpath
+        commit_file(gitpath, "old.txt", "a\nb\n", "first")
+        commit_file(gitpath, "old.txt", "a \n  b\n", "whitespace")
+        git(gitpath, "mv", "old.txt", "new.txt")
+        git(gitpath, "commit", "-q", "-m", "rename")
+        commit_file(gitpath, "new.txt", "a \n  b\nc\n", "edit")
+
+        # ignoring whitespace, the whitespace-only commit lists no change (and no path) for the file.
+        store = HistoryStore()
+        store.append(load_history(gitpath, os.path.join(gitpath, "new.txt"), ['-w']))
+
+        messages = [store.get_message(row) for row in range(len(store))]
+        self.assertEqual(messages, ["edit", "rename", "whitespace", "first"])
+        self.assertEqual(store.get_flags(1), ROW_RENAMED)
+        self.assertEqual(store.get_flags(2), ROW_UNCHANGED)
+        self.assertEqual([store.get_path(row) for row in range(4)], ["new.txt", "new.txt", "old.txt", "old.txt"])
+
+class HistoryLoaderPagingTest(unittest.TestCase):
+
+    COMMITS = 5000
+
+    @classmethod
+    def setUpClass(cls):
+        cls._directory = tempfile.TemporaryDirectory()
+        cls._gitpath = init_repository(os.path.join(cls._directory.name, "work"))
+        import_linear_history(cls._gitpath, "a.txt", cls.COMMITS)
+        cls._filepath = os.path.join(cls._gitpath, "a.txt")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._directory.cleanup()
+
+    def __load_first_page(self, historyCache=None):
+        firstPage = FirstPage()
+        loader = HistoryLoader(self._gitpath, self._filepath, firstPage.deliver, pageSize=50, historyCache=historyCache)
+        firstPage.loader = loader
+        loader.start()
+        self.assertTrue(firstPage.delivered.wait(30))
+        loader.cancel()
+        return firstPage
+
+    def test_first_page_is_delivered_while_git_still_runs(self):
+        firstPage = self.__load_first_page()
+
+        batch, isComplete = firstPage.batches[0]
+        self.assertEqual([entry.message for entry in batch], ["commit %d" % (self.COMMITS - 1 - index) for index in range(50)])
+        self.assertFalse(isComplete)
+        self.assertTrue(firstPage.gitWasRunning)
+
+    def test_cached_history_is_delivered_page_by_page(self):
+        with tempfile.TemporaryDirectory() as cacheDirectory:
+            historyCache = HistoryCache(os.path.join(cacheDirectory, "history.sqlite"))
+            entries = load_history(self._gitpath, self._filepath, historyCache=historyCache)
+            self.assertEqual(len(entries), self.COMMITS)
+
+            tip, batches = historyCache.load_history(self._gitpath, "a.txt", batchSize=1000)
+            self.assertEqual(len(next(batches)), 1000)
+
+            firstPage = self.__load_first_page(historyCache)
+            batch, isComplete = firstPage.batches[0]
+            self.assertEqual(len(batch), 50)
+            self.assertFalse(isComplete)
+            self.assertFalse(firstPage.gitWasRunning) # nothing new since the cached tip
+
+            self.assertEqual(load_history(self._gitpath, self._filepath, historyCache=historyCache), entries)
+
+if __name__ == '__main__':
+    unittest.main()
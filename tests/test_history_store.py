@@ -0,0 +1,84 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+import unittest
+from history_loader import HistoryEntry
+from history_store import HistoryStore, HistoryIndex, ROW_MERGE, ROW_RENAMED, ROW_UNCHANGED
+
+def make_entry(number, path, parents=1, oldPath=None, added=1):
+    return HistoryEntry("%040x" % number, ["%040x" % (number + 100)] * parents, "Author " + "abc"[number % 3],
+        "2013-01-%02d" % number, "commit %d" % number, added if path != None else None, 0 if path != None else None,
+        path, oldPath)
+
+class HistoryStoreTest(unittest.TestCase):
+
+    def test_stores_rows_column_wise(self):
+        store = HistoryStore()
+        self.assertEqual(store.append([make_entry(1, "a.txt"), make_entry(2, None, parents=2)]), 0)
+        self.assertEqual(store.append([make_entry(3, "a.txt", added=None)]), 2)
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.get_commit_id(0), "%040x" % 1)
+        self.assertEqual(store.get_author(2), "Author a")
+        self.assertEqual(store.get_date(1), "2013-01-02")
+        self.assertEqual(store.get_message(2), "commit 3")
+        self.assertEqual(store.get_added(0), 1)
+        self.assertEqual(store.get_added(1), None)
+        self.assertEqual(store.get_flags(1), ROW_MERGE | ROW_UNCHANGED)
+
+    def test_keeps_paths_only_where_they_change(self):
+        store = HistoryStore()
+        store.append([make_entry(number, "new.txt") for number in range(1, 50)])
+        store.append([make_entry(50, "new.txt", oldPath="old.txt"), make_entry(51, None, parents=2)])
+        store.append([make_entry(number, "old.txt") for number in range(52, 100)])
+
+        self.assertEqual(len(store._pathNames), 2)
+        self.assertEqual(store.get_path(0), "new.txt")
+        self.assertEqual(store.get_path(49), "new.txt")
+        self.assertEqual(store.get_old_path(49), "old.txt")
+        self.assertEqual(store.get_flags(49), ROW_RENAMED)
+        self.assertEqual(store.get_path(51), "old.txt")
+        self.assertEqual(store.get_path(98), "old.txt")
+
+    def test_rows_below_a_rename_without_numstat_get_the_old_path(self):
+        store = HistoryStore()
+        store.append([
+            make_entry(1, "new.txt"),
+            make_entry(2, "new.txt", oldPath="old.txt"),
+            make_entry(3, None, parents=2),               # a merge listing no change, older than the rename
+            make_entry(4, "old.txt"),
+        ])
+
+        self.assertEqual(store.get_path(0), "new.txt")
+        self.assertEqual(store.get_path(1), "new.txt")
+        self.assertEqual(store.get_path(2), "old.txt")
+        self.assertEqual(store.get_path(3), "old.txt")
+
+    def test_path_is_unknown_before_any_row_listed_one(self):
+        store = HistoryStore()
+        store.append([make_entry(1, None, parents=2), make_entry(2, "a.txt")])
+
+        self.assertEqual(store.get_path(0), None)
+        self.assertEqual(store.get_path(1), "a.txt")
+
+    def test_index_finds_rows_containing_all_words(self):
+        store = HistoryStore()
+        store.append([make_entry(number, "a.txt") for number in range(1, 30)])
+        index = HistoryIndex(store)
+
+        self.assertEqual(index.search(""), None)
+        self.assertEqual(index.search("author b"), list(range(0, 29, 3)))
+        self.assertEqual(index.search("author bc"), [])
+        self.assertEqual(index.search("COMMIT 21"), [20])
+
+if __name__ == '__main__':
+    unittest.main()
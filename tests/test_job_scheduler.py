@@ -0,0 +1,84 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from threading import Event
+import unittest
+from job_scheduler import JobScheduler, PRIORITY_HIGH, PRIORITY_BACKGROUND
+
+class ManualDispatcher:
+    """ Collects the callbacks a JobScheduler dispatches, so a test runs them like the main-loop would. """
+
+    def __init__(self):
+        self.calls = []
+        self.dispatched = Event()
+
+    def __call__(self, function, *arguments):
+        self.calls.append((function, arguments))
+        self.dispatched.set()
+
+    def wait_and_run(self, count=1):
+        while len(self.calls) < count:
+            assert self.dispatched.wait(5)
+            self.dispatched.clear()
+        calls = self.calls
+        self.calls = []
+        for function, arguments in calls:
+            function(*arguments)
+
+class JobSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dispatcher = ManualDispatcher()
+        self._scheduler = JobScheduler(1, self._dispatcher)
+
+    def tearDown(self):
+        self._scheduler.shutdown()
+
+    def test_hands_the_result_to_on_done(self):
+        results = []
+        self._scheduler.submit("key", lambda a, b: a + b, (1, 2), onDone=results.append, onError=self.fail)
+        self._dispatcher.wait_and_run()
+
+        self.assertEqual(results, [3])
+        self.assertEqual(self._scheduler.get_statistics()['completed'], 1)
+
+    def test_hands_the_exception_to_on_error(self):
+        def failing():
+            raise RuntimeError("broken")
+        errors = []
+        self._scheduler.submit("key", failing, onDone=self.fail, onError=errors.append)
+        self._dispatcher.wait_and_run()
+
+        self.assertEqual([str(error) for error in errors], ["broken"])
+        self.assertEqual(self._scheduler.get_statistics()['failed'], 1)
+
+    def test_coalesces_pending_jobs_and_runs_higher_priority_first(self):
+        started = Event()
+        release = Event()
+        order = []
+        def blocking():
+            started.set()
+            release.wait(5)
+        self._scheduler.submit("blocker", blocking)
+        self.assertTrue(started.wait(5))
+
+        self._scheduler.submit("a", order.append, ("a1", ), priority=PRIORITY_BACKGROUND)
+        self._scheduler.submit("b", order.append, ("b", ), priority=PRIORITY_HIGH, onDone=lambda result: None)
+        self._scheduler.submit("a", order.append, ("a2", ), priority=PRIORITY_BACKGROUND, onDone=lambda result: None)
+        release.set()
+        self._dispatcher.wait_and_run(2)
+
+        self.assertEqual(order, ["b", "a2"])
+        self.assertEqual(self._scheduler.get_statistics()['coalesced'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+import subprocess
+import tempfile
+import unittest
+import os
+from object_reader import ObjectReader, ObjectReaderError, OBJ_OFS_DELTA, OBJ_REF_DELTA
+from tests.gitfixtures import GIT_ENVIRONMENT, git, init_repository, commit_file
+
+class ObjectReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._gitpath = init_repository(os.path.join(self._directory.name, "repository"))
+        self._gitdir = os.path.join(self._gitpath, ".git")
+        self._reader = ObjectReader(self._gitdir)
+
+    def tearDown(self):
+        self._reader.close()
+        self._directory.cleanup()
+
+    def __pack_names(self):
+        return sorted(name for name in os.listdir(os.path.join(self._gitdir, "objects", "pack")) if name.endswith(".pack"))
+
+    def test_reads_objects_of_packs_written_after_the_first_read(self):
+        commit_file(self._gitpath, "a.txt", "first\n")
+        git(self._gitpath, "repack", "-q", "-d")
+        self.assertEqual(b"first\n", self._reader.get_contents("HEAD", "a.txt"))
+
+        commit_file(self._gitpath, "a.txt", "second\n")
+        git(self._gitpath, "repack", "-q", "-d")
+        self.assertEqual(b"second\n", self._reader.get_contents("HEAD", "a.txt"))
+
+    def test_unmaps_packs_removed_by_a_repack(self):
+        firstCommitId = commit_file(self._gitpath, "a.txt", "first\n")
+        git(self._gitpath, "repack", "-q", "-d")
+        commit_file(self._gitpath, "a.txt", "second\n")
+        git(self._gitpath, "repack", "-q", "-d")
+        self.assertEqual(b"second\n", self._reader.get_contents("HEAD", "a.txt"))
+        self.assertEqual(2, len(self._reader._packs))
+
+        # everything goes into one new pack, the old ones are deleted.
+        git(self._gitpath, "repack", "-q", "-a", "-d")
+        commit_file(self._gitpath, "a.txt", "third\n")
+        git(self._gitpath, "repack", "-q", "-d")
+        self.assertEqual(b"third\n", self._reader.get_contents("HEAD", "a.txt"))
+        self.assertEqual(self.__pack_names(), sorted(self._reader._packs))
+        self.assertEqual(b"first\n", self._reader.get_contents(firstCommitId, "a.txt"))
+
+    def __commit_versions(self, count):
+        """ Commits versions of a file that differ in a few lines, so the packed blobs become delta-chains. """
+
+        lines = ["line %d of a file long enough to be worth a delta\n" % number for number in range(200)]
+        for version in range(count):
+            lines[version * 7 % len(lines)] = "changed in version %d\n" % version
+            commit_file(self._gitpath, "a.txt", "".join(lines))
+
+    def __packed_objects(self, gitdir):
+        """ Returns (sha, type, delta-depth) of every object in the packs, as listed by 'git verify-pack'. """
+
+        objects = []
+        packDir = os.path.join(gitdir, "objects", "pack")
+        for name in os.listdir(packDir):
+            if name.endswith(".idx"):
+                for line in git(self._gitpath, "verify-pack", "-v", os.path.join(packDir, name)).split("\n"):
+                    parts = line.split()
+                    if len(parts) >= 5 and len(parts[0]) == 40:
+                        objects.append((parts[0], parts[1], int(parts[5]) if len(parts) >= 7 else 0))
+        return objects
+
+    def __assert_reads_delta_chains(self, deltaType, repackArguments):
+        self.__commit_versions(20)
+        git(self._gitpath, *repackArguments)
+
+        objects = self.__packed_objects(self._gitdir)
+        self.assertTrue(max(depth for sha, objectType, depth in objects) > 1)
+
+        reader = ObjectReader(self._gitdir)
+        pack = list(reader._ObjectReader__get_packs())[0]
+        entryTypes = set()
+        for sha, objectType, depth in objects:
+            expected = subprocess.run(["git", "cat-file", objectType, sha], cwd=self._gitpath, env=GIT_ENVIRONMENT,
+                stdout=subprocess.PIPE, check=True).stdout
+            self.assertEqual((objectType, expected), reader.read_object(sha))
+            self.assertEqual(len(expected), reader.get_object_size(sha))
+            offset = pack.index.find(bytes.fromhex(sha))
+            entryTypes.add(pack.read_entry_header(offset)[0])
+        reader.close()
+        self.assertIn(deltaType, entryTypes)
+
+    def test_reads_ofs_delta_chains(self):
+        self.__assert_reads_delta_chains(OBJ_OFS_DELTA, ["repack", "-q", "-a", "-d", "-f", "--depth=50"])
+
+    def test_reads_ref_delta_chains(self):
+        self.__assert_reads_delta_chains(OBJ_REF_DELTA,
+            ["-c", "repack.useDeltaBaseOffset=false", "repack", "-q", "-a", "-d", "-f", "--depth=50"])
+
+    def test_delta_base_cache_is_bounded_by_bytes(self):
+        self.__commit_versions(20)
+        git(self._gitpath, "repack", "-q", "-a", "-d", "-f", "--depth=50")
+        blobSize = len(git(self._gitpath, "cat-file", "blob", "HEAD:a.txt"))
+
+        # room for a few of the blobs; a reader whose limit is less than four blobs keeps none of them at all.
+        reader = ObjectReader(self._gitdir, deltaBaseCacheLimit=blobSize * 5)
+        tinyReader = ObjectReader(self._gitdir, deltaBaseCacheLimit=blobSize * 3)
+        for sha, objectType, depth in self.__packed_objects(self._gitdir):
+            for objectReader in (reader, tinyReader):
+                objectReader.read_object(sha)
+                self.assertTrue(objectReader.get_delta_base_cache_size() <= objectReader._deltaBaseCacheLimit)
+        self.assertTrue(reader.get_delta_base_cache_size() >= blobSize * 2)
+        self.assertTrue(all(len(contents) < blobSize for objectType, contents in tinyReader._deltaBaseCache.values()))
+        reader.close()
+        tinyReader.close()
+
+    def test_resolves_refs_below_refs_and_head(self):
+        commitId = commit_file(self._gitpath, "a.txt", "first\n")
+        git(self._gitpath, "branch", "feature/nested")
+        git(self._gitpath, "pack-refs", "--all")
+        self.assertEqual(commitId, self._reader.resolve_ref("HEAD"))
+        self.assertEqual(commitId, self._reader.resolve_ref("master"))
+        self.assertEqual(commitId, self._reader.resolve_ref("feature/nested"))
+
+    def test_rejects_ref_names_outside_of_refs(self):
+        commitId = commit_file(self._gitpath, "a.txt", "first\n")
+        with open(os.path.join(self._gitdir, "ORIG_HEAD"), "w") as f:
+            f.write(commitId + "\n")
+        with open(os.path.join(self._directory.name, "outside"), "w") as f:
+            f.write(commitId + "\n")
+
+        for refname in ["ORIG_HEAD", "../../outside", "refs/../ORIG_HEAD", os.path.join(self._directory.name, "outside")]:
+            with self.assertRaises(ObjectReaderError):
+                self._reader.resolve_ref(refname)
+
+        # a symbolic ref pointing outside of 'refs/' is not followed either.
+        with open(os.path.join(self._gitdir, "HEAD"), "w") as f:
+            f.write("ref: ../outside\n")
+        with self.assertRaises(ObjectReaderError):
+            self._reader.resolve_ref("HEAD")
+
+if __name__ == '__main__':
+    unittest.main()
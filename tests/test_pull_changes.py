@@ -0,0 +1,101 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+import subprocess
+import tempfile
+import unittest
+import os
+from pull_changes import read_head, get_changed_paths
+from tests.gitfixtures import git, init_repository, commit_file
+
+class PullChangesTest(unittest.TestCase):
+    """ Pulls from a local bare repository into a clone of it and checks which files count as changed. """
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        root = self._directory.name
+        self._remote = init_repository(os.path.join(root, "remote.git"), bare=True)
+        self._other = os.path.join(root, "other")
+        self._local = os.path.join(root, "local")
+        git(root, "clone", "-q", self._remote, self._other)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def __push(self, *files):
+        for filerelpath, contents in files:
+            commit_file(self._other, filerelpath, contents)
+        git(self._other, "push", "-q", "origin", "HEAD:master")
+
+    def __clone(self):
+        git(self._directory.name, "clone", "-q", self._remote, self._local)
+
+    def __path(self, filerelpath):
+        return os.path.join(self._local, filerelpath)
+
+    def test_fast_forward_lists_the_changed_files(self):
+        self.__push(("a.txt", "a\n"), ("b.txt", "b\n"))
+        self.__clone()
+        oldHead = read_head(self._local)
+
+        self.__push(("a.txt", "changed\n"), ("dir/c.txt", "c\n"))
+        git(self._local, "pull", "-q", "--ff-only")
+
+        self.assertNotEqual(read_head(self._local), oldHead)
+        self.assertEqual(get_changed_paths(self._local, oldHead), {self.__path("a.txt"), self.__path("dir/c.txt")})
+
+    def test_unchanged_head_lists_nothing(self):
+        self.__push(("a.txt", "a\n"))
+        self.__clone()
+        oldHead = read_head(self._local)
+
+        git(self._local, "pull", "-q", "--ff-only")
+
+        self.assertEqual(read_head(self._local), oldHead)
+        self.assertEqual(get_changed_paths(self._local, oldHead), set())
+
+    def test_rename_lists_old_and_new_path(self):
+        self.__push(("old.txt", "a\nb\nc\n"))
+        self.__clone()
+        oldHead = read_head(self._local)
+
+        git(self._other, "mv", "old.txt", "new.txt")
+        git(self._other, "commit", "-q", "-m", "rename")
+        git(self._other, "push", "-q", "origin", "HEAD:master")
+        git(self._local, "pull", "-q", "--ff-only")
+
+        self.assertEqual(get_changed_paths(self._local, oldHead), {self.__path("old.txt"), self.__path("new.txt")})
+
+    def test_unborn_head_lists_every_file(self):
+        init_repository(self._local)
+        self.assertEqual(read_head(self._local), "")
+
+        self.__push(("a.txt", "a\n"), ("dir/b.txt", "b\n"))
+        git(self._local, "pull", "-q", self._remote, "master")
+
+        self.assertEqual(get_changed_paths(self._local, ""), {self.__path("a.txt"), self.__path("dir/b.txt")})
+
+    def test_failed_merge_lists_conflicted_files(self):
+        self.__push(("a.txt", "a\n"))
+        self.__clone()
+        commit_file(self._local, "a.txt", "local\n")
+        oldHead = read_head(self._local)
+
+        self.__push(("a.txt", "remote\n"))
+        with self.assertRaises(subprocess.CalledProcessError):
+            git(self._local, "pull", "-q", "--no-rebase")
+
+        self.assertEqual(read_head(self._local), oldHead)
+        self.assertEqual(get_changed_paths(self._local, oldHead), {self.__path("a.txt")})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+import tempfile
+import unittest
+import os
+from repository_index import RepositoryIndex
+from tests.gitfixtures import init_repository, write_file
+
+class RepositoryIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._root = os.path.realpath(self._directory.name)
+        self._home = os.path.join(self._root, "home")
+        self._scanned = []
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def __create_index(self):
+        index = RepositoryIndex({"HOME": self._home})
+        index.add_scan_listener(self._scanned.append)
+        return index
+
+    def test_finds_the_nearest_work_tree(self):
+        outer = init_repository(os.path.join(self._root, "outer"))
+        inner = init_repository(os.path.join(outer, "sub", "inner"))
+        index = self.__create_index()
+
+        self.assertEqual(index.get_work_tree(write_file(inner, "dir/a.txt", "")), inner)
+        self.assertEqual(index.get_work_tree(write_file(outer, "sub/b.txt", "")), outer)
+        self.assertEqual(index.get_git_dir(inner), os.path.join(inner, ".git"))
+
+    def test_lookups_on_known_directories_do_not_scan_again(self):
+        gitpath = init_repository(os.path.join(self._root, "work"))
+        index = self.__create_index()
+        filepath = write_file(gitpath, "dir/a.txt", "")
+
+        index.get_work_tree(filepath)
+        scannedBefore = list(self._scanned)
+        self.assertEqual(index.get_work_tree(filepath), gitpath)
+        self.assertEqual(self._scanned, scannedBefore)
+
+        index.invalidate(gitpath)
+        self.assertEqual(index.get_work_tree(filepath), gitpath)
+        self.assertEqual(self._scanned[len(scannedBefore):], [gitpath])
+
+    def test_does_not_climb_above_the_home_directory(self):
+        init_repository(self._root) # a work-tree enclosing the home-directory
+        index = self.__create_index()
+
+        self.assertEqual(index.get_work_tree(write_file(self._home, "project/a.txt", "")), None)
+        self.assertEqual(self._scanned[0], self._home)
+        self.assertNotIn(self._root, self._scanned)
+        self.assertNotIn("/", self._scanned)
+
+        dotfiles = init_repository(self._home)
+        index.invalidate(self._home)
+        self.assertEqual(index.get_work_tree(os.path.join(self._home, "project/a.txt")), dotfiles)
+
+        # outside of the home-directory the search still climbs (up to the filesystem-boundary).
+        self.assertEqual(index.get_work_tree(write_file(self._root, "other/b.txt", "")), self._root)
+
+if __name__ == '__main__':
+    unittest.main()
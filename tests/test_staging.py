@@ -0,0 +1,126 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+import tempfile
+import unittest
+import os
+from staging import stage_paths, unstage_paths, stage_hunks, unstage_hunks
+from tests.gitfixtures import git, init_repository, write_file, commit_file
+
+BASE = "".join("line %d\n" % number for number in range(30))
+
+def change_lines(contents, numbers):
+    """ Changes some lines (0-based); lines 2, 14 and 26 are far enough apart to become hunks of their own. """
+
+    return "".join(line.replace("line", "changed") if index in numbers else line
+                   for index, line in enumerate(contents.splitlines(True)))
+
+class StagingTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._gitpath = init_repository(os.path.join(self._directory.name, "repository"))
+        self._filepath = os.path.join(self._gitpath, "a.txt")
+        commit_file(self._gitpath, "a.txt", BASE)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def __index(self, filerelpath):
+        return git(self._gitpath, "show", ":" + filerelpath)
+
+    def __staged_paths(self):
+        return git(self._gitpath, "diff", "--cached", "--name-only", "-z").split("\0")[:-1]
+
+    def test_stages_one_hunk_out_of_several(self):
+        write_file(self._gitpath, "a.txt", change_lines(BASE, [2, 14, 26]))
+
+        self.assertTrue(stage_hunks(self._gitpath, self._filepath, 14, 14))
+
+        self.assertEqual(change_lines(BASE, [14]), self.__index("a.txt"))
+
+    def test_unstages_a_staged_hunk_again(self):
+        write_file(self._gitpath, "a.txt", change_lines(BASE, [2, 14, 26]))
+        git(self._gitpath, "add", "a.txt")
+
+        self.assertTrue(unstage_hunks(self._gitpath, self._filepath, 14, 14))
+
+        self.assertEqual(change_lines(BASE, [2, 26]), self.__index("a.txt"))
+
+    def test_stages_a_selection_spanning_two_hunks(self):
+        write_file(self._gitpath, "a.txt", change_lines(BASE, [2, 14, 26]))
+
+        self.assertTrue(stage_hunks(self._gitpath, self._filepath, 10, 27))
+
+        self.assertEqual(change_lines(BASE, [14, 26]), self.__index("a.txt"))
+
+    def test_stages_a_selection_touching_no_hunk(self):
+        write_file(self._gitpath, "a.txt", change_lines(BASE, [2, 26]))
+
+        self.assertFalse(stage_hunks(self._gitpath, self._filepath, 14, 14))
+
+        self.assertEqual([], self.__staged_paths())
+
+    def test_stages_an_untracked_file(self):
+        filepath = write_file(self._gitpath, "new.txt", "first\nsecond\n")
+
+        self.assertTrue(stage_hunks(self._gitpath, filepath, 0, 0))
+
+        self.assertEqual("first\nsecond\n", self.__index("new.txt"))
+
+    def test_stages_files_without_trailing_newline(self):
+        commit_file(self._gitpath, "b.txt", "first\nsecond")
+        filepath = write_file(self._gitpath, "b.txt", "first\nchanged")
+        self.assertTrue(stage_hunks(self._gitpath, filepath, 1, 1))
+        self.assertEqual("first\nchanged", self.__index("b.txt"))
+
+        # the other way round: the newline is added by staging and removed again by unstaging.
+        write_file(self._gitpath, "b.txt", "first\nsecond\n")
+        git(self._gitpath, "commit", "-q", "-m", "change")
+        self.assertTrue(stage_hunks(self._gitpath, filepath, 1, 1))
+        self.assertEqual("first\nsecond\n", self.__index("b.txt"))
+        self.assertTrue(unstage_hunks(self._gitpath, filepath, 1, 1))
+        self.assertEqual("first\nchanged", self.__index("b.txt"))
+
+    def test_paths_are_no_pathspec_patterns(self):
+        # all of them are tracked and modified, so a glob or magic pathspec would match the neighbours too.
+        filerelpaths = ["sub/*.txt", "sub/other.txt", ":(top)magic.txt", "magic.txt"]
+        for filerelpath in filerelpaths:
+            write_file(self._gitpath, filerelpath, "first\n")
+        git(self._gitpath, "add", "-A")
+        git(self._gitpath, "commit", "-q", "-m", "add")
+        for filerelpath in filerelpaths:
+            write_file(self._gitpath, filerelpath, "changed\n")
+        literalPath = os.path.join(self._gitpath, "sub/*.txt")
+        magicPath = os.path.join(self._gitpath, ":(top)magic.txt")
+
+        self.assertTrue(stage_paths(self._gitpath, [literalPath, magicPath]))
+        self.assertEqual(sorted(["sub/*.txt", ":(top)magic.txt"]), sorted(self.__staged_paths()))
+
+        self.assertTrue(stage_paths(self._gitpath, [os.path.join(self._gitpath, "sub/other.txt")]))
+        self.assertTrue(unstage_paths(self._gitpath, [literalPath]))
+        self.assertEqual(sorted([":(top)magic.txt", "sub/other.txt"]), sorted(self.__staged_paths()))
+
+    def test_stages_a_batch_containing_an_ignored_path(self):
+        commit_file(self._gitpath, ".gitignore", "*.log\n")
+        ignoredPath = write_file(self._gitpath, "debug.log", "ignored\n")
+        otherPath = write_file(self._gitpath, "b.txt", "staged\n")
+        write_file(self._gitpath, "a.txt", change_lines(BASE, [2]))
+
+        # git refuses the ignored path and fails, but still stages all the others.
+        self.assertFalse(stage_paths(self._gitpath, [ignoredPath, otherPath, self._filepath]))
+
+        self.assertEqual(["a.txt", "b.txt"], sorted(self.__staged_paths()))
+        self.assertEqual("", git(self._gitpath, "ls-files", "--", "debug.log"))
+
+if __name__ == '__main__':
+    unittest.main()
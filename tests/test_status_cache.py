@@ -0,0 +1,67 @@
+"""
+ * Copyright (C) 2013  Gerrit Addiks.
+ * This package (including this file) was released under the terms of the GPL-3.0.
+ * You should have received a copy of the GNU General Public License along with this program.
+ * If not, see <http://www.gnu.org/licenses/> or send me a mail so i can send you a copy.
+ *
+ * @license GPL-3.0
+ * @author Gerrit Addiks <gerrit@addiks.de>
+ * @web http://addiks.net/gedit-plugin-git-menu/
+ * @version 1.0
+"""
+
+from threading import Thread, Event
+import tempfile
+import unittest
+import os
+from status_cache import StatusCache
+from tests.gitfixtures import init_repository, commit_file, write_file
+
+class StatusCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._gitpath = init_repository(os.path.join(self._directory.name, "work"))
+        commit_file(self._gitpath, "a.txt", "a\n")
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_reads_status_once_until_invalidated(self):
+        cache = StatusCache(self._gitpath)
+        filepath = write_file(self._gitpath, "a.txt", "changed\n")
+        self.assertEqual(cache.get_status(filepath), " M")
+
+        write_file(self._gitpath, "a.txt", "a\n")
+        self.assertEqual(cache.get_status(filepath), " M") # still cached
+
+        cache.invalidate()
+        self.assertEqual(cache.get_status(filepath), "")
+
+    def test_invalidation_during_slow_read_is_not_lost(self):
+        cache = StatusCache(self._gitpath)
+        readStarted = Event()
+        invalidated = Event()
+        reads = []
+
+        def slow_read():
+            reads.append(len(reads))
+            if len(reads) == 1:
+                readStarted.set()
+                invalidated.wait(5)
+                return {"a.txt": " M"} # what the worktree looked like when the read began
+            return {}
+
+        cache._StatusCache__read_states = slow_read
+        reader = Thread(target=cache.get_snapshot)
+        reader.start()
+        self.assertTrue(readStarted.wait(5))
+        cache.invalidate() # must not wait for the running read
+        invalidated.set()
+        reader.join(5)
+
+        self.assertEqual(cache.get_snapshot().get_status("a.txt"), "")
+        self.assertEqual(len(reads), 2)
+
+if __name__ == '__main__':
+    unittest.main()